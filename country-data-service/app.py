@@ -1,25 +1,76 @@
 import os
 import json
+import time
 import logging
-from chalice import Chalice, BadRequestError
-from chalicelib.country_service import CountryService
+from concurrent.futures import ThreadPoolExecutor
+from chalice import Chalice, BadRequestError, Rate, Response
+from chalice.app import Request
+from chalicelib.country_service import CountryService, MAX_BULK_COUNTRIES, MAX_BULK_READ_COUNTRIES
+from chalicelib.callback_delivery import CallbackDelivery, validate_callback_url
 from chalicelib.rate_limiter import RateLimiter
 from chalicelib.rate_limit_config import RATE_LIMITS
-from botocore.exceptions import ClientError
-from chalicelib.utils import validate_country
+from chalicelib.query_engine import SORT_COLUMNS
+from chalicelib.metrics import metrics
+from chalicelib.utils import validate_country, invalid_country_message, parse_fields
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 app_name = 'country-data-service'
 sqs_queue_name = app_name + '-data-fetch-queue'
+callback_queue_name = app_name + '-callback-queue'
 app = Chalice(app_name=app_name)
 
 sqs_queue_url = os.environ.get('SQS_QUEUE_URL')
-country_service = CountryService(sqs_queue_url)
+sqs_batch_size = int(os.environ.get('SQS_BATCH_SIZE', 10))
+sqs_worker_threads = int(os.environ.get('SQS_WORKER_THREADS', 10))
+callback_queue_url = os.environ.get('CALLBACK_QUEUE_URL')
+callback_batch_size = int(os.environ.get('CALLBACK_BATCH_SIZE', 10))
+sync_max_write_capacity = float(os.environ.get('SYNC_MAX_WRITE_CAPACITY', 4))
+
+MAX_SEARCH_QUERY_LENGTH = 64
+DEFAULT_SEARCH_LIMIT = 10
+MAX_SEARCH_LIMIT = 25
+DEFAULT_QUERY_LIMIT = 25
+# Stays under API Gateway's 29 second integration timeout
+MAX_STATUS_WAIT_SECONDS = 20
+MAX_QUERY_LIMIT = 100
+# Query parameter -> engine column; values are comma-separated and matched case-insensitively
+QUERY_FILTER_PARAMS = {
+    'region': 'region',
+    'subregion': 'subregion',
+    'continent': 'continents',
+    'capital': 'capital',
+    'landlocked': 'landlocked',
+    'independent': 'independent',
+    'un_member': 'unMember'
+}
+QUERY_RANGE_PARAMS = ('population', 'area')
+country_service = CountryService(sqs_queue_url, callback_queue_url)
+callback_delivery = CallbackDelivery()
 
 rate_limiter = RateLimiter(app, RATE_LIMITS)
 
+def metrics_endpoint(event):
+    if isinstance(event, Request):
+        return f"{event.method} {event.context.get('resourcePath')}"
+    return type(event).__name__
+
+@app.middleware('all')
+def emit_invocation_metrics(event, get_response):
+    # Stage timings recorded while handling the event are written as one EMF log line
+    metrics.reset(metrics_endpoint(event))
+    started = time.perf_counter()
+    error = False
+    try:
+        return get_response(event)
+    except Exception:
+        error = True
+        raise
+    finally:
+        metrics.record('Invocation', (time.perf_counter() - started) * 1000, error=error)
+        metrics.flush()
+
 @app.route('/')
 def index():
     return {
@@ -27,9 +78,13 @@ def index():
         'version': '1.0.0',
         'description': 'Provides information about countries, including fetching and storing country data.',
         'endpoints': {
-            '/fetch/{country}': 'GET - Fetch country data from external API',
-            '/country/{country}': 'GET - Retrieve stored country data',
-            '/status/{country}': 'GET - Check operation status for a country'
+            '/fetch/{country}': 'GET - Fetch country data from external API. Optional ?callback=https://... is notified when a PENDING fetch finishes',
+            '/fetch': 'POST - Fetch data for multiple countries. Body: {"countries": ["france", "costa-rica"], "callback": "https://..."} (callback optional)',
+            '/country/{country}': 'GET - Retrieve stored country data. Optional ?fields=name,capital returns only those fields',
+            '/countries?names={country},{country}': 'GET - Retrieve stored data for multiple countries. Accepts ?fields= too',
+            '/search?q={query}': 'GET - Search countries by partial or misspelled name',
+            '/query?region={region}&population_min={n}&sort=-population': 'GET - Filter, sort and page countries by attributes',
+            '/status/{country}': 'GET - Check operation status for a country. Optional ?wait=10 waits up to that many seconds for a PENDING operation to finish'
         },
         'usage': 'Replace {country} with a country name. For multi-word country names, use dashes (e.g., "united-states").',
         'examples': [
@@ -46,74 +101,239 @@ def index():
 def fetch_country_data(country):
     logger.info(f"Fetching data for country: {country}")
 
-    result = country_service.fetch_country_data(country)
+    callback_url = parse_callback_url((app.current_request.query_params or {}).get('callback'))
+    result = country_service.fetch_country_data(country, callback_url)
 
     logger.info(f"Fetch result: {result}")
     return result
 
+@app.route('/fetch', methods=['POST'])
+@rate_limiter.limit()
+def bulk_fetch_country_data():
+    body = app.current_request.json_body or {}
+    countries = body.get('countries') if isinstance(body, dict) else None
+
+    if not isinstance(countries, list) or not countries or not all(isinstance(c, str) for c in countries):
+        raise BadRequestError("Request body must contain a non-empty 'countries' list of country names.")
+    if len(countries) > MAX_BULK_COUNTRIES:
+        raise BadRequestError(f"A maximum of {MAX_BULK_COUNTRIES} countries can be fetched per request.")
+    callback_url = parse_callback_url(body.get('callback'))
+
+    logger.info(f"Bulk fetching data for {len(countries)} countries")
+    return {'results': country_service.fetch_countries_data(countries, callback_url)}
+
+def parse_callback_url(callback_url):
+    if callback_url is None:
+        return None
+    if not validate_callback_url(callback_url):
+        raise BadRequestError("Callback must be an absolute https URL of at most 2048 characters.")
+    return callback_url
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    # Weak comparison, as RFC 9110 requires for If-None-Match
+    candidates = [candidate.strip() for candidate in if_none_match.split(',')]
+    return '*' in candidates or any(candidate.replace('W/', '', 1) == etag for candidate in candidates)
+
+def conditional_response(body, etag):
+    # A client that already holds this version gets a 304 without the body being serialized.
+    # Large bodies are gzip-compressed by API Gateway (minimum_compression_size in .chalice/config.json).
+    etag = f'"{etag}"'
+    if etag_matches(app.current_request.headers.get('if-none-match'), etag):
+        return Response(body='', status_code=304, headers={'ETag': etag})
+    return Response(body=body, status_code=200, headers={'ETag': etag})
+
+def parse_fields_param(query_params):
+    # ?fields=name,capital,population limits the returned document to those (dot-separated) fields
+    if 'fields' not in query_params:
+        return None
+    try:
+        return parse_fields(query_params['fields'])
+    except ValueError as e:
+        raise BadRequestError(f"Query parameter 'fields' is invalid: {e}")
+
 @app.route('/country/{country}', methods=['GET'])
 @rate_limiter.limit()
 @validate_country(country_service)
 def get_country_data(country):
-    return country_service.get_country_data(country)
+    fields = parse_fields_param(app.current_request.query_params or {})
+    country_data, etag = country_service.get_country_document(country, fields)
+    return conditional_response(country_data, etag)
+
+@app.route('/countries', methods=['GET'])
+@rate_limiter.limit()
+def get_countries_data():
+    query_params = app.current_request.query_params or {}
+    countries = [name.strip() for name in query_params.get('names', '').split(',') if name.strip()]
+
+    if not countries:
+        raise BadRequestError("Query parameter 'names' must contain a comma-separated list of country names.")
+    if len(countries) > MAX_BULK_READ_COUNTRIES:
+        raise BadRequestError(f"A maximum of {MAX_BULK_READ_COUNTRIES} countries can be retrieved per request.")
+    for country in countries:
+        if not country_service.validate_country_name(country):
+            raise BadRequestError(invalid_country_message(country_service, country, f"Invalid country name '{country}'."))
+
+    fields = parse_fields_param(query_params)
+    result, etag = country_service.get_countries_document(countries, fields)
+    return conditional_response(result, etag)
+
+@app.route('/search', methods=['GET'])
+@rate_limiter.limit()
+def search_countries():
+    query_params = app.current_request.query_params or {}
+    query = query_params.get('q', '').strip()
+    if not 2 <= len(query) <= MAX_SEARCH_QUERY_LENGTH:
+        raise BadRequestError(f"Query parameter 'q' must be between 2 and {MAX_SEARCH_QUERY_LENGTH} characters.")
+
+    try:
+        limit = int(query_params.get('limit', DEFAULT_SEARCH_LIMIT))
+    except ValueError:
+        raise BadRequestError("Query parameter 'limit' must be an integer.")
+    if not 1 <= limit <= MAX_SEARCH_LIMIT:
+        raise BadRequestError(f"Query parameter 'limit' must be between 1 and {MAX_SEARCH_LIMIT}.")
+
+    return country_service.search_countries(query, limit)
+
+def parse_int_param(query_params, name, default=None, minimum=0, maximum=None):
+    value = query_params.get(name)
+    if value is None:
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise BadRequestError(f"Query parameter '{name}' must be an integer.")
+    if maximum is not None and not minimum <= value <= maximum:
+        raise BadRequestError(f"Query parameter '{name}' must be between {minimum} and {maximum}.")
+    if value < minimum:
+        raise BadRequestError(f"Query parameter '{name}' must be at least {minimum}.")
+    return value
+
+@app.route('/query', methods=['GET'])
+@rate_limiter.limit()
+def query_countries():
+    query_params = app.current_request.query_params or {}
+
+    filters = {}
+    for param, column in QUERY_FILTER_PARAMS.items():
+        if param in query_params:
+            values = [value.strip() for value in query_params[param].split(',') if value.strip()]
+            if not values:
+                raise BadRequestError(f"Query parameter '{param}' must not be empty.")
+            filters[column] = values
+
+    ranges = {}
+    for column in QUERY_RANGE_PARAMS:
+        minimum = parse_int_param(query_params, f'{column}_min')
+        maximum = parse_int_param(query_params, f'{column}_max')
+        if minimum is not None or maximum is not None:
+            ranges[column] = (minimum, maximum)
+
+    sort = query_params.get('sort', 'name')
+    descending = sort.startswith('-')
+    sort = sort.lstrip('-')
+    if sort not in SORT_COLUMNS:
+        raise BadRequestError(f"Query parameter 'sort' must be one of: {', '.join(SORT_COLUMNS)} (prefix with '-' for descending).")
+
+    offset = parse_int_param(query_params, 'offset', 0)
+    limit = parse_int_param(query_params, 'limit', DEFAULT_QUERY_LIMIT, minimum=1, maximum=MAX_QUERY_LIMIT)
+
+    return country_service.query_countries(filters, ranges, sort, descending, offset, limit)
 
 @app.route('/status/{country}', methods=['GET'])
 @rate_limiter.limit()
 @validate_country(country_service)
 def check_operation_status(country):
-    return country_service.check_operation_status(country)
+    # ?wait=N long-polls: a PENDING status is held until it changes or N seconds pass
+    query_params = app.current_request.query_params or {}
+    wait_seconds = parse_int_param(query_params, 'wait', 0, maximum=MAX_STATUS_WAIT_SECONDS)
+    return country_service.check_operation_status(country, wait_seconds)
+
+def process_sqs_record(record):
+    # Returns an error description, or None if the record was processed successfully
+    try:
+        if isinstance(record.body, dict):
+            message_body = record.body
+        else:
+            message_body = json.loads(record.body)
+        
+        country = message_body.get('country')
+        
+        if not country:
+            raise ValueError("Missing 'country' key in message")
+
+        logger.info(f"Processing SQS message for country: {country}")
+        
+        if country_service.fetch_and_save_country_data(country):
+            logger.info(f"Successfully processed data for {country}")
+            return None
 
-@app.on_sqs_message(queue=sqs_queue_name)
+        logger.error(f"Failed to process data for {country}")
+        return f"Failed to process data for {country}"
+    except json.JSONDecodeError as e:
+        logger.error(f"Invalid JSON in message: {str(e)}")
+        return f"Invalid JSON: {str(e)}"
+    except ValueError as e:
+        logger.error(str(e))
+        return str(e)
+    except Exception as e:
+        logger.error(f"Unexpected error processing message: {str(e)}")
+        return f"Unexpected error: {str(e)}"
+
+# Relies on ReportBatchItemFailures being enabled on the event source mapping
+# (see terraform/buildspec.yaml), so only failed records are redelivered.
+@app.on_sqs_message(queue=sqs_queue_name, batch_size=sqs_batch_size)
 def handle_sqs_message(event):
-    successful_messages = []
-    failed_messages = []
-
-    for record in event:
-        try:
-            if isinstance(record.body, dict):
-                message_body = record.body
-            else:
-                message_body = json.loads(record.body)
-            
-            country = message_body.get('country')
-            
-            if not country:
-                raise ValueError("Missing 'country' key in message")
-
-            logger.info(f"Processing SQS message for country: {country}")
-            
-            if country_service.fetch_and_save_country_data(country):
-                logger.info(f"Successfully processed data for {country}")
-                successful_messages.append(record)
-            else:
-                logger.error(f"Failed to process data for {country}")
-                failed_messages.append((record, f"Failed to process data for {country}"))
-        except json.JSONDecodeError as e:
-            logger.error(f"Invalid JSON in message: {str(e)}")
-            failed_messages.append((record, f"Invalid JSON: {str(e)}"))
-        except ValueError as e:
-            logger.error(str(e))
-            failed_messages.append((record, str(e)))
-        except Exception as e:
-            logger.error(f"Unexpected error processing message: {str(e)}")
-            failed_messages.append((record, f"Unexpected error: {str(e)}"))
+    country_service.prepare_worker()
+    return process_sqs_batch(event, process_sqs_record)
+
+def process_callback_record(record):
+    # Returns an error description, or None once the notification needs no further delivery
+    try:
+        message = json.loads(record.body)
+        if callback_delivery.deliver(message):
+            return None
+        return f"Callback delivery failed for {message['country']}"
+    except (json.JSONDecodeError, KeyError, TypeError) as e:
+        # Redelivering a malformed message cannot help
+        logger.error(f"Dropping invalid callback message: {str(e)}")
+        return None
+
+# Also relies on ReportBatchItemFailures; a failed delivery is retried after the queue's
+# visibility timeout until the dead-letter queue takes it
+@app.on_sqs_message(queue=callback_queue_name, batch_size=callback_batch_size)
+def deliver_callbacks(event):
+    return process_sqs_batch(event, process_callback_record)
+
+def process_sqs_batch(event, process_record):
+    records = list(event)
+    if not records:
+        return {'batchItemFailures': []}
+
+    with ThreadPoolExecutor(max_workers=min(sqs_worker_threads, len(records))) as executor:
+        errors = list(executor.map(process_record, records))
+
+    failed_messages = [
+        (record, error)
+        for record, error in zip(records, errors)
+        if error is not None
+    ]
 
     if failed_messages:
-        # Manually delete successful messages
-        for record in successful_messages:
-            try:
-                country_service.queue_service.delete_message(record.receipt_handle)
-            except ClientError as e:
-                logger.error(f"Error deleting message: {e}")
-
-        # Prepare error information for failed messages
         error_info = [
-            {"error": error}
-            for _, error in failed_messages
+            {"messageId": record.to_dict()['messageId'], "error": error}
+            for record, error in failed_messages
         ]
+        logger.error(f"Failed to process {len(failed_messages)} messages: {json.dumps(error_info)}")
 
-        # Throw an aggregate error
-        raise BadRequestError(f"Failed to process {len(failed_messages)} messages: {json.dumps(error_info)}")
+    return {
+        'batchItemFailures': [
+            {'itemIdentifier': record.to_dict()['messageId']}
+            for record, _ in failed_messages
+        ]
+    }
 
-    # If all messages were processed successfully, do nothing
-    # The poller will automatically delete the messages from the queue
\ No newline at end of file
+@app.schedule(Rate(1, unit=Rate.DAYS))
+def sync_country_catalog(event):
+    return country_service.sync_all_countries(max_write_capacity_per_second=sync_max_write_capacity)
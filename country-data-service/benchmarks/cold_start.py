@@ -0,0 +1,66 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Runs in a fresh interpreter per sample, so every measurement is a true cold import
+PROBE = r"""
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+
+event = {
+    'resource': '/', 'path': '/', 'httpMethod': 'GET', 'headers': {}, 'multiValueHeaders': {},
+    'queryStringParameters': None, 'multiValueQueryStringParameters': None, 'pathParameters': None,
+    'stageVariables': None, 'body': None, 'isBase64Encoded': False,
+    'requestContext': {'resourcePath': '/', 'httpMethod': 'GET', 'identity': {'sourceIp': '127.0.0.1'}}
+}
+if sys.argv[1] == 'api':
+    response = app.app(event, None)
+    assert response['statusCode'] == 200, response
+else:
+    # A record without a country fails validation before any AWS call, isolating handler setup
+    sqs_event = {'Records': [{'messageId': '1', 'body': '{}', 'receiptHandle': 'r', 'attributes': {},
+                              'eventSourceARN': 'arn:aws:sqs:us-east-1:000000000000:queue'}]}
+    response = app.handle_sqs_message(sqs_event, None)
+    assert response['batchItemFailures'] == [{'itemIdentifier': '1'}], response
+responded = time.perf_counter()
+
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'first_response_ms': (responded - imported) * 1000,
+    'total_ms': (responded - started) * 1000,
+    'heavy_modules': sorted(m for m in ('boto3', 'redis', 'requests') if m in sys.modules)
+}))
+"""
+
+
+def run_probe(app_dir, path):
+    env = dict(os.environ, AWS_DEFAULT_REGION=os.environ.get('AWS_DEFAULT_REGION', 'us-east-1'))
+    output = subprocess.run([sys.executable, '-c', PROBE, path], cwd=app_dir, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def cold_start():
+    parser = argparse.ArgumentParser(description='Measure cold import and first-response time of the Chalice app.')
+    parser.add_argument('--runs', type=int, default=10, help='Fresh interpreters to sample per path')
+    parser.add_argument('--app-dir', default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        help='Directory containing app.py (point at a checkout of another revision to compare)')
+    args = parser.parse_args()
+
+    results = {}
+    for path in ('api', 'sqs'):
+        samples = [run_probe(args.app_dir, path) for _ in range(args.runs)]
+        results[path] = {
+            key: round(statistics.median(sample[key] for sample in samples), 1)
+            for key in ('import_ms', 'first_response_ms', 'total_ms')
+        }
+        results[path]['heavy_modules'] = samples[-1]['heavy_modules']
+    print(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    cold_start()
@@ -0,0 +1,336 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+from benchmarks.stand_ins import (Backend, LocalDynamoDB, LocalSQSClient, LocalRedis, RestCountriesStub,
+                                  generate_catalog, REGIONS)
+from chalicelib.cache import TTLCache
+from chalicelib.circuit_breaker import CircuitBreaker
+from chalicelib.db_service import DynamoDBService, OPERATION_TABLE, LATEST_STATUS_TIMESTAMP
+from chalicelib.country_service import (CountryDataFetcher, COUNTRY_CACHE_MAX_SIZE, COUNTRY_CACHE_TTL_SECONDS,
+                                        COUNTRY_REDIS_CACHE_TTL_SECONDS)
+from chalicelib.alias_index import AliasIndex, extract_aliases
+from chalicelib.queue_service import QueueService
+from chalicelib.redis_cache import RedisCache
+from chalicelib.search_index import CountrySearchIndex
+from chalicelib.status_notifier import StatusNotifier
+from chalicelib.metrics import metrics
+from chalicelib.negative_cache import NegativeCache
+from chalicelib.utils import content_hash
+
+DEFAULT_BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+LOCAL_QUEUE_URL = 'https://sqs.us-east-1.amazonaws.com/000000000000/country-data-service-data-fetch-queue'
+# Requests are spread over this many source IPs, so per-client rate limits do not dominate the results
+CLIENT_IPS = 1000
+
+
+def percentile(sorted_values, p):
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(durations):
+    ordered = sorted(durations)
+    total = sum(ordered)
+    return {
+        'p50_ms': round(percentile(ordered, 50) * 1000, 2),
+        'p95_ms': round(percentile(ordered, 95) * 1000, 2),
+        'p99_ms': round(percentile(ordered, 99) * 1000, 2)
+    }, total
+
+
+def api_event(resource, path_params=None, query=None, headers=None, method='GET', body=None, client=0):
+    path = resource
+    for name, value in (path_params or {}).items():
+        path = path.replace('{' + name + '}', value)
+    return {
+        'resource': resource, 'path': path, 'httpMethod': method,
+        'headers': headers or {}, 'multiValueHeaders': {name: [value] for name, value in (headers or {}).items()},
+        'queryStringParameters': query, 'multiValueQueryStringParameters': {k: [v] for k, v in query.items()} if query else None,
+        'pathParameters': path_params, 'stageVariables': None,
+        'body': json.dumps(body) if body is not None else None, 'isBase64Encoded': False,
+        'requestContext': {'resourcePath': resource, 'httpMethod': method,
+                           'identity': {'sourceIp': f'10.0.{client // 250}.{client % 250}'}}
+    }
+
+
+def sqs_event(messages):
+    return {'Records': [{
+        'messageId': message['MessageId'], 'receiptHandle': message['MessageId'], 'body': message['Body'],
+        'attributes': {}, 'messageAttributes': {}, 'eventSource': 'aws:sqs', 'awsRegion': 'us-east-1',
+        'eventSourceARN': 'arn:aws:sqs:us-east-1:000000000000:country-data-service-data-fetch-queue'
+    } for message in messages]}
+
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        catalog = generate_catalog(args.countries + args.worker_messages, args.seed)
+        keys = list(catalog)
+        self.catalog = catalog
+        self.stored = keys[:args.countries]
+        self.unstored = keys[args.countries:]
+        self.backends = {
+            'dynamodb': Backend('dynamodb', args.dynamodb_ms, args.jitter, args.dynamodb_throttle, args.seed),
+            'sqs': Backend('sqs', args.sqs_ms, args.jitter, args.sqs_throttle, args.seed + 1),
+            'redis': Backend('redis', args.redis_ms, args.jitter, args.redis_errors, args.seed + 2),
+            'upstream': Backend('upstream', args.upstream_ms, args.jitter, args.upstream_throttle, args.seed + 3)
+        }
+        self.dynamodb = LocalDynamoDB(self.backends['dynamodb'])
+        self.dynamodb.seed({country: catalog[country] for country in self.stored})
+        self.db_service = DynamoDBService(self.dynamodb.resource())
+        self.sqs = LocalSQSClient(self.backends['sqs'])
+        self.redis = LocalRedis(self.backends['redis'])
+        self.upstream = RestCountriesStub(catalog, self.backends['upstream'])
+
+    def attach(self, service):
+        # Points the already-imported app at the stand-ins with empty per-container caches,
+        # as a fresh warm container would be
+        breaker = CircuitBreaker('redis')
+        country_service = service.country_service
+        country_service.db_service = self.db_service
+        queue_service = QueueService(LOCAL_QUEUE_URL)
+        queue_service._sqs = self.sqs
+        country_service.queue_service = queue_service
+        country_service.country_data_fetcher = CountryDataFetcher(base_url=self.upstream.base_url)
+        country_service.shared_cache = RedisCache(self.redis, 'country-data', ttl_seconds=COUNTRY_REDIS_CACHE_TTL_SECONDS,
+                                                  circuit_breaker=breaker)
+        country_service.status_notifier = StatusNotifier(self.redis, circuit_breaker=breaker)
+        country_service.negative_cache = NegativeCache(self.redis, circuit_breaker=breaker)
+        # The packaged catalog knows the real countries rather than the generated ones
+        known_aliases = {alias: country for country, document in self.catalog.items()
+                         for alias in extract_aliases(document) | {country}}
+        country_service.known_country_aliases = known_aliases
+        country_service.known_countries = frozenset(known_aliases)
+        country_service.suggestion_index = CountrySearchIndex(known_aliases)
+        country_service.alias_index = AliasIndex(self.db_service, known_aliases)
+        country_service.country_cache = TTLCache(COUNTRY_CACHE_MAX_SIZE, COUNTRY_CACHE_TTL_SECONDS)
+        country_service.search_index = None
+        country_service.query_engine = None
+
+        rate_limiter = service.rate_limiter
+        rate_limiter.circuit_breaker = breaker
+        rate_limiter.leases = {}
+        rate_limiter.connected = False
+        rate_limiter.connect(self.redis)
+
+    def scenarios(self):
+        stored, pending = self.stored, self.unstored
+        regions = sorted(REGIONS)
+        etags = {country: f'"{content_hash(self.catalog[country])}"' for country in stored}
+        return {
+            'country': ('GET /country/{country}', lambda i: api_event(
+                '/country/{country}', {'country': stored[i % len(stored)]}, client=i % CLIENT_IPS)),
+            'country_fields': ('GET /country/{country}?fields=', lambda i: api_event(
+                '/country/{country}', {'country': stored[i % len(stored)]}, {'fields': 'name.common,capital,population'},
+                client=i % CLIENT_IPS)),
+            'country_not_modified': ('GET /country/{country} If-None-Match', lambda i: api_event(
+                '/country/{country}', {'country': stored[i % len(stored)]},
+                headers={'if-none-match': etags[stored[i % len(stored)]]}, client=i % CLIENT_IPS)),
+            'countries': ('GET /countries', lambda i: api_event(
+                '/countries', query={'names': ','.join(stored[(i * 10 + k) % len(stored)] for k in range(10))},
+                client=i % CLIENT_IPS)),
+            'search': ('GET /search', lambda i: api_event(
+                '/search', query={'q': stored[i % len(stored)][:5]}, client=i % CLIENT_IPS)),
+            'query': ('GET /query', lambda i: api_event(
+                '/query', query={'region': regions[i % len(regions)], 'population_min': '100000', 'sort': '-population'},
+                client=i % CLIENT_IPS)),
+            'status': ('GET /status/{country}', lambda i: api_event(
+                '/status/{country}', {'country': stored[i % len(stored)]}, client=i % CLIENT_IPS)),
+            # Claims and enqueues each pending country once; repeats see it PENDING. The worker drains these.
+            'fetch': ('GET /fetch/{country}', lambda i: api_event(
+                '/fetch/{country}', {'country': pending[i % len(pending)]}, client=i % CLIENT_IPS))
+        }
+
+    def run_endpoint(self, service, endpoint, make_event):
+        # Lambda runs one request at a time per container, so requests are sent sequentially and
+        # requests/sec is the throughput of a single warm container
+        for i in range(self.args.warmup):
+            service.app(make_event(i), None)
+
+        durations = []
+        statuses = {}
+        for i in range(self.args.warmup, self.args.warmup + self.args.requests):
+            event = make_event(i)
+            started = time.perf_counter()
+            response = service.app(event, None)
+            durations.append(time.perf_counter() - started)
+            status = str(response['statusCode'])
+            statuses[status] = statuses.get(status, 0) + 1
+
+        result, total = summarize(durations)
+        result.update({
+            'endpoint': endpoint,
+            'requests': len(durations),
+            'requests_per_second': round(len(durations) / total, 1),
+            'errors': sum(count for status, count in statuses.items() if int(status) == 429 or int(status) >= 500),
+            'statuses': dict(sorted(statuses.items()))
+        })
+        return result
+
+    def run_worker(self, service):
+        # Countries not claimed by the fetch scenario are enqueued through the bulk fetch path
+        unclaimed = [country for country in self.unstored
+                     if self.dynamodb.item(OPERATION_TABLE, country=country, timestamp=LATEST_STATUS_TIMESTAMP) is None]
+        if unclaimed:
+            service.country_service.fetch_countries_data(unclaimed)
+
+        durations = []
+        processed = failed = 0
+        while self.sqs.messages:
+            batch = [self.sqs.messages.popleft() for _ in range(min(service.sqs_batch_size, len(self.sqs.messages)))]
+            started = time.perf_counter()
+            response = service.handle_sqs_message(sqs_event(batch), None)
+            durations.append(time.perf_counter() - started)
+            processed += len(batch)
+            failed += len(response['batchItemFailures'])
+
+        if not durations:
+            return {'messages': 0}
+        result, total = summarize(durations)
+        result.update({
+            'messages': processed,
+            'batches': len(durations),
+            'failed': failed,
+            'messages_per_second': round(processed / total, 1)
+        })
+        return result
+
+    def run(self):
+        import app as service
+
+        self.upstream.start()
+        stream, metrics.stream = metrics.stream, open(os.devnull, 'w')
+        try:
+            self.attach(service)
+            endpoints = {
+                name: self.run_endpoint(service, endpoint, make_event)
+                for name, (endpoint, make_event) in self.scenarios().items()
+                if not self.args.endpoints or name in self.args.endpoints
+            }
+            worker = self.run_worker(service)
+        finally:
+            metrics.stream.close()
+            metrics.stream = stream
+            self.upstream.stop()
+
+        return {
+            'config': config(self.args),
+            'endpoints': endpoints,
+            'worker': worker,
+            'backends': {name: backend.stats() for name, backend in self.backends.items()}
+        }
+
+
+def best_of(runs):
+    # Keeps each endpoint's fastest run, so interference from other processes on the machine
+    # (which only ever slows a run down) does not show up as a regression
+    best = dict(runs[0])
+    best['endpoints'] = {
+        name: min((run['endpoints'][name] for run in runs), key=lambda result: (result['p95_ms'], result['p50_ms']))
+        for name in runs[0]['endpoints']
+    }
+    best['worker'] = max((run['worker'] for run in runs), key=lambda result: result.get('messages_per_second', 0))
+    return best
+
+
+def config(args):
+    # Results are only comparable with a baseline taken under the same load and backend profile
+    return {key: getattr(args, key) for key in (
+        'runs', 'requests', 'warmup', 'countries', 'worker_messages', 'seed', 'jitter',
+        'dynamodb_ms', 'sqs_ms', 'redis_ms', 'upstream_ms',
+        'dynamodb_throttle', 'sqs_throttle', 'redis_errors', 'upstream_throttle'
+    )}
+
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    # Returns a description of each regression. Latency must be worse by both the relative
+    # tolerance and min_delta_ms, so sub-millisecond noise on fast endpoints is ignored.
+    if results['config'] != baseline['config']:
+        return ['Configuration differs from the baseline; run with --save-baseline to record a new one']
+
+    def slower(name, metric, current, previous):
+        if current > previous * (1 + tolerance) and current - previous > min_delta_ms:
+            regressions.append(f'{name}: {metric} {previous} -> {current} ms')
+
+    regressions = []
+    for name, current in results['endpoints'].items():
+        previous = baseline['endpoints'].get(name)
+        if previous is None:
+            continue
+        slower(name, 'p50', current['p50_ms'], previous['p50_ms'])
+        slower(name, 'p95', current['p95_ms'], previous['p95_ms'])
+        if current['errors'] > previous['errors']:
+            regressions.append(f"{name}: errors {previous['errors']} -> {current['errors']}")
+
+    current, previous = results['worker'], baseline.get('worker', {})
+    if current.get('messages') and previous.get('messages'):
+        # A run has few batches, so their p95 is too noisy to compare
+        slower('worker', 'batch p50', current['p50_ms'], previous['p50_ms'])
+        if current['messages_per_second'] < previous['messages_per_second'] * (1 - tolerance):
+            regressions.append(f"worker: messages/sec {previous['messages_per_second']} -> {current['messages_per_second']}")
+        if current['failed'] > previous['failed']:
+            regressions.append(f"worker: failed messages {previous['failed']} -> {current['failed']}")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Load-test the API and SQS worker against local stand-ins for DynamoDB, SQS, Redis and restcountries.')
+    parser.add_argument('--runs', type=int, default=3, help='Repeat the whole run and report the fastest result per endpoint')
+    parser.add_argument('--requests', type=int, default=200, help='Measured requests per endpoint')
+    parser.add_argument('--warmup', type=int, default=10, help='Unmeasured requests per endpoint before measuring')
+    parser.add_argument('--countries', type=int, default=200, help='Countries already stored before the run')
+    parser.add_argument('--worker-messages', type=int, default=100, help='Countries fetched from upstream by the worker')
+    parser.add_argument('--endpoints', nargs='*', help='Only run these endpoint scenarios')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--jitter', type=float, default=0.25, help='Latency varies uniformly by this fraction')
+    parser.add_argument('--dynamodb-ms', type=float, default=4, help='DynamoDB round-trip latency')
+    parser.add_argument('--sqs-ms', type=float, default=8, help='SQS round-trip latency')
+    parser.add_argument('--redis-ms', type=float, default=0.5, help='Redis round-trip latency')
+    parser.add_argument('--upstream-ms', type=float, default=40, help='restcountries.com response latency')
+    parser.add_argument('--dynamodb-throttle', type=float, default=0, help='Fraction of DynamoDB attempts throttled')
+    parser.add_argument('--sqs-throttle', type=float, default=0, help='Fraction of SQS attempts throttled')
+    parser.add_argument('--redis-errors', type=float, default=0, help='Fraction of Redis calls that time out')
+    parser.add_argument('--upstream-throttle', type=float, default=0, help='Fraction of upstream requests answered with 429')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE_PATH, help='Baseline results file')
+    parser.add_argument('--save-baseline', action='store_true', help='Write the results as the new baseline')
+    parser.add_argument('--compare', action='store_true', help='Exit with status 1 if results regressed against the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed relative slowdown before it counts as a regression')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help='Allowed absolute latency increase regardless of tolerance')
+    return parser.parse_args(argv)
+
+
+def load_test(argv=None):
+    args = parse_args(argv)
+    results = best_of([LoadTest(args).run() for _ in range(args.runs)])
+    print(json.dumps(results, indent=2))
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+            f.write('\n')
+        print(f'Saved baseline to {args.baseline}', file=sys.stderr)
+    elif args.compare:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+        for regression in regressions:
+            print(f'REGRESSION {regression}', file=sys.stderr)
+        if regressions:
+            return 1
+        print('No regressions against the baseline', file=sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(load_test())
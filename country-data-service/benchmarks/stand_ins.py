@@ -0,0 +1,1006 @@
+import base64
+import bisect
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from decimal import Decimal
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, unquote
+import boto3
+from boto3.dynamodb.types import Binary
+from botocore.awsrequest import AWSResponse
+from botocore.exceptions import ClientError
+from redis.exceptions import TimeoutError as RedisTimeoutError
+from chalicelib.metrics import metrics, instrument_client
+from chalicelib.storage_format import encode_country_item
+from chalicelib.alias_index import extract_aliases
+from chalicelib.rate_limiter import FIXED_WINDOW_SCRIPT, GCRA_SCRIPT, LEASE_SCRIPT
+from chalicelib.redis_cache import RELEASE_LOCK_SCRIPT
+from chalicelib.db_service import (COUNTRY_TABLE, OPERATION_TABLE, ALIAS_TABLE, LATEST_STATUS_TIMESTAMP, BATCH_GET_MAX_KEYS,
+                                   BATCH_WRITE_MAX_ITEMS, COUNTRY_ATTRIBUTES_INDEX)
+
+# In-process stand-ins for the service's backends, used by the load test so it runs without
+# network access. Every round trip sleeps for the backend's latency (with jitter) and can be
+# throttled at a configurable rate, so queueing and retry behaviour show up in the results.
+
+SDK_MAX_ATTEMPTS = 3
+LANGUAGES = ('ara', 'bre', 'ces', 'cym', 'deu', 'est', 'fin', 'fra', 'hrv', 'hun', 'ita', 'jpn', 'kor',
+             'nld', 'per', 'pol', 'por', 'rus', 'slk', 'spa', 'srp', 'swe', 'tur', 'urd', 'zho')
+REGIONS = {
+    'Africa': ('Northern Africa', 'Western Africa', 'Eastern Africa', 'Southern Africa'),
+    'Americas': ('South America', 'Central America', 'Caribbean', 'North America'),
+    'Asia': ('Eastern Asia', 'Southern Asia', 'Western Asia', 'South-Eastern Asia'),
+    'Europe': ('Northern Europe', 'Western Europe', 'Southern Europe', 'Eastern Europe'),
+    'Oceania': ('Polynesia', 'Melanesia', 'Micronesia', 'Australia and New Zealand')
+}
+SYLLABLES = ('al', 'bar', 'cor', 'dan', 'el', 'fa', 'gor', 'hal', 'ir', 'ka', 'lor', 'man', 'nor',
+             'os', 'pel', 'ran', 'sal', 'tor', 'ur', 'val', 'wen', 'zan')
+
+
+class Backend:
+    # Latency and throttling profile of one backend
+    def __init__(self, name: str, latency_ms: float = 0, jitter: float = 0.25, throttle_rate: float = 0, seed: int = 0):
+        self.name = name
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.throttled = 0
+
+    def delay(self):
+        with self.lock:
+            self.calls += 1
+            factor = 1 + self.jitter * (2 * self.rng.random() - 1)
+        if self.latency_ms > 0:
+            time.sleep(self.latency_ms * factor / 1000)
+
+    def is_throttled(self) -> bool:
+        with self.lock:
+            throttled = self.rng.random() < self.throttle_rate
+            self.throttled += throttled
+        return throttled
+
+    def backoff(self, attempt: int) -> float:
+        # Full jitter, like the AWS SDKs
+        with self.lock:
+            return self.rng.random() * min(0.05 * 2 ** attempt, 1)
+
+    def stats(self) -> dict:
+        return {'calls': self.calls, 'throttled': self.throttled}
+
+
+def aws_call(backend: Backend, stage: str, error_code: str):
+    # One AWS API call including the SDK's own retries of throttled attempts. Recorded in the
+    # invocation metrics the same way instrument_client records a real client.
+    started = metrics.clock()
+    for attempt in range(SDK_MAX_ATTEMPTS):
+        backend.delay()
+        if not backend.is_throttled():
+            metrics.record(stage, (metrics.clock() - started) * 1000, retries=attempt, throttled=attempt > 0)
+            return
+        if attempt < SDK_MAX_ATTEMPTS - 1:
+            time.sleep(backend.backoff(attempt))
+
+    metrics.record(stage, (metrics.clock() - started) * 1000, retries=SDK_MAX_ATTEMPTS - 1, throttled=True, error=True)
+    raise ClientError({'Error': {'Code': error_code, 'Message': 'Rate exceeded'}}, stage)
+
+
+class DynamoDBError(Exception):
+    def __init__(self, code: str, message: str, **fields):
+        super().__init__(message)
+        self.code = code
+        self.fields = fields
+
+
+class RawBody:
+    # The part of urllib3's response that botocore reads the body through
+    def __init__(self, body: bytes):
+        self.body = body
+
+    def stream(self, **kwargs):
+        yield self.body
+
+
+MISSING = object()
+
+
+def decode_value(value):
+    # DynamoDB JSON to the Python types boto3 deserializes to
+    (tag, raw), = value.items()
+    if tag == 'S' or tag == 'BOOL':
+        return raw
+    if tag == 'N':
+        return Decimal(raw)
+    if tag == 'B':
+        return Binary(base64.b64decode(raw))
+    if tag == 'NULL':
+        return None
+    if tag == 'SS':
+        return set(raw)
+    if tag == 'NS':
+        return {Decimal(number) for number in raw}
+    if tag == 'BS':
+        return {Binary(base64.b64decode(blob)) for blob in raw}
+    if tag == 'L':
+        return [decode_value(element) for element in raw]
+    if tag == 'M':
+        return decode_item(raw)
+    raise DynamoDBError('ValidationException', f"Unsupported attribute type: {tag}")
+
+
+def encode_value(value):
+    if isinstance(value, str):
+        return {'S': value}
+    if isinstance(value, bool):
+        return {'BOOL': value}
+    if value is None:
+        return {'NULL': True}
+    if isinstance(value, (int, Decimal)):
+        return {'N': str(value)}
+    if isinstance(value, (bytes, Binary)):
+        return {'B': base64.b64encode(comparable(value)).decode()}
+    if isinstance(value, (set, frozenset)):
+        encoded = [encode_value(element) for element in value]
+        tag = next(iter(encoded[0])) + 'S'
+        return {tag: sorted(next(iter(element.values())) for element in encoded)}
+    if isinstance(value, (list, tuple)):
+        return {'L': [encode_value(element) for element in value]}
+    if isinstance(value, dict):
+        return {'M': encode_item(value)}
+    raise TypeError(f"Unsupported type: {type(value)}")
+
+
+def decode_item(item: dict) -> dict:
+    return {name: decode_value(value) for name, value in item.items()}
+
+
+def encode_item(item: dict) -> dict:
+    return {name: encode_value(value) for name, value in item.items()}
+
+
+def item_size(item: dict) -> int:
+    return len(json.dumps(encode_item(item)))
+
+
+EXPRESSION_TOKEN = re.compile(r'\s*(<>|<=|>=|[=<>(),+\-]|[#:]?\w+)')
+COMPARATORS = ('=', '<>', '<', '<=', '>', '>=')
+PUNCTUATION = frozenset(COMPARATORS + ('(', ')', ',', '+', '-'))
+
+
+@lru_cache(maxsize=256)
+def tokenize(expression: str) -> tuple:
+    tokens = []
+    position = 0
+    while position < len(expression.rstrip()):
+        match = EXPRESSION_TOKEN.match(expression, position)
+        if not match:
+            raise DynamoDBError('ValidationException', f"Invalid expression: {expression}")
+        tokens.append(match.group(1))
+        position = match.end()
+    return tuple(tokens)
+
+
+class ExpressionParser:
+    # The subset of the expression grammar the service writes: top-level attribute paths,
+    # comparisons, AND/OR/NOT, the attribute functions and SET/REMOVE/ADD/DELETE clauses
+    def __init__(self, expression: str):
+        self.expression = expression
+        self.tokens = tokenize(expression)
+        self.position = 0
+
+    def peek(self, offset: int = 0):
+        index = self.position + offset
+        return self.tokens[index] if index < len(self.tokens) else None
+
+    def keyword(self, *words) -> bool:
+        token = self.peek()
+        return token is not None and token.upper() in words
+
+    def take(self, expected=None):
+        token = self.peek()
+        if token is None or (expected is not None and token.upper() != expected):
+            raise DynamoDBError('ValidationException', f"Invalid expression: {self.expression}")
+        self.position += 1
+        return token
+
+    def done(self):
+        if self.peek() is not None:
+            raise DynamoDBError('ValidationException', f"Invalid expression: {self.expression}")
+
+    def path(self):
+        token = self.take()
+        if token.startswith(':') or token in PUNCTUATION:
+            raise DynamoDBError('ValidationException', f"Invalid expression: {self.expression}")
+        return ('path', token)
+
+    def operand(self):
+        token = self.peek()
+        if token is not None and token.startswith(':'):
+            return ('value', self.take())
+        if token is not None and token.lower() == 'size' and self.peek(1) == '(':
+            self.take()
+            self.take('(')
+            path = self.path()
+            self.take(')')
+            return ('size', path)
+        return self.path()
+
+    def condition(self):
+        node = self.conjunction()
+        while self.keyword('OR'):
+            self.take()
+            node = ('or', node, self.conjunction())
+        return node
+
+    def conjunction(self):
+        node = self.negation()
+        while self.keyword('AND'):
+            self.take()
+            node = ('and', node, self.negation())
+        return node
+
+    def negation(self):
+        if self.keyword('NOT'):
+            self.take()
+            return ('not', self.negation())
+        if self.peek() == '(':
+            self.take('(')
+            node = self.condition()
+            self.take(')')
+            return node
+        token = self.peek()
+        if token is not None and token.lower() in CONDITION_FUNCTIONS and self.peek(1) == '(':
+            name = self.take().lower()
+            self.take('(')
+            args = [self.operand()]
+            while self.peek() == ',':
+                self.take(',')
+                args.append(self.operand())
+            self.take(')')
+            return ('function', name, args)
+
+        left = self.operand()
+        if self.keyword('BETWEEN'):
+            self.take()
+            low = self.operand()
+            self.take('AND')
+            return ('between', left, low, self.operand())
+        if self.keyword('IN'):
+            self.take()
+            self.take('(')
+            options = [self.operand()]
+            while self.peek() == ',':
+                self.take(',')
+                options.append(self.operand())
+            self.take(')')
+            return ('in', left, options)
+        comparator = self.take()
+        if comparator not in COMPARATORS:
+            raise DynamoDBError('ValidationException', f"Invalid expression: {self.expression}")
+        return ('compare', comparator, left, self.operand())
+
+    def set_value(self):
+        node = self.set_term()
+        if self.peek() in ('+', '-'):
+            return ('arithmetic', self.take(), node, self.set_term())
+        return node
+
+    def set_term(self):
+        token = self.peek()
+        if token is not None and token.lower() in ('if_not_exists', 'list_append') and self.peek(1) == '(':
+            name = self.take().lower()
+            self.take('(')
+            first = self.path() if name == 'if_not_exists' else self.set_term()
+            self.take(',')
+            second = self.set_term()
+            self.take(')')
+            return (name, first, second)
+        return self.operand()
+
+    def update(self):
+        actions = []
+        while self.peek() is not None:
+            clause = self.take().upper()
+            if clause not in ('SET', 'REMOVE', 'ADD', 'DELETE'):
+                raise DynamoDBError('ValidationException', f"Invalid update expression: {self.expression}")
+            while True:
+                path = self.path()
+                if clause == 'SET':
+                    self.take('=')
+                    actions.append((clause, path, self.set_value()))
+                elif clause == 'REMOVE':
+                    actions.append((clause, path, None))
+                else:
+                    actions.append((clause, path, self.operand()))
+                if self.peek() != ',':
+                    break
+                self.take(',')
+        return actions
+
+
+@lru_cache(maxsize=256)
+def parse_condition(expression: str):
+    parser = ExpressionParser(expression)
+    node = parser.condition()
+    parser.done()
+    return node
+
+
+@lru_cache(maxsize=256)
+def parse_update(expression: str):
+    return ExpressionParser(expression).update()
+
+
+@lru_cache(maxsize=256)
+def parse_projection(expression: str) -> tuple:
+    return tuple(token.strip() for token in expression.split(','))
+
+
+def comparable(value):
+    return value.value if isinstance(value, Binary) else value
+
+
+def compare(comparator: str, left, right) -> bool:
+    if left is MISSING or right is MISSING:
+        return False
+    if comparator == '=':
+        return left == right
+    if comparator == '<>':
+        return left != right
+    left, right = comparable(left), comparable(right)
+    if type(left) is not type(right) or not isinstance(left, (Decimal, str, bytes)):
+        return False
+    return {'<': left < right, '<=': left <= right, '>': left > right, '>=': left >= right}[comparator]
+
+
+CONDITION_FUNCTIONS = {
+    'attribute_exists': lambda value: value is not MISSING,
+    'attribute_not_exists': lambda value: value is MISSING,
+    'begins_with': lambda value, prefix: (
+        value is not MISSING and isinstance(comparable(value), (str, bytes)) and comparable(value).startswith(comparable(prefix))),
+    'contains': lambda value, member: value is not MISSING and member is not MISSING and (
+        member in value if isinstance(value, (set, list)) else comparable(member) in comparable(value))
+}
+
+
+class Expressions:
+    # ExpressionAttributeNames and ExpressionAttributeValues of one request
+    def __init__(self, request: dict):
+        self.names = request.get('ExpressionAttributeNames', {})
+        self.values = {name: decode_value(value) for name, value in request.get('ExpressionAttributeValues', {}).items()}
+
+    def name(self, token: str) -> str:
+        if not token.startswith('#'):
+            return token
+        if token not in self.names:
+            raise DynamoDBError('ValidationException', f"An expression attribute name used in the document path is not defined: {token}")
+        return self.names[token]
+
+    def evaluate(self, node, item: dict):
+        kind = node[0]
+        if kind == 'path':
+            return item.get(self.name(node[1]), MISSING)
+        if kind == 'value':
+            if node[1] not in self.values:
+                raise DynamoDBError('ValidationException', f"An expression attribute value used in expression is not defined: {node[1]}")
+            return self.values[node[1]]
+        if kind == 'size':
+            value = self.evaluate(node[1], item)
+            return MISSING if value is MISSING else Decimal(len(comparable(value)))
+        if kind == 'if_not_exists':
+            value = self.evaluate(node[1], item)
+            return self.evaluate(node[2], item) if value is MISSING else value
+        if kind == 'list_append':
+            return self.evaluate(node[1], item) + self.evaluate(node[2], item)
+        if kind == 'arithmetic':
+            left, right = self.evaluate(node[2], item), self.evaluate(node[3], item)
+            return left + right if node[1] == '+' else left - right
+        raise DynamoDBError('ValidationException', f"Unexpected operand: {kind}")
+
+    def matches(self, expression, item: dict) -> bool:
+        return expression is None or self.test(parse_condition(expression), item)
+
+    def test(self, node, item: dict) -> bool:
+        kind = node[0]
+        if kind == 'or':
+            return self.test(node[1], item) or self.test(node[2], item)
+        if kind == 'and':
+            return self.test(node[1], item) and self.test(node[2], item)
+        if kind == 'not':
+            return not self.test(node[1], item)
+        if kind == 'function':
+            return CONDITION_FUNCTIONS[node[1]](*(self.evaluate(arg, item) for arg in node[2]))
+        if kind == 'between':
+            value = self.evaluate(node[1], item)
+            return compare('>=', value, self.evaluate(node[2], item)) and compare('<=', value, self.evaluate(node[3], item))
+        if kind == 'in':
+            value = self.evaluate(node[1], item)
+            return any(compare('=', value, self.evaluate(option, item)) for option in node[2])
+        return compare(node[1], self.evaluate(node[2], item), self.evaluate(node[3], item))
+
+    def project(self, expression, item: dict) -> dict:
+        # Paths may name attributes nested in maps, which are returned inside their parents
+        if not expression:
+            return item
+        projected = {}
+        for path in parse_projection(expression):
+            names = [self.name(segment) for segment in path.split('.')]
+            value = item
+            for name in names:
+                if not isinstance(value, dict) or name not in value:
+                    break
+                value = value[name]
+            else:
+                parent = projected
+                for name in names[:-1]:
+                    parent = parent.setdefault(name, {})
+                parent[names[-1]] = value
+        return projected
+
+    def update(self, expression: str, item: dict):
+        # Returns the updated item and the names of the attributes the expression touched.
+        # Every value is computed from the item as it was before the update.
+        updated = dict(item)
+        touched = []
+        for clause, path, operand in parse_update(expression):
+            name = self.name(path[1])
+            touched.append(name)
+            if clause == 'REMOVE':
+                updated.pop(name, None)
+                continue
+            value = self.evaluate(operand, item)
+            if clause == 'SET':
+                updated[name] = value
+                continue
+            current = item.get(name, MISSING)
+            if clause == 'ADD':
+                if current is MISSING:
+                    updated[name] = value
+                elif isinstance(current, set) and isinstance(value, set):
+                    updated[name] = current | value
+                elif isinstance(current, Decimal) and isinstance(value, Decimal):
+                    updated[name] = current + value
+                else:
+                    raise DynamoDBError('ValidationException', "An operand in the update expression has an incorrect data type")
+            elif isinstance(current, set):
+                remaining = current - value
+                if remaining:
+                    updated[name] = remaining
+                else:
+                    updated.pop(name, None)
+        return updated, touched
+
+
+class LocalDynamoDB:
+    # Answers DynamoDB API requests in process. It is attached below a real boto3 resource
+    # through the client's before-send event, so DynamoDBService, boto3's serialization and
+    # botocore's retries and parsing all run unchanged; only the HTTP round trip is replaced.
+    # Every attempt sleeps for the backend's latency. Throttled single-item requests fail with
+    # ProvisionedThroughputExceededException, which the SDK retries; throttled batches leave
+    # half their keys unprocessed, which DynamoDBService retries.
+    KEY_SCHEMAS = {
+        COUNTRY_TABLE: ('country',),
+        ALIAS_TABLE: ('alias',),
+        OPERATION_TABLE: ('country', 'timestamp')
+    }
+    # Sparse INCLUDE indexes: (table, index) -> (index key, projected non-key attributes)
+    INDEXES = {
+        (COUNTRY_TABLE, COUNTRY_ATTRIBUTES_INDEX): ('attributes_hash', ('attributes',))
+    }
+    ERROR_PREFIX = 'com.amazonaws.dynamodb.v20120810#'
+    SCAN_PAGE_BYTES = 1024 * 1024
+
+    def __init__(self, backend: Backend):
+        self.backend = backend
+        self.lock = threading.Lock()
+        self.tables = {table: {} for table in self.KEY_SCHEMAS}
+        self.scan_page_bytes = self.SCAN_PAGE_BYTES
+
+    def resource(self):
+        # A resource set up like initialize_dynamodb_client's, with placeholder credentials
+        session = boto3.session.Session(aws_access_key_id='local', aws_secret_access_key='local', region_name='us-east-1')
+        resource = session.resource('dynamodb')
+        instrument_client(resource.meta.client, 'DynamoDB')
+        resource.meta.client.meta.events.register('before-send.dynamodb', self.handle)
+        return resource
+
+    def seed(self, documents: dict):
+        # Loads documents as if a catalog sync had already stored them, without injected latency
+        timestamp = int(time.time() * 1000)
+        for country, country_data in documents.items():
+            self.put(COUNTRY_TABLE, encode_country_item(country, country_data))
+            for alias in extract_aliases(country_data) | {country}:
+                self.put(ALIAS_TABLE, {'alias': alias, 'country': country})
+            self.put(OPERATION_TABLE, {'country': country, 'timestamp': LATEST_STATUS_TIMESTAMP, 'status': 'COMPLETED',
+                                       'status_timestamp': timestamp})
+
+    def put(self, table: str, item: dict):
+        # Values take the types they would have after a round trip through DynamoDB
+        item = decode_item(encode_item(item))
+        self.table(table)[self.key(table, item)] = item
+
+    def item(self, table: str, **key):
+        item = self.table(table).get(self.key(table, decode_item(encode_item(key))))
+        return dict(item) if item else None
+
+    def table(self, table: str) -> dict:
+        if table not in self.tables:
+            raise DynamoDBError('ResourceNotFoundException', f"Requested resource not found: Table: {table} not found")
+        return self.tables[table]
+
+    def key(self, table: str, item: dict) -> tuple:
+        try:
+            return tuple(comparable(item[name]) for name in self.KEY_SCHEMAS[table])
+        except KeyError:
+            raise DynamoDBError('ValidationException', "The provided key element does not match the schema")
+
+    def handle(self, request, event_name, **kwargs):
+        operation = event_name.rsplit('.', 1)[-1]
+        handler = getattr(self, operation.lower(), None)
+        self.backend.delay()
+        throttled = self.backend.is_throttled()
+        try:
+            if handler is None:
+                raise DynamoDBError('UnknownOperationException', f"Unsupported operation: {operation}")
+            if throttled and operation not in ('BatchGetItem', 'BatchWriteItem'):
+                raise DynamoDBError('ProvisionedThroughputExceededException', 'Rate exceeded')
+            body = json.loads(request.body)
+            with self.lock:
+                result = handler(body, throttled) if operation.startswith('Batch') else handler(body)
+            return self.response(request, 200, result)
+        except DynamoDBError as e:
+            return self.response(request, 400, dict(e.fields, __type=self.ERROR_PREFIX + e.code, message=str(e)))
+
+    def response(self, request, status_code: int, body: dict):
+        headers = {'Content-Type': 'application/x-amz-json-1.0', 'x-amzn-RequestId': str(uuid.uuid4())}
+        return AWSResponse(request.url, status_code, headers, RawBody(json.dumps(body).encode()))
+
+    def consumed(self, request: dict, table: str, capacity_units: float):
+        if request.get('ReturnConsumedCapacity', 'NONE') == 'NONE':
+            return {}
+        return {'ConsumedCapacity': {'TableName': table, 'CapacityUnits': capacity_units}}
+
+    def write_units(self, *items) -> int:
+        # The larger of the old and new item, in 1 KB units
+        return max(1, math.ceil(max((item_size(item) for item in items if item), default=0) / 1024))
+
+    def check_condition(self, request: dict, expressions: Expressions, current):
+        if not expressions.matches(request.get('ConditionExpression'), current or {}):
+            fields = {}
+            if current and request.get('ReturnValuesOnConditionCheckFailure') == 'ALL_OLD':
+                fields['Item'] = encode_item(current)
+            raise DynamoDBError('ConditionalCheckFailedException', 'The conditional request failed', **fields)
+
+    def getitem(self, request: dict) -> dict:
+        table = request['TableName']
+        item = self.table(table).get(self.key(table, decode_item(request['Key'])))
+        if item is None:
+            return {}
+        return {'Item': encode_item(Expressions(request).project(request.get('ProjectionExpression'), item))}
+
+    def putitem(self, request: dict) -> dict:
+        table = request['TableName']
+        item = decode_item(request['Item'])
+        key = self.key(table, item)
+        current = self.table(table).get(key)
+        self.check_condition(request, Expressions(request), current)
+        self.tables[table][key] = item
+        result = {'Attributes': encode_item(current)} if current and request.get('ReturnValues') == 'ALL_OLD' else {}
+        return dict(result, **self.consumed(request, table, self.write_units(current, item)))
+
+    def updateitem(self, request: dict) -> dict:
+        table = request['TableName']
+        key_item = decode_item(request['Key'])
+        key = self.key(table, key_item)
+        current = self.table(table).get(key)
+        expressions = Expressions(request)
+        self.check_condition(request, expressions, current)
+        updated, touched = expressions.update(request.get('UpdateExpression', ''), current or key_item)
+        self.tables[table][key] = updated
+
+        return_values = request.get('ReturnValues', 'NONE')
+        source = current if return_values.endswith('_OLD') else updated
+        attributes = {}
+        if return_values in ('ALL_OLD', 'ALL_NEW'):
+            attributes = source or {}
+        elif return_values in ('UPDATED_OLD', 'UPDATED_NEW'):
+            attributes = {name: (source or {})[name] for name in touched if name in (source or {})}
+        result = {'Attributes': encode_item(attributes)} if attributes else {}
+        return dict(result, **self.consumed(request, table, self.write_units(current, updated)))
+
+    def deleteitem(self, request: dict) -> dict:
+        table = request['TableName']
+        key = self.key(table, decode_item(request['Key']))
+        current = self.table(table).get(key)
+        self.check_condition(request, Expressions(request), current)
+        self.tables[table].pop(key, None)
+        result = {'Attributes': encode_item(current)} if current and request.get('ReturnValues') == 'ALL_OLD' else {}
+        return dict(result, **self.consumed(request, table, self.write_units(current)))
+
+    def batchgetitem(self, request: dict, throttled: bool) -> dict:
+        responses, unprocessed = {}, {}
+        if sum(len(table_request['Keys']) for table_request in request['RequestItems'].values()) > BATCH_GET_MAX_KEYS:
+            raise DynamoDBError('ValidationException', "Too many items requested for the BatchGetItem call")
+        for table, table_request in request['RequestItems'].items():
+            keys = table_request['Keys']
+            if throttled:
+                keys, rest = keys[:len(keys) // 2], keys[len(keys) // 2:]
+                unprocessed[table] = dict(table_request, Keys=rest)
+            expressions = Expressions(table_request)
+            items = (self.table(table).get(self.key(table, decode_item(key))) for key in keys)
+            responses[table] = [encode_item(expressions.project(table_request.get('ProjectionExpression'), item))
+                                for item in items if item is not None]
+        return {'Responses': responses, 'UnprocessedKeys': unprocessed}
+
+    def batchwriteitem(self, request: dict, throttled: bool) -> dict:
+        consumed, unprocessed = [], {}
+        if sum(len(write_requests) for write_requests in request['RequestItems'].values()) > BATCH_WRITE_MAX_ITEMS:
+            raise DynamoDBError('ValidationException', "Too many items requested for the BatchWriteItem call")
+        for table, write_requests in request['RequestItems'].items():
+            if throttled:
+                write_requests, unprocessed[table] = write_requests[:len(write_requests) // 2], write_requests[len(write_requests) // 2:]
+            stored = self.table(table)
+            capacity_units = 0
+            for write_request in write_requests:
+                if 'PutRequest' in write_request:
+                    item = decode_item(write_request['PutRequest']['Item'])
+                    stored[self.key(table, item)] = item
+                else:
+                    item = stored.pop(self.key(table, decode_item(write_request['DeleteRequest']['Key'])), None)
+                capacity_units += self.write_units(item)
+            consumed.append({'TableName': table, 'CapacityUnits': capacity_units})
+        result = {'UnprocessedItems': unprocessed}
+        if request.get('ReturnConsumedCapacity', 'NONE') != 'NONE':
+            result['ConsumedCapacity'] = consumed
+        return result
+
+    def index_items(self, table: str, index: str) -> dict:
+        # Items without the index key are left out of the index; the others keep only their
+        # table key, index key and projected attributes
+        if (table, index) not in self.INDEXES:
+            raise DynamoDBError('ValidationException', f"The table does not have the specified index: {index}")
+        index_key, projected = self.INDEXES[(table, index)]
+        names = self.KEY_SCHEMAS[table] + (index_key,) + projected
+        return {key: {name: item[name] for name in names if name in item}
+                for key, item in self.table(table).items() if index_key in item}
+
+    def scan(self, request: dict) -> dict:
+        # Pages end after SCAN_PAGE_BYTES of items are read, before the filter is applied
+        table = request['TableName']
+        index = request.get('IndexName')
+        source = self.index_items(table, index) if index else self.table(table)
+        expressions = Expressions(request)
+        keys = sorted(source)
+        if 'ExclusiveStartKey' in request:
+            keys = keys[bisect.bisect_right(keys, self.key(table, decode_item(request['ExclusiveStartKey']))):]
+
+        items, scanned, read_bytes = [], 0, 0
+        for key in keys:
+            item = source[key]
+            scanned += 1
+            read_bytes += item_size(item)
+            if expressions.matches(request.get('FilterExpression'), item):
+                items.append(encode_item(expressions.project(request.get('ProjectionExpression'), item)))
+            if read_bytes >= self.scan_page_bytes or scanned == request.get('Limit'):
+                break
+        result = {'Items': items, 'Count': len(items), 'ScannedCount': scanned}
+        if scanned < len(keys):
+            last = source[keys[scanned - 1]]
+            key_names = self.KEY_SCHEMAS[table] + ((self.INDEXES[(table, index)][0],) if index else ())
+            result['LastEvaluatedKey'] = encode_item({name: last[name] for name in key_names})
+        return result
+
+
+class LocalSQSClient:
+    # Stands in for the low-level SQS client, so QueueService itself runs unchanged
+    def __init__(self, backend: Backend):
+        self.backend = backend
+        self.lock = threading.Lock()
+        self.messages = deque()
+
+    def call(self):
+        aws_call(self.backend, 'SQS', 'ThrottlingException')
+
+    def send_message(self, QueueUrl, MessageBody, **kwargs):
+        self.call()
+        message_id = str(uuid.uuid4())
+        with self.lock:
+            self.messages.append({'MessageId': message_id, 'Body': MessageBody})
+        return {'MessageId': message_id}
+
+    def send_message_batch(self, QueueUrl, Entries, **kwargs):
+        self.call()
+        successful = []
+        with self.lock:
+            for entry in Entries:
+                message_id = str(uuid.uuid4())
+                self.messages.append({'MessageId': message_id, 'Body': entry['MessageBody']})
+                successful.append({'Id': entry['Id'], 'MessageId': message_id})
+        return {'Successful': successful, 'Failed': []}
+
+    def receive_message(self, QueueUrl, MaxNumberOfMessages=1, **kwargs):
+        self.call()
+        with self.lock:
+            count = min(MaxNumberOfMessages, len(self.messages))
+            messages = [self.messages.popleft() for _ in range(count)]
+        return {'Messages': [dict(message, ReceiptHandle=message['MessageId']) for message in messages]}
+
+    def delete_message(self, QueueUrl, ReceiptHandle, **kwargs):
+        self.call()
+        return {}
+
+
+class LocalRedis:
+    # The subset of redis-py the service uses. Values are kept as bytes, as redis-py returns them.
+    # Registered Lua scripts run as Python equivalents; throttling surfaces as timeouts.
+    def __init__(self, backend: Backend, clock=time.time):
+        self.backend = backend
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.data = {}
+        self.expires_at = {}
+        self.scripts = {
+            FIXED_WINDOW_SCRIPT: self.fixed_window,
+            GCRA_SCRIPT: self.gcra,
+            LEASE_SCRIPT: self.lease,
+            RELEASE_LOCK_SCRIPT: self.release_lock
+        }
+
+    def call(self):
+        self.backend.delay()
+        if self.backend.is_throttled():
+            raise RedisTimeoutError('Timeout reading from socket')
+
+    def encode(self, value) -> bytes:
+        return value if isinstance(value, bytes) else str(value).encode('utf-8')
+
+    def expire(self, key):
+        # Caller holds the lock
+        expires_at = self.expires_at.get(key)
+        if expires_at is not None and expires_at <= self.clock():
+            self.data.pop(key, None)
+            self.expires_at.pop(key, None)
+
+    def read(self, key):
+        self.expire(key)
+        return self.data.get(key)
+
+    def write(self, key, value, ttl_seconds=None):
+        self.data[key] = self.encode(value)
+        if ttl_seconds is None:
+            self.expires_at.pop(key, None)
+        else:
+            self.expires_at[key] = self.clock() + ttl_seconds
+
+    def ttl_ms(self, key) -> int:
+        if self.read(key) is None:
+            return -2
+        expires_at = self.expires_at.get(key)
+        return -1 if expires_at is None else int((expires_at - self.clock()) * 1000)
+
+    def get(self, name):
+        self.call()
+        with self.lock:
+            return self.read(name)
+
+    def set(self, name, value, ex=None, px=None, nx=False):
+        self.call()
+        ttl_seconds = ex if ex is not None else (px / 1000 if px is not None else None)
+        with self.lock:
+            if nx and self.read(name) is not None:
+                return None
+            self.write(name, value, ttl_seconds)
+        return True
+
+    def delete(self, *names):
+        self.call()
+        with self.lock:
+            deleted = [name for name in names if self.read(name) is not None]
+            for name in deleted:
+                self.data.pop(name, None)
+                self.expires_at.pop(name, None)
+        return len(deleted)
+
+    def exists(self, *names):
+        self.call()
+        with self.lock:
+            return sum(self.read(name) is not None for name in names)
+
+    def register_script(self, script):
+        function = self.scripts.get(script)
+        if function is None:
+            raise NotImplementedError('Script has no local equivalent')
+
+        def run(keys=(), args=()):
+            self.call()
+            with self.lock:
+                return function(list(keys), list(args))
+        return run
+
+    def increment(self, key, amount, ttl_seconds):
+        # INCRBY keeps an existing expiry; the expiry is only set when the key is created
+        current = int(self.read(key) or 0) + amount
+        if current == amount:
+            self.write(key, current, ttl_seconds)
+        else:
+            self.data[key] = self.encode(current)
+        return current
+
+    def fixed_window(self, keys, args):
+        limit, period = int(args[0]), int(args[1])
+        return 1 if self.increment(keys[0], 1, period) > limit else 0
+
+    def gcra(self, keys, args):
+        limit, period = float(args[0]), float(args[1])
+        now = self.clock()
+        emission_interval = period / limit
+        stored = self.read(keys[0])
+        tat = float(stored) if stored is not None else now
+        tat = max(tat, now)
+        new_tat = tat + emission_interval
+        if new_tat - period > now:
+            return 1
+        self.write(keys[0], repr(new_tat), math.ceil((new_tat - now) * 1000) / 1000)
+        return 0
+
+    def lease(self, keys, args):
+        limit, period, lease_size = int(args[0]), int(args[1]), int(args[2])
+        current = int(self.read(keys[0]) or 0)
+        granted = min(lease_size, limit - current)
+        if granted > 0:
+            self.increment(keys[0], granted, period)
+        else:
+            granted = 0
+        return [granted, self.ttl_ms(keys[0])]
+
+    def release_lock(self, keys, args):
+        if self.read(keys[0]) == self.encode(args[0]):
+            self.data.pop(keys[0], None)
+            self.expires_at.pop(keys[0], None)
+            return 1
+        return 0
+
+
+def country_name(index: int) -> str:
+    # Deterministic, pronounceable and unique (the index is spelled out in the last syllables)
+    syllables = [SYLLABLES[(index * 7 + 3) % len(SYLLABLES)]]
+    while True:
+        syllables.append(SYLLABLES[index % len(SYLLABLES)])
+        index //= len(SYLLABLES)
+        if index == 0:
+            break
+    return ''.join(syllables).capitalize() + 'ia'
+
+
+def letter_code(index: int, length: int) -> str:
+    code = ''
+    for _ in range(length):
+        code = chr(ord('A') + index % 26) + code
+        index //= 26
+    return code
+
+
+def generate_country_document(index: int, rng: random.Random) -> dict:
+    # Shaped like a restcountries.com v3.1 document, at a similar size
+    name = country_name(index)
+    region = sorted(REGIONS)[index % len(REGIONS)]
+    subregion = REGIONS[region][rng.randrange(len(REGIONS[region]))]
+    cca2, cca3 = letter_code(index, 2), letter_code(index, 3)
+    official = f'Republic of {name}'
+    return {
+        'name': {'common': name, 'official': official,
+                 'nativeName': {'eng': {'official': official, 'common': name}}},
+        'tld': [f'.{cca2.lower()}'],
+        'cca2': cca2,
+        'ccn3': f'{index:03d}',
+        'cca3': cca3,
+        'cioc': cca3,
+        'independent': rng.random() < 0.9,
+        'status': 'officially-assigned',
+        'unMember': rng.random() < 0.85,
+        'currencies': {f'{cca2}D': {'name': f'{name} dollar', 'symbol': '$'}},
+        'idd': {'root': '+2', 'suffixes': [f'{index % 100:02d}']},
+        'capital': [f'{name[:4]}ville'],
+        'altSpellings': [cca2, official],
+        'region': region,
+        'subregion': subregion,
+        'languages': {'eng': 'English'},
+        'translations': {code: {'official': f'{official} ({code})', 'common': f'{name} ({code})'} for code in LANGUAGES},
+        'latlng': [round(rng.uniform(-60, 70), 2), round(rng.uniform(-180, 180), 2)],
+        'landlocked': rng.random() < 0.2,
+        'borders': [letter_code(rng.randrange(index + 1), 3) for _ in range(rng.randrange(5))],
+        'area': round(rng.lognormvariate(11, 2), 1),
+        'demonyms': {'eng': {'f': f'{name}n', 'm': f'{name}n'}},
+        'flag': '',
+        'maps': {'googleMaps': f'https://goo.gl/maps/{cca3}', 'openStreetMaps': f'https://www.openstreetmap.org/relation/{index}'},
+        'population': int(rng.lognormvariate(15, 2)),
+        'car': {'signs': [cca2], 'side': 'right'},
+        'timezones': [f'UTC{rng.randrange(-12, 13):+03d}:00'],
+        'continents': [region if region != 'Americas' else 'North America'],
+        'flags': {'png': f'https://flagcdn.com/w320/{cca2.lower()}.png', 'svg': f'https://flagcdn.com/{cca2.lower()}.svg'},
+        'coatOfArms': {},
+        'startOfWeek': 'monday',
+        'capitalInfo': {'latlng': [0.0, 0.0]}
+    }
+
+
+def generate_catalog(size: int, seed: int = 0) -> dict:
+    # Maps the stored key of each country to its document
+    rng = random.Random(seed)
+    documents = [generate_country_document(index, rng) for index in range(size)]
+    catalog = {document['name']['common'].lower(): document for document in documents}
+    assert len(catalog) == size, 'Generated country names collided'
+    return catalog
+
+
+class RestCountriesHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are sent as separate writes; without this, Nagle's algorithm and
+    # delayed ACKs add tens of milliseconds to every response
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        stub = self.server.stub
+        stub.backend.delay()
+        path = urlparse(self.path).path
+        if stub.backend.is_throttled():
+            self.respond(429, {'message': 'Too Many Requests'})
+        elif path.startswith('/name/'):
+            document = stub.documents.get(unquote(path[len('/name/'):]).lower().replace(' ', '-'))
+            self.respond(200, [document]) if document else self.respond(404, {'status': 404, 'message': 'Not Found'})
+        elif path == '/all':
+            self.respond(200, list(stub.documents.values()))
+        else:
+            self.respond(404, {'status': 404, 'message': 'Not Found'})
+
+    def respond(self, status, body):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class RestCountriesStub:
+    # A local HTTP server in place of restcountries.com, so the real session (pooling,
+    # timeouts and urllib3 retries on 429) is exercised
+    def __init__(self, documents: dict, backend: Backend):
+        self.documents = documents
+        self.backend = backend
+        self.server = None
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), RestCountriesHandler, bind_and_activate=False)
+        # The default listen backlog of 5 overflows when the worker's threads connect at once,
+        # and each dropped SYN costs a one-second retransmit
+        self.server.request_queue_size = 128
+        self.server.server_bind()
+        self.server.server_activate()
+        self.server.daemon_threads = True
+        self.server.stub = self
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
@@ -0,0 +1,16 @@
+import json
+import os
+from chalicelib.db_service import DynamoDBService
+from chalicelib.country_service import ALIAS_SNAPSHOT_PATH
+
+
+def build_alias_snapshot():
+    # Packages the alias table with the app so containers can build the search index without a Scan
+    aliases = DynamoDBService().get_all_country_aliases()
+    os.makedirs(os.path.dirname(ALIAS_SNAPSHOT_PATH), exist_ok=True)
+    with open(ALIAS_SNAPSHOT_PATH, 'w', encoding='utf-8') as f:
+        json.dump(aliases, f, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    print(f"Wrote {len(aliases)} aliases to {ALIAS_SNAPSHOT_PATH}")
+
+if __name__ == '__main__':
+    build_alias_snapshot()
@@ -0,0 +1,61 @@
+import argparse
+import json
+import os
+import unicodedata
+from chalicelib.alias_index import extract_aliases, normalize_alias
+from chalicelib.country_service import COUNTRY_CATALOG_PATH, CountryDataFetcher
+
+# Everything extract_aliases reads, so the /all response stays small
+CATALOG_FIELDS = ('name', 'cca2', 'cca3', 'ccn3', 'altSpellings')
+
+
+def fold_accents(alias: str) -> str:
+    return ''.join(c for c in unicodedata.normalize('NFKD', alias) if not unicodedata.combining(c))
+
+
+def derived_aliases(alias: str) -> set:
+    # Spellings people type for an upstream name: without accents ('curacao' for 'curaçao'),
+    # and the leading part of an inverted name ('korea' for 'korea,-republic-of')
+    derived = {fold_accents(alias)}
+    if ',' in alias:
+        derived.add(alias.split(',')[0].strip('-'))
+    return derived - {alias, ''}
+
+
+def catalog_aliases(countries) -> dict:
+    # Every name and code of every country restcountries.com serves, keyed to its common name.
+    # A derived spelling shared by several countries is still known, but maps to none of them.
+    aliases = {}
+    for country_data in countries:
+        country = normalize_alias(country_data['name']['common'])
+        aliases.update({alias: country for alias in extract_aliases(country_data)})
+        aliases[country] = country
+
+    derived = {}
+    for alias, country in aliases.items():
+        for spelling in derived_aliases(alias):
+            if spelling not in aliases:
+                derived[spelling] = country if derived.get(spelling, country) == country else None
+    return dict(aliases, **derived)
+
+
+def load_countries(payload_path=None):
+    if payload_path is None:
+        return CountryDataFetcher().fetch_all_countries(CATALOG_FIELDS)
+    with open(payload_path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def build_country_catalog(payload_path=None):
+    # Packages the full upstream catalog so names can be validated and resolved before any
+    # country is stored. payload_path is a saved response of /v3.1/all, for offline builds.
+    aliases = catalog_aliases(load_countries(payload_path))
+    os.makedirs(os.path.dirname(COUNTRY_CATALOG_PATH), exist_ok=True)
+    with open(COUNTRY_CATALOG_PATH, 'w', encoding='utf-8') as f:
+        json.dump(aliases, f, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    print(f"Wrote {len(aliases)} aliases to {COUNTRY_CATALOG_PATH}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build chalicelib/data/country_catalog.json from restcountries.com')
+    parser.add_argument('--payload', help='A saved /v3.1/all response to build from instead of fetching it')
+    build_country_catalog(parser.parse_args().payload)
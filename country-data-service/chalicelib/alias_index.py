@@ -0,0 +1,94 @@
+import sys
+import threading
+import logging
+from .cache import TTLCache
+
+logger = logging.getLogger()
+
+ALIAS_NEGATIVE_CACHE_SIZE = 1000
+ALIAS_NEGATIVE_CACHE_TTL_SECONDS = 300
+
+
+def normalize_alias(alias: str) -> str:
+    return alias.strip().lower().replace(' ', '-')
+
+
+def extract_aliases(country_data: dict) -> set:
+    # ISO codes, common/official names, alternative spellings and native names
+    name = country_data.get('name')
+    if not isinstance(name, dict):
+        name = {}
+    candidates = [
+        country_data.get('cca2'),
+        country_data.get('cca3'),
+        country_data.get('ccn3'),
+        name.get('common'),
+        name.get('official')
+    ]
+    candidates.extend(country_data.get('altSpellings') or [])
+    for native_name in (name.get('nativeName') or {}).values():
+        if isinstance(native_name, dict):
+            candidates.append(native_name.get('common'))
+            candidates.append(native_name.get('official'))
+
+    return {normalize_alias(candidate) for candidate in candidates if isinstance(candidate, str) and candidate.strip()}
+
+
+class AliasIndex:
+    def __init__(self, db_service, packaged=None):
+        # packaged maps aliases to countries before anything is learned, e.g. the country catalog
+        self.db_service = db_service
+        self.packaged = packaged or {}
+        self.aliases = {}
+        self.unknown = TTLCache(ALIAS_NEGATIVE_CACHE_SIZE, ALIAS_NEGATIVE_CACHE_TTL_SECONDS)
+        self._lock = threading.Lock()
+
+    def register(self, country: str, country_data: dict) -> dict:
+        # Interning the canonical key keeps one copy per country however many aliases point at it
+        country = sys.intern(country)
+        aliases = {alias: country for alias in extract_aliases(country_data)}
+        aliases[country] = country
+        with self._lock:
+            self.aliases.update(aliases)
+        return aliases
+
+    def resolve(self, identifier: str):
+        identifier = normalize_alias(identifier)
+        return self.resolve_many([identifier]).get(identifier)
+
+    def resolve_many(self, identifiers) -> dict:
+        resolved = {}
+        to_load = []
+        for identifier in identifiers:
+            identifier = normalize_alias(identifier)
+            country = self.aliases.get(identifier) or self.packaged.get(identifier)
+            if country is not None:
+                resolved[identifier] = country
+            elif self.unknown.get(identifier) is None:
+                to_load.append(identifier)
+
+        if not to_load:
+            return resolved
+
+        try:
+            if len(to_load) == 1:
+                country = self.db_service.get_country_alias(to_load[0])
+                loaded = {to_load[0]: country} if country else {}
+            else:
+                loaded = self.db_service.batch_get_country_aliases(to_load)
+        except Exception as e:
+            logger.error(f"Error resolving country aliases: {e}")
+            return resolved
+
+        with self._lock:
+            for identifier in to_load:
+                country = loaded.get(identifier)
+                if country is None:
+                    self.unknown.set(identifier, True)
+                else:
+                    self.aliases[identifier] = sys.intern(country)
+                    resolved[identifier] = country
+        return resolved
+
+    def __len__(self):
+        return len(self.aliases)
@@ -0,0 +1,153 @@
+import os
+import socket
+import logging
+import ipaddress
+from urllib.parse import urlsplit
+from .http_client import HTTP_CONNECT_TIMEOUT, HTTP_POOL_SIZE
+from .metrics import metrics
+
+logger = logging.getLogger()
+
+CALLBACK_TIMEOUT_SECONDS = float(os.environ.get('CALLBACK_TIMEOUT_SECONDS', 5))
+MAX_CALLBACK_URL_LENGTH = 2048
+
+
+def is_ip_literal(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return True
+
+
+def validate_callback_url(url) -> bool:
+    # Only absolute https URLs; the notification carries no credentials, so the receiver
+    # authenticates it by putting an unguessable token in the URL. Receivers are named by
+    # DNS, so a caller cannot point the worker at an address inside the VPC directly; what
+    # a name resolves to is checked again when each delivery connects.
+    if not isinstance(url, str) or len(url) > MAX_CALLBACK_URL_LENGTH:
+        return False
+    try:
+        parts = urlsplit(url)
+        parts.port
+    except ValueError:
+        return False
+    host = parts.hostname
+    if not host or is_ip_literal(host) or host == 'localhost' or host.endswith('.localhost'):
+        return False
+    return parts.scheme == 'https' and not parts.username and not parts.password
+
+
+class NonPublicAddressError(Exception):
+    pass
+
+
+def public_addresses(host, port, resolver):
+    # Every address the name resolves to must be publicly routable: no private, loopback,
+    # link-local (instance metadata), shared or reserved ranges
+    addresses = list(dict.fromkeys(info[4][0] for info in resolver(host, port, proto=socket.IPPROTO_TCP)))
+    if not addresses or not all(ipaddress.ip_address(address).is_global for address in addresses):
+        raise NonPublicAddressError(f"{host} resolves to a non-public address")
+    return addresses
+
+
+def create_callback_session(resolver=socket.getaddrinfo):
+    # The connection resolves the receiver once, checks the addresses and connects to one of
+    # them, so a name that is rebound between the check and the connect cannot reach an
+    # internal address. TLS still verifies the certificate against the hostname.
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.connection import HTTPSConnection
+    from urllib3.connectionpool import HTTPSConnectionPool
+    from urllib3.exceptions import ConnectTimeoutError, NameResolutionError, NewConnectionError
+    from urllib3.util import connection
+
+    class PublicAddressHTTPSConnection(HTTPSConnection):
+        def _new_conn(self):
+            try:
+                addresses = public_addresses(self._dns_host, self.port, resolver)
+            except socket.gaierror as e:
+                raise NameResolutionError(self.host, self, e) from e
+
+            error = None
+            for address in addresses:
+                try:
+                    return connection.create_connection(
+                        (address, self.port),
+                        self.timeout,
+                        source_address=self.source_address,
+                        socket_options=self.socket_options
+                    )
+                except OSError as e:
+                    error = e
+            if isinstance(error, socket.timeout):
+                raise ConnectTimeoutError(self, f"Connection to {self.host} timed out") from error
+            raise NewConnectionError(self, f"Failed to establish a new connection: {error}") from error
+
+    class PublicAddressHTTPSConnectionPool(HTTPSConnectionPool):
+        ConnectionCls = PublicAddressHTTPSConnection
+
+    class PublicAddressAdapter(HTTPAdapter):
+        def init_poolmanager(self, *args, **kwargs):
+            super().init_poolmanager(*args, **kwargs)
+            self.poolmanager.pool_classes_by_scheme = {
+                **self.poolmanager.pool_classes_by_scheme, 'https': PublicAddressHTTPSConnectionPool
+            }
+
+    # No adapter retries: failed deliveries are retried by the delivery queue
+    session = requests.Session()
+    session.mount('https://', PublicAddressAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE))
+    return session
+
+
+def callback_message(url, country, status, timestamp, error=None):
+    message = {'url': url, 'country': country, 'status': status, 'timestamp': timestamp}
+    if error:
+        message['error'] = error
+    return message
+
+
+class CallbackDelivery:
+    # POSTs one notification per delivery-queue message. Retries are left to the queue: a
+    # failed delivery is reported back to SQS, which redelivers it after the visibility
+    # timeout and moves it to the dead-letter queue once maxReceiveCount is reached.
+    def __init__(self, session=None, timeout=None, resolver=socket.getaddrinfo):
+        self._session = session
+        self.timeout = timeout or (HTTP_CONNECT_TIMEOUT, CALLBACK_TIMEOUT_SECONDS)
+        self.resolver = resolver
+
+    @property
+    def session(self):
+        if self._session is None:
+            self._session = create_callback_session(self.resolver)
+        return self._session
+
+    def deliver(self, message) -> bool:
+        # Returns False if the delivery should be retried. Receivers that reject the
+        # notification outright (4xx other than 408/429, or a redirect) are not retried,
+        # and neither are hosts that resolve to internal addresses.
+        url = message['url']
+        payload = {key: value for key, value in message.items() if key != 'url'}
+        host = urlsplit(url).hostname
+        try:
+            with metrics.timer('Callback') as outcome:
+                response = self.session.post(url, json=payload, timeout=self.timeout, allow_redirects=False)
+                outcome['throttled'] = response.status_code == 429
+        except NonPublicAddressError:
+            logger.error(f"Callback host {host} resolves to a non-public address, dropping notification")
+            metrics.increment('CallbacksDropped')
+            return True
+        except Exception as e:
+            logger.error(f"Error delivering callback for country {message['country']} to {host}: {e}")
+            return False
+
+        if 200 <= response.status_code < 300:
+            logger.info(f"Delivered callback for country {message['country']} to {host}")
+            return True
+        if response.status_code in (408, 429) or response.status_code >= 500:
+            logger.error(f"Callback receiver {host} returned {response.status_code}, will retry")
+            return False
+
+        logger.error(f"Callback receiver {host} rejected notification with {response.status_code}, dropping it")
+        metrics.increment('CallbacksDropped')
+        return True
@@ -0,0 +1,80 @@
+import time
+import threading
+import logging
+from .metrics import metrics
+
+logger = logging.getLogger()
+
+CLOSED = 'CLOSED'
+OPEN = 'OPEN'
+HALF_OPEN = 'HALF_OPEN'
+# Emitted as the <Name>CircuitState metric
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout_seconds: float = 30, clock=time.monotonic,
+                 recorder=None):
+        self.name = name
+        self.recorder = recorder or metrics
+        self.metric_prefix = f"{name.capitalize()}Circuit"
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_seconds = reset_timeout_seconds
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.probe_in_flight = False
+        self.trips = 0
+        self.short_circuited = 0
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self.state == OPEN and self.clock() - self.opened_at >= self.reset_timeout_seconds:
+                self._transition(HALF_OPEN)
+            # Every invocation that uses the dependency reports the state it saw
+            self.recorder.gauge(f'{self.metric_prefix}State', STATE_VALUES[self.state])
+
+            if self.state == CLOSED:
+                return True
+
+            # Half-open lets exactly one probe through; everything else is short-circuited
+            if self.state == HALF_OPEN and not self.probe_in_flight:
+                self.probe_in_flight = True
+                return True
+
+            self.short_circuited += 1
+            self.recorder.increment(f'{self.metric_prefix}ShortCircuits')
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.probe_in_flight = False
+            if self.state != CLOSED:
+                self._transition(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.probe_in_flight = False
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self.opened_at = self.clock()
+                self.trips += 1
+                self.recorder.increment(f'{self.metric_prefix}Trips')
+                self._transition(OPEN)
+
+    def _transition(self, state: str):
+        logger.warning(f"Circuit breaker '{self.name}' changed state: {self.state} -> {state}")
+        self.state = state
+        self.recorder.gauge(f'{self.metric_prefix}State', STATE_VALUES[state])
+
+    def stats(self) -> dict:
+        return {
+            'name': self.name,
+            'state': self.state,
+            'failures': self.failures,
+            'trips': self.trips,
+            'short_circuited': self.short_circuited
+        }
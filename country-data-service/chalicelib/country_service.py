@@ -1,50 +1,258 @@
-import requests
+import os
+import json
+import time
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
 from chalice import NotFoundError
 from .queue_service import QueueService
 from .db_service import DynamoDBService
+from .cache import TTLCache
+from .alias_index import AliasIndex, normalize_alias
+from .search_index import CountrySearchIndex
+from .query_engine import CountryQueryEngine, extract_attributes
+from .redis_client import initialize_redis_client, redis_circuit_breaker
+from .utils import content_hash, project_fields
+from .metrics import metrics
+from .http_client import initialize_http_session, HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT
 
 logger = logging.getLogger()
 
+COUNTRY_CACHE_MAX_SIZE = int(os.environ.get('COUNTRY_CACHE_MAX_SIZE', 300))
+COUNTRY_CACHE_TTL_SECONDS = int(os.environ.get('COUNTRY_CACHE_TTL_SECONDS', 3600))
+COUNTRY_REDIS_CACHE_TTL_SECONDS = int(os.environ.get('COUNTRY_REDIS_CACHE_TTL_SECONDS', 86400))
+MAX_BULK_COUNTRIES = 300
+MAX_BULK_READ_COUNTRIES = 100
+BULK_CLAIM_CONCURRENCY = int(os.environ.get('BULK_CLAIM_CONCURRENCY', 16))
+SEARCH_INDEX_TTL_SECONDS = int(os.environ.get('SEARCH_INDEX_TTL_SECONDS', 3600))
+QUERY_ENGINE_TTL_SECONDS = int(os.environ.get('QUERY_ENGINE_TTL_SECONDS', 300))
+ALIAS_SNAPSHOT_PATH = os.environ.get(
+    'ALIAS_SNAPSHOT_PATH', os.path.join(os.path.dirname(__file__), 'data', 'country_aliases.json')
+)
+COUNTRY_CATALOG_PATH = os.environ.get(
+    'COUNTRY_CATALOG_PATH', os.path.join(os.path.dirname(__file__), 'data', 'country_catalog.json')
+)
+RESTCOUNTRIES_BASE_URL = os.environ.get('RESTCOUNTRIES_BASE_URL', 'https://restcountries.com/v3.1')
+
+class CountryNotFoundError(ValueError):
+    pass
+
+def load_alias_snapshot():
+    # The alias table as packaged by build_alias_snapshot.py, or None if it was not packaged
+    if not os.path.exists(ALIAS_SNAPSHOT_PATH):
+        return None
+    with open(ALIAS_SNAPSHOT_PATH, encoding='utf-8') as f:
+        aliases = json.load(f)
+    logger.info(f"Loaded {len(aliases)} aliases from snapshot: {ALIAS_SNAPSHOT_PATH}")
+    return aliases
+
+def load_country_catalog():
+    # Every name and code restcountries.com serves, as packaged by build_country_catalog.py
+    if not os.path.exists(COUNTRY_CATALOG_PATH):
+        return None
+    with open(COUNTRY_CATALOG_PATH, encoding='utf-8') as f:
+        aliases = json.load(f)
+    logger.info(f"Loaded {len(aliases)} aliases from country catalog: {COUNTRY_CATALOG_PATH}")
+    return aliases
+
 class CountryService:
-    def __init__(self, queue_url):
-        self.db_service = DynamoDBService()
-        self.queue_service = QueueService(queue_url)
-        self.country_data_fetcher = CountryDataFetcher()
+    def __init__(self, queue_url, callback_queue_url=None):
+        self.queue_url = queue_url
+        self.callback_queue_url = callback_queue_url
+        self.country_cache = TTLCache(COUNTRY_CACHE_MAX_SIZE, COUNTRY_CACHE_TTL_SECONDS)
+        self.search_index = None
+        self.search_index_built_at = 0
+        self.query_engine = None
+        self.query_engine_built_at = 0
+
+    # Clients are created on first use rather than at import, so a cold start only pays for
+    # the ones its invocation needs (the SQS worker never touches Redis or the queue client)
+    @cached_property
+    def db_service(self):
+        return DynamoDBService()
+
+    @cached_property
+    def queue_service(self):
+        return QueueService(self.queue_url)
+
+    @cached_property
+    def callback_queue_service(self):
+        return QueueService(self.callback_queue_url)
+
+    @cached_property
+    def country_data_fetcher(self):
+        return CountryDataFetcher()
+
+    @cached_property
+    def alias_index(self):
+        # Names in the packaged catalog resolve without a DynamoDB read
+        return AliasIndex(self.db_service, self.known_country_aliases)
+
+    @cached_property
+    def shared_cache(self):
+        redis_client = initialize_redis_client()
+        if redis_client is None:
+            return None
+        from .redis_cache import RedisCache
+        # Entries are [document, stored hash]
+        return RedisCache(redis_client, 'country-document', ttl_seconds=COUNTRY_REDIS_CACHE_TTL_SECONDS,
+                          circuit_breaker=redis_circuit_breaker)
+
+    @cached_property
+    def known_country_aliases(self):
+        # Every name and code in the packaged catalog and alias snapshot, loaded once per
+        # container. Without either, names are only checked for their shape.
+        catalog, aliases = load_country_catalog(), load_alias_snapshot()
+        if catalog is None and aliases is None:
+            return None
+        return {**(catalog or {}), **(aliases or {})}
+
+    @cached_property
+    def known_countries(self):
+        aliases = self.known_country_aliases
+        return frozenset(aliases) if aliases is not None else None
+
+    @cached_property
+    def suggestion_index(self):
+        # Names shared by several countries suggest none of them
+        return CountrySearchIndex({alias: country for alias, country in self.known_country_aliases.items() if country})
+
+    @cached_property
+    def negative_cache(self):
+        # In-process only when Redis is not configured
+        from .negative_cache import NegativeCache
+        return NegativeCache(initialize_redis_client(), circuit_breaker=redis_circuit_breaker)
+
+    @cached_property
+    def status_notifier(self):
+        redis_client = initialize_redis_client()
+        if redis_client is None:
+            return None
+        from .status_notifier import StatusNotifier
+        return StatusNotifier(redis_client, circuit_breaker=redis_circuit_breaker)
+
+    def prepare_worker(self):
+        # Resolves the worker's dependencies on the calling thread, before a batch fans out
+        # over the pool, so worker threads never race to create them
+        return (self.db_service, self.alias_index, self.country_data_fetcher, self.negative_cache,
+                self.status_notifier, self.callback_queue_service)
+
+    def prepare_claims(self):
+        # Resolves the service bulk claims share on the calling thread; its client is thread-safe
+        return self.db_service
 
     def standardize_country_identifier(self, country: str) -> str:
         return country.lower().replace(' ', '-')
 
-    # TODO: Future Improvement
-    # - Update database schema to include ISO alpha-2 and alpha-3 codes
-    # - Modify db_service to support querying by ISO codes
-    # - Update this method to handle ISO code inputs and check existence using multiple identifiers
-    def fetch_country_data(self, country):
+    def resolve_country_identifier(self, country: str) -> str:
+        # Maps ISO codes, official names and alternative spellings to the key the document is stored under
         country = self.standardize_country_identifier(country)
-        existing_data = self.db_service.get_country_data(country)
-        if existing_data:
+        return self.alias_index.resolve(country) or country
+
+    def resolve_country_identifiers(self, countries) -> dict:
+        standardized = list(dict.fromkeys(self.standardize_country_identifier(c) for c in countries))
+        resolved = self.alias_index.resolve_many(standardized)
+        return {country: resolved.get(country, country) for country in standardized}
+
+    def fetch_country_data(self, country, callback_url=None):
+        # A callback is only registered while the response is PENDING; any other status is final
+        country = self.resolve_country_identifier(country)
+        if self.country_cache.get(country) is not None:
             logger.info(f"Data already exists for country: {country}")
             return {"country": country, "status": "COMPLETED"}
+        if self.is_known_missing(country):
+            return {"country": country, "status": "NOT_FOUND"}
 
-        if self.db_service.is_operation_in_progress(country):
-            logger.info(f"Operation already in progress for country: {country}")
-            return {"country": country, "status": "PENDING"}
+        claimed, state = self.claim_fetch(country, callback_url)
+        if not claimed:
+            logger.info(f"Fetch operation for country: {country} has status: {state['status']}")
+            return {"country": country, "status": state['status']}
 
         logger.info(f"Fetching data for country: {country}")
 
-        self.db_service.save_operation_status(country, "PENDING")
-
         message_body = {
             'country': country
         }
-        self.queue_service.send_message(message_body)
+        try:
+            self.queue_service.send_message(message_body)
+        except Exception as e:
+            self.release_fetch_claim(country, f"Failed to enqueue fetch request: {e}")
+            raise
 
         logger.info(f"Sent message to queue for country: {country}")
 
         return {"country": country, "status": "PENDING"}
-    
-    # TODO: Future Improvement
-    # - Update this method to extract and save ISO codes when storing country data
+
+    def claim_fetch(self, country, callback_url=None):
+        # One conditional write decides who enqueues; everyone else gets the current state back,
+        # and joins the pending fetch with its callback
+        claimed, state = self.db_service.claim_fetch_operation(country, callback_url)
+        if not claimed and state['status'] == 'PENDING' and callback_url:
+            added, current = self.db_service.add_operation_callback(country, callback_url)
+            if not added:
+                state = current
+        return claimed, state
+
+    def release_fetch_claim(self, country, error):
+        # Fails a claimed fetch that never reached the queue, so the next caller can retry
+        # instead of waiting for the claim to go stale; callbacks already registered are told
+        callbacks = self.db_service.finish_fetch_operation(country, "FAILED", error)
+        self.publish_operation_status(country, "FAILED", callbacks, error)
+
+    def fetch_countries_data(self, countries, callback_url=None):
+        results = {}
+        to_check = []
+        for identifier, country in self.resolve_country_identifiers(countries).items():
+            if not self.validate_country_name(identifier):
+                results[identifier] = {"country": identifier, "status": "INVALID"}
+                suggestion = self.suggest_country_name(identifier)
+                if suggestion:
+                    results[identifier]["suggestion"] = suggestion
+            elif country in results or country in to_check:
+                continue
+            elif self.country_cache.get(country) is not None:
+                results[country] = {"country": country, "status": "COMPLETED"}
+            elif self.is_known_missing(country):
+                results[country] = {"country": country, "status": "NOT_FOUND"}
+            else:
+                to_check.append(country)
+
+        existing_data = self.db_service.batch_get_country_documents(to_check) if to_check else {}
+        for country, document in existing_data.items():
+            self.country_cache.set(country, document)
+            results[country] = {"country": country, "status": "COMPLETED"}
+
+        missing = [country for country in to_check if country not in existing_data]
+        to_enqueue = []
+        if missing:
+            # Claims are single conditional writes, so they go out concurrently
+            self.prepare_claims()
+            with ThreadPoolExecutor(max_workers=min(BULK_CLAIM_CONCURRENCY, len(missing))) as executor:
+                claims = list(executor.map(lambda country: self.claim_fetch(country, callback_url), missing))
+            for country, (claimed, state) in zip(missing, claims):
+                if claimed:
+                    to_enqueue.append(country)
+                else:
+                    results[country] = {"country": country, "status": state['status']}
+
+        if to_enqueue:
+            logger.info(f"Fetching data for {len(to_enqueue)} countries")
+            try:
+                failed = self.queue_service.send_message_batch([{'country': country} for country in to_enqueue])
+            except Exception as e:
+                for country in to_enqueue:
+                    self.release_fetch_claim(country, f"Failed to enqueue fetch request: {e}")
+                raise
+            failed_countries = {message['country'] for message in failed}
+            for country in failed_countries:
+                self.release_fetch_claim(country, "Failed to enqueue fetch request")
+
+            for country in to_enqueue:
+                status = "FAILED" if country in failed_countries else "PENDING"
+                results[country] = {"country": country, "status": status}
+
+        return results
+
     def fetch_and_save_country_data(self, country: str) -> bool:
         try:
             country = self.standardize_country_identifier(country)
@@ -52,44 +260,326 @@ class CountryService:
 
             country_data = self.country_data_fetcher.fetch_country_data(country)
             saved = self.db_service.save_country_data(country, country_data)
+            self.db_service.save_country_aliases(self.alias_index.register(country, country_data))
+            # The stored document carries its query row already
+            self.upsert_query_rows({country: country_data})
             
-            self.db_service.save_operation_status(country, "COMPLETED")
+            callbacks = self.db_service.finish_fetch_operation(country, "COMPLETED")
+            self.publish_operation_status(country, "COMPLETED", callbacks)
             logger.info(f"Successfully fetched and saved new data for country: {country}")
 
             return True
         except Exception as e:
             logger.error(f"Failed to fetch and save data for country: {country}, error: {str(e)}")
-            self.db_service.save_operation_status(country, "FAILED", str(e))
+            if isinstance(e, CountryNotFoundError):
+                self.negative_cache.add(country)
+            callbacks = self.db_service.finish_fetch_operation(country, "FAILED", str(e))
+            self.publish_operation_status(country, "FAILED", callbacks, str(e))
             return False
 
-    def get_country_data(self, country):
-        country = self.standardize_country_identifier(country)
+    def is_known_missing(self, country: str) -> bool:
+        # Upstream recently answered 404 for this name; nothing is claimed or enqueued
+        if not self.negative_cache.contains(country):
+            return False
+        logger.info(f"Negative cache hit for country: {country}")
+        metrics.increment('NegativeCacheHits')
+        return True
+
+    def publish_operation_status(self, country: str, status: str, callbacks=(), error=None):
+        # Wakes /status requests waiting on this country
+        if self.status_notifier is not None:
+            self.status_notifier.publish(country, status)
+        if callbacks:
+            self.enqueue_callbacks(country, status, callbacks, error)
+
+    def enqueue_callbacks(self, country: str, status: str, callbacks, error=None):
+        # Deliveries go through their own queue so a slow receiver never holds up a data fetch
+        from .callback_delivery import callback_message
+        if not self.callback_queue_url:
+            logger.error(f"No callback queue configured, dropping {len(callbacks)} callbacks for country: {country}")
+            metrics.increment('CallbacksDropped', len(callbacks))
+            return
+        timestamp = int(time.time() * 1000)
+        messages = [callback_message(url, country, status, timestamp, error) for url in callbacks]
+        try:
+            failed = self.callback_queue_service.send_message_batch(messages)
+        except Exception as e:
+            logger.error(f"Failed to enqueue {len(messages)} callbacks for country: {country}, error: {str(e)}")
+            failed = messages
+        if failed:
+            metrics.increment('CallbacksDropped', len(failed))
+
+    def sync_all_countries(self, max_write_capacity_per_second=None, dry_run=False):
+        logger.info("Syncing full country catalog")
+        documents = {}
+        skipped = 0
+        for country_data in self.country_data_fetcher.fetch_all_countries():
+            name = (country_data.get('name') or {}).get('common')
+            if not name:
+                skipped += 1
+                continue
+            documents[self.standardize_country_identifier(name)] = country_data
+
+        # Keep documents under the key they were first stored with, if it differs from the common name
+        resolved = self.alias_index.resolve_many(documents.keys())
+        documents = {resolved.get(country, country): country_data for country, country_data in documents.items()}
+
+        existing_hashes = self.db_service.get_country_hashes()
+        changed = {
+            country: country_data
+            for country, country_data in documents.items()
+            if existing_hashes.get(country) != content_hash(country_data)
+        }
+        # Also backfills rows of documents stored before they carried one
+        existing_rows = self.db_service.get_country_attributes()
+        changed_rows = {
+            country: country_data
+            for country, country_data in documents.items()
+            if existing_rows.get(country) != extract_attributes(country_data)
+        }
+
+        # Diffed against the table rather than derived from the changed documents, so aliases
+        # an interrupted run did not get to write are written by the next one
+        existing_aliases = self.db_service.get_all_country_aliases()
+        aliases = {}
+        for country, country_data in documents.items():
+            registered = self.alias_index.register(country, country_data)
+            aliases.update((alias, key) for alias, key in registered.items() if existing_aliases.get(alias) != key)
+
+        if aliases and not dry_run:
+            self.db_service.save_country_aliases(aliases, max_write_capacity_per_second)
+        if changed and not dry_run:
+            self.db_service.batch_save_country_data(changed, max_write_capacity_per_second)
+            # Completes any fetch still pending for these countries. A fetch an interrupted run
+            # left pending is completed by its queued message, which only adds aliases and status.
+            callbacks = self.db_service.batch_finish_fetch_operations(list(changed), "COMPLETED",
+                                                                      max_write_capacity_per_second)
+            for country in changed:
+                self.country_cache.invalidate(country)
+                if self.shared_cache is not None:
+                    self.shared_cache.invalidate(country)
+                self.negative_cache.invalidate(country)
+                self.publish_operation_status(country, "COMPLETED", callbacks.get(country, ()))
+        if changed_rows and not dry_run:
+            # Documents written above already carry their row
+            backfill = {
+                country: extract_attributes(country_data)
+                for country, country_data in changed_rows.items()
+                if country not in changed
+            }
+            if backfill:
+                self.db_service.save_country_attributes(backfill, max_write_capacity_per_second)
+            self.upsert_query_rows(changed_rows)
+        if not dry_run:
+            self.db_service.delete_legacy_attributes_item()
+
+        result = {
+            'fetched': len(documents),
+            'changed': len(changed),
+            'unchanged': len(documents) - len(changed),
+            'skipped': skipped,
+            'dry_run': dry_run
+        }
+        logger.info(f"Country catalog sync result: {result}")
+        return result
+
+    def get_country_document(self, country, fields=None):
+        # The document (projected to fields if given) and its ETag
+        country = self.resolve_country_identifier(country)
         logger.info(f"Getting data for country: {country}")
 
-        country_data = self.db_service.get_country_data(country)
+        document = self.get_stored_document(country, fields)
 
-        if not country_data:
+        if document is None:
             raise NotFoundError(f"Country data for '{country}' not found")
 
         logger.info(f"Successfully retrieved data for country: {country}")
-        return country_data
+        country_data, data_hash = document
+        return country_data, self.document_etag(data_hash, fields)
 
-    def check_operation_status(self, country):
-        country = self.standardize_country_identifier(country)
+    def get_country_data(self, country, fields=None):
+        return self.get_country_document(country, fields)[0]
+
+    def get_stored_document(self, country: str, fields=None):
+        # Expects an already standardized identifier. Returns the document with the hash it was
+        # stored under; documents are cached decoded, together with that hash.
+        cached = self.country_cache.get(country)
+        if cached is not None:
+            logger.info(f"Cache hit for country: {country}")
+            country_data, data_hash = cached
+            return (project_fields(country_data, fields) if fields else country_data), data_hash
+
+        if fields:
+            # Only the requested fields are read, and partial documents are not cached
+            return self.db_service.get_country_document(country, fields)
+
+        if self.shared_cache is not None:
+            document = self.shared_cache.get_or_load(country, lambda: self.db_service.get_country_document(country))
+        else:
+            document = self.db_service.get_country_document(country)
+
+        if document:
+            country_data, data_hash = document
+            self.country_cache.set(country, (country_data, data_hash))
+            self.alias_index.register(country, country_data)
+            return country_data, data_hash
+        return None
+
+    def document_etag(self, data_hash, fields=None) -> str:
+        # The hash stored with the document, so nothing is hashed per request. A projection
+        # is identified by that hash and the requested fields.
+        if not fields:
+            return data_hash
+        return content_hash({'data_hash': data_hash, 'fields': fields})
+
+    def get_countries_document(self, countries, fields=None):
+        # The combined result and its ETag, derived from the stored per-document hashes
+        countries = list(dict.fromkeys(self.resolve_country_identifiers(countries).values()))
+        logger.info(f"Getting data for {len(countries)} countries")
+
+        found = {}
+        hashes = {}
+        to_load = []
+        for country in countries:
+            cached = self.country_cache.get(country)
+            if cached is not None:
+                country_data, hashes[country] = cached
+                found[country] = project_fields(country_data, fields) if fields else country_data
+            else:
+                to_load.append(country)
+
+        if to_load:
+            for country, (country_data, data_hash) in self.db_service.batch_get_country_documents(to_load, fields).items():
+                if not fields:
+                    self.country_cache.set(country, (country_data, data_hash))
+                    self.alias_index.register(country, country_data)
+                found[country] = country_data
+                hashes[country] = data_hash
+
+        missing = [country for country in countries if country not in found]
+        result = {"countries": found, "missing": missing}
+        parts = [[country, hashes[country]] for country in found]
+        return result, content_hash({'countries': parts, 'missing': missing, 'fields': fields})
+
+    def get_search_index(self):
+        # Built once per container (and refreshed hourly) so queries never touch DynamoDB
+        if self.search_index is None or time.monotonic() - self.search_index_built_at > SEARCH_INDEX_TTL_SECONDS:
+            # The packaged catalog, falling back to one scan of the alias table without it
+            aliases = self.known_country_aliases
+            if aliases is None:
+                aliases = self.db_service.get_all_country_aliases()
+            aliases = {alias: country for alias, country in aliases.items() if country}
+
+            # Include aliases this container has learned since the snapshot was taken
+            aliases.update(self.alias_index.aliases)
+            self.search_index = CountrySearchIndex(aliases)
+            self.search_index_built_at = time.monotonic()
+            logger.info(f"Built search index with {len(self.search_index)} aliases")
+        return self.search_index
+
+    def search_countries(self, query: str, limit: int = 10):
+        query = normalize_alias(query)
+        logger.info(f"Searching countries for: {query}")
+        return {"query": query, "results": self.get_search_index().search(query, limit)}
+
+    def upsert_query_rows(self, countries_data):
+        # Keep this container's engine current without waiting for the next reload
+        if self.query_engine is not None:
+            self.query_engine.upsert({country: extract_attributes(country_data) for country, country_data in countries_data.items()})
+
+    def get_query_engine(self):
+        # Loaded with one projected scan per container and reloaded periodically to pick up other writers
+        if self.query_engine is None or time.monotonic() - self.query_engine_built_at > QUERY_ENGINE_TTL_SECONDS:
+            self.query_engine = CountryQueryEngine(self.db_service.get_country_attributes())
+            self.query_engine_built_at = time.monotonic()
+            logger.info(f"Built query engine with {len(self.query_engine)} countries")
+        return self.query_engine
+
+    def query_countries(self, filters=None, ranges=None, sort='name', descending=False, offset=0, limit=25):
+        logger.info(f"Querying countries with filters: {filters}, ranges: {ranges}, sort: {sort}")
+        return self.get_query_engine().query(filters, ranges, sort, descending, offset, limit)
+
+    def check_operation_status(self, country, wait_seconds=0):
+        country = self.resolve_country_identifier(country)
         logger.info(f"Checking operation status for country: {country}")
         status = self.db_service.get_operation_status(country)
         if not status:
             raise NotFoundError(f"No operation found for country '{country}'")
+
+        if status['status'] == 'PENDING' and wait_seconds and self.status_notifier is not None:
+            # Holds the request until the worker signals through Redis; DynamoDB is only read
+            # again once the signal arrives, so one long poll replaces many short ones
+            with metrics.timer('StatusWait'):
+                signal = self.status_notifier.wait(country, status['timestamp'], wait_seconds)
+            if signal is not None:
+                status = self.db_service.get_operation_status(country) or status
+
         logger.info(f"Operation status for country: {country} is: {status['status']}")
         return status
 
     def validate_country_name(self, country: str) -> bool:
-        # Country name should be more than 3 letters and only contain letters and hyphens
-        return len(country) > 3 and all(c.isalpha() or c == '-' for c in country)
+        # Country name should be more than 3 letters and only contain letters and hyphens,
+        # or be a known ISO code (alpha-2, alpha-3 or numeric)
+        if len(country) > 3:
+            if not all(c.isalpha() or c == '-' for c in country):
+                return False
+        elif len(country) < 2 or not country.isalnum():
+            return False
+
+        if self.known_countries is not None:
+            # Rejects unknown names before they reach DynamoDB, SQS or upstream. Countries added
+            # upstream since the catalog was built pass once this container has learned their aliases.
+            country = normalize_alias(country)
+            return country in self.known_countries or country in self.alias_index.aliases
+        return len(country) > 3 or self.alias_index.resolve(country) is not None
+
+    def suggest_country_name(self, country: str):
+        # The closest known country to a rejected name, if there is one
+        if self.known_countries is None:
+            return None
+        matches = self.suggestion_index.search(normalize_alias(country), 1)
+        return matches[0]['country'] if matches else None
 
 class CountryDataFetcher:
-    def __init__(self):
-        self.base_url = "https://restcountries.com/v3.1"
+    def __init__(self, session=None, base_url=None, timeout=None):
+        # The session and base URL are injectable so a local stub can stand in for restcountries.com
+        self._session = session
+        self.base_url = base_url or RESTCOUNTRIES_BASE_URL
+        self.timeout = timeout or (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+
+    @property
+    def session(self):
+        if self._session is None:
+            self._session = initialize_http_session()
+        return self._session
+
+    def record_retries(self, response, outcome):
+        # urllib3 keeps the attempts it retried on the response; 429s among them were throttled.
+        # Injected sessions need not be urllib3-backed, so anything else counts as no retries.
+        retries = getattr(getattr(response, 'raw', None), 'retries', None)
+        history = getattr(retries, 'history', ())
+        if not isinstance(history, tuple):
+            history = ()
+        outcome['retries'] = len(history)
+        outcome['throttled'] = response.status_code == 429 or any(attempt.status == 429 for attempt in history)
+
+    def fetch_all_countries(self, fields=None):
+        # fields limits each country to those top-level fields, e.g. ('name', 'cca2')
+        logger.info("Fetching data for all countries")
+
+        url = f"{self.base_url}/all"
+        if fields:
+            url += f"?fields={','.join(fields)}"
+        with metrics.timer('Upstream') as outcome:
+            response = self.session.get(url, timeout=self.timeout)
+            self.record_retries(response, outcome)
+            response.raise_for_status()
+        data = response.json()
+
+        if not isinstance(data, list) or not data:
+            raise ValueError("No data returned for all countries")
+        logger.info(f"Successfully fetched data for {len(data)} countries")
+        return data
 
     def fetch_country_data(self, country: str):
         logger.info(f"Fetching data for country: {country}")
@@ -97,12 +587,17 @@ class CountryDataFetcher:
         country = country.replace('-', ' ').strip()
         url = f"{self.base_url}/name/{country}?fullText=true"
 
-        response = requests.get(url)
-        response.raise_for_status()
+        with metrics.timer('Upstream') as outcome:
+            response = self.session.get(url, timeout=self.timeout)
+            self.record_retries(response, outcome)
+            if response.status_code != 404:
+                response.raise_for_status()
+        if response.status_code == 404:
+            raise CountryNotFoundError(f"No data found for country: {country}")
         data = response.json()
 
         if isinstance(data, list) and len(data) > 0:
             logger.info(f"Successfully fetched data for country: {country}")
             return data[0]  # Return only the first match
         else:
-            raise ValueError(f"No data found for country: {country}")
+            raise CountryNotFoundError(f"No data found for country: {country}")
@@ -1,40 +1,67 @@
-import boto3
 import os
 import time
 from botocore.exceptions import ClientError
-from boto3.dynamodb.conditions import Key
 import json
 import logging
-from .utils import float_to_decimal, DecimalEncoder
+from .utils import float_to_decimal, DecimalEncoder, chunks, content_hash, boto3_client_lock
+from .storage_format import encode_country_item, decode_country_item, FORMAT_COMPRESSED
+from .metrics import metrics, instrument_client
 
 
 logger = logging.getLogger()
 
+BATCH_GET_MAX_KEYS = 100
+BATCH_WRITE_MAX_ITEMS = 25
+BATCH_MAX_RETRIES = 5
+
+# Per-country state item in the operation status table. Its sort key is larger than any
+# real timestamp, so a newest-first Query returns it before the history rows. Status reads
+# are a GetItem of this item; the history rows are only kept for auditing.
+LATEST_STATUS_TIMESTAMP = 9999999999999
+# History rows carry an 'expires_at' epoch (DynamoDB TTL) this long after they are written
+STATUS_HISTORY_TTL_SECONDS = int(os.environ.get('STATUS_HISTORY_TTL_DAYS', 30)) * 86400
+# A PENDING claim older than this is considered abandoned and can be claimed again
+STALE_PENDING_MILLISECONDS = int(os.environ.get('STALE_PENDING_SECONDS', 900)) * 1000
+
+# Key of the item that held every country's attribute row before the rows moved onto the
+# document items. '#' never appears in a country key.
+LEGACY_ATTRIBUTES_ITEM_KEY = '#attributes'
+
+COUNTRY_TABLE = 'country-data-service-country-data'
+# Sparse index of the country table keyed on 'attributes_hash', projecting only 'attributes'
+COUNTRY_ATTRIBUTES_INDEX = 'country-attributes'
+OPERATION_TABLE = 'country-data-service-operation-status'
+ALIAS_TABLE = 'country-data-service-country-aliases'
+
 dynamo_db_client = None
 
 def initialize_dynamodb_client():
     global dynamo_db_client
 
     if dynamo_db_client is None:
-        try:
-            dynamo_db_client = boto3.resource('dynamodb')
-        except ClientError as err:
-            raise
+        with boto3_client_lock:
+            if dynamo_db_client is None:
+                # boto3 is imported on first use so it stays off the import path of a cold start
+                import boto3
+                resource = boto3.resource('dynamodb')
+                instrument_client(resource.meta.client, 'DynamoDB')
+                dynamo_db_client = resource
 
     return dynamo_db_client
 
 
 class DynamoDBService:
-    def __init__(self):
-        self.dynamodb = initialize_dynamodb_client()
-        self.country_table = self.dynamodb.Table('country-data-service-country-data')
-        self.operation_table = self.dynamodb.Table('country-data-service-operation-status')
+    def __init__(self, dynamodb=None):
+        # Every call goes through the resource's client: unlike Table resources it is thread-safe,
+        # and the SQS worker calls in from a thread pool. It still takes and returns plain Python
+        # values, because boto3 registers the resource's serialization handlers on it.
+        self.dynamodb = dynamodb or initialize_dynamodb_client()
+        self.client = self.dynamodb.meta.client
 
     def save_country_data(self, country, data):
         try:
-            decimal_data = float_to_decimal(data)
-            self.country_table.put_item(
-                Item={'country': country, 'data': decimal_data},
+            self.client.put_item(TableName=COUNTRY_TABLE,
+                Item=encode_country_item(country, data),
                 ConditionExpression='attribute_not_exists(country)'
             )
             logger.info(f"Saved new data for country: {country}")
@@ -47,13 +74,41 @@ class DynamoDBService:
                 logger.error(f"Error saving country data: {e}")
                 raise
 
-    def get_country_data(self, country):
+    def projection_kwargs(self, fields):
+        # Projects parsed field paths of a map-format document. Compressed documents can only be
+        # read whole, so their blob is projected and the fields are applied after decoding.
+        # The key is always projected, so an item whose document has none of the fields is
+        # still distinguishable from a missing one, and so is the hash of the whole document.
+        names = {'#data': 'data'}
+        placeholders = {}
+        expressions = ['country', 'data_hash', 'data_blob']
+        for path in fields:
+            segments = ['#data']
+            for key in path:
+                if key not in placeholders:
+                    placeholders[key] = f'#f{len(placeholders)}'
+                    names[placeholders[key]] = key
+                segments.append(placeholders[key])
+            expressions.append('.'.join(segments))
+        return {'ProjectionExpression': ', '.join(expressions), 'ExpressionAttributeNames': names}
+
+    def decode_document(self, item, fields=None):
+        # (document, hash of the whole stored document), or None if the item holds no document.
+        # Items written before the hash was stored are hashed here.
+        country_data = decode_country_item(item, fields)
+        if country_data is None:
+            return None
+        return country_data, item.get('data_hash') or content_hash(country_data)
+
+    def get_country_document(self, country, fields=None):
         try:
-            response = self.country_table.get_item(Key={'country': country})
-            item = response.get('Item', {})
-            if 'data' in item:
+            projection = self.projection_kwargs(fields) if fields else {}
+            response = self.client.get_item(TableName=COUNTRY_TABLE, Key={'country': country}, **projection)
+            item = response.get('Item')
+            document = self.decode_document(item, fields) if item else None
+            if document is not None:
                 logger.info(f"Retrieved data for country: {country}")
-                return json.loads(json.dumps(item['data'], cls=DecimalEncoder))
+                return document
 
             logger.info(f"No data found for country: {country}")
             return None
@@ -61,34 +116,390 @@ class DynamoDBService:
             logger.error(f"Error getting country data: {e}")
             raise
 
-    def save_operation_status(self, country, status, error=None):
+    def get_country_data(self, country, fields=None):
+        document = self.get_country_document(country, fields)
+        return document[0] if document else None
+
+    def batch_get_items(self, table, key_name, keys, **kwargs):
+        # BatchGetItem in chunks of 100 keys, retrying unprocessed keys with backoff
+        items = []
+        for batch in chunks(list(keys), BATCH_GET_MAX_KEYS):
+            request_items = {table: dict(kwargs, Keys=[{key_name: key} for key in batch])}
+            for attempt in range(BATCH_MAX_RETRIES + 1):
+                response = self.client.batch_get_item(RequestItems=request_items)
+                items.extend(response.get('Responses', {}).get(table, []))
+
+                request_items = response.get('UnprocessedKeys')
+                if not request_items:
+                    break
+                logger.info(f"Retrying {len(request_items[table]['Keys'])} unprocessed keys")
+                metrics.increment('DynamoDBRetries')
+                time.sleep(min(0.05 * 2 ** attempt, 1))
+            else:
+                raise RuntimeError(f"Unprocessed keys remained after {BATCH_MAX_RETRIES} retries")
+        return items
+
+    def batch_put_items(self, table, items, max_write_capacity_per_second=None):
+        return self.batch_write_items(table, [{'PutRequest': {'Item': item}} for item in items], max_write_capacity_per_second)
+
+    def batch_delete_items(self, table, keys, max_write_capacity_per_second=None):
+        return self.batch_write_items(table, [{'DeleteRequest': {'Key': key}} for key in keys], max_write_capacity_per_second)
+
+    def batch_write_items(self, table, write_requests, max_write_capacity_per_second=None):
+        # BatchWriteItem in chunks of 25, retrying unprocessed items with backoff. When a capacity
+        # budget is given, batches are paced by the consumed WCU so the provisioned table is not throttled.
+        write_requests = list(write_requests)
+        for batch in chunks(write_requests, BATCH_WRITE_MAX_ITEMS):
+            request_items = {table: batch}
+            for attempt in range(BATCH_MAX_RETRIES + 1):
+                started = time.monotonic()
+                response = self.client.batch_write_item(RequestItems=request_items, ReturnConsumedCapacity='TOTAL')
+
+                if max_write_capacity_per_second:
+                    consumed = sum(c.get('CapacityUnits', 0) for c in response.get('ConsumedCapacity', []))
+                    remaining = consumed / max_write_capacity_per_second - (time.monotonic() - started)
+                    if remaining > 0:
+                        time.sleep(remaining)
+
+                request_items = response.get('UnprocessedItems')
+                if not request_items:
+                    break
+                logger.info(f"Retrying {len(request_items[table])} unprocessed items")
+                metrics.increment('DynamoDBRetries')
+                time.sleep(min(0.05 * 2 ** attempt, 1))
+            else:
+                raise RuntimeError(f"Unprocessed items remained after {BATCH_MAX_RETRIES} retries")
+        return len(write_requests)
+
+    def batch_get_country_documents(self, countries, fields=None):
+        try:
+            projection = self.projection_kwargs(fields) if fields else {}
+            items = self.batch_get_items(COUNTRY_TABLE, 'country', countries, **projection)
+        except ClientError as e:
+            logger.error(f"Error batch getting country data: {e}")
+            raise
+
+        found = {}
+        for item in items:
+            document = self.decode_document(item, fields)
+            if document is not None:
+                found[item['country']] = document
+        logger.info(f"Batch retrieved data for {len(found)} of {len(countries)} countries")
+        return found
+
+    def batch_save_country_data(self, countries_data, max_write_capacity_per_second=None):
+        # Unlike save_country_data this overwrites existing items
+        items = [encode_country_item(country, data) for country, data in countries_data.items()]
+        try:
+            self.batch_put_items(COUNTRY_TABLE, items, max_write_capacity_per_second)
+        except ClientError as e:
+            logger.error(f"Error batch saving country data: {e}")
+            raise
+
+        logger.info(f"Batch saved data for {len(items)} countries")
+        return len(items)
+
+    def migrate_country_items(self, format_version=FORMAT_COMPRESSED, max_write_capacity_per_second=None, dry_run=False):
+        # Rewrites every country item not yet stored in the given format, one scan page at a time
+        from boto3.dynamodb.conditions import Attr
+        if format_version == FORMAT_COMPRESSED:
+            needs_migration = Attr('data_blob').not_exists() & Attr('data').exists()
+        else:
+            needs_migration = Attr('data_blob').exists()
+
+        result = {'migrated': 0, 'format_version': format_version, 'dry_run': dry_run}
+        try:
+            scan_kwargs = {'FilterExpression': needs_migration}
+            while True:
+                response = self.client.scan(TableName=COUNTRY_TABLE, **scan_kwargs)
+                items = [
+                    encode_country_item(item['country'], decode_country_item(item), format_version)
+                    for item in response.get('Items', [])
+                ]
+                if items and not dry_run:
+                    self.batch_put_items(COUNTRY_TABLE, items, max_write_capacity_per_second)
+                result['migrated'] += len(items)
+                if 'LastEvaluatedKey' not in response:
+                    break
+                scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        except ClientError as e:
+            logger.error(f"Error migrating country items: {e}")
+            raise
+
+        logger.info(f"Country item migration result: {result}")
+        return result
+
+    def get_country_alias(self, alias):
+        try:
+            response = self.client.get_item(TableName=ALIAS_TABLE, Key={'alias': alias})
+            item = response.get('Item')
+            return item['country'] if item else None
+        except ClientError as e:
+            logger.error(f"Error getting country alias: {e}")
+            raise
+
+    def batch_get_country_aliases(self, aliases):
+        try:
+            items = self.batch_get_items(ALIAS_TABLE, 'alias', aliases)
+        except ClientError as e:
+            logger.error(f"Error batch getting country aliases: {e}")
+            raise
+        return {item['alias']: item['country'] for item in items}
+
+    def get_all_country_aliases(self):
+        try:
+            aliases = {}
+            scan_kwargs = {'ProjectionExpression': 'alias, country'}
+            while True:
+                response = self.client.scan(TableName=ALIAS_TABLE, **scan_kwargs)
+                for item in response.get('Items', []):
+                    aliases[item['alias']] = item['country']
+                if 'LastEvaluatedKey' not in response:
+                    logger.info(f"Scanned {len(aliases)} country aliases")
+                    return aliases
+                scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        except ClientError as e:
+            logger.error(f"Error scanning country aliases: {e}")
+            raise
+
+    def save_country_aliases(self, aliases, max_write_capacity_per_second=None):
+        # aliases maps each alias to the key its country document is stored under
+        items = [{'alias': alias, 'country': country} for alias, country in aliases.items()]
+        try:
+            self.batch_put_items(ALIAS_TABLE, items, max_write_capacity_per_second)
+        except ClientError as e:
+            logger.error(f"Error saving country aliases: {e}")
+            raise
+
+        logger.info(f"Saved {len(items)} country aliases")
+        return len(items)
+
+    def get_country_hashes(self):
+        try:
+            hashes = {}
+            scan_kwargs = {'ProjectionExpression': 'country, data_hash'}
+            while True:
+                response = self.client.scan(TableName=COUNTRY_TABLE, **scan_kwargs)
+                for item in response.get('Items', []):
+                    if item['country'] != LEGACY_ATTRIBUTES_ITEM_KEY:
+                        hashes[item['country']] = item.get('data_hash')
+                if 'LastEvaluatedKey' not in response:
+                    return hashes
+                scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        except ClientError as e:
+            logger.error(f"Error scanning country hashes: {e}")
+            raise
+
+    def get_country_attributes(self):
+        # Scans the attributes index, whose items hold only the key and the query row, so a
+        # reload reads a few hundred bytes per country instead of the whole document item
+        try:
+            rows = {}
+            for items in self.scan_pages(COUNTRY_TABLE, IndexName=COUNTRY_ATTRIBUTES_INDEX,
+                                         ProjectionExpression='country, #attributes',
+                                         ExpressionAttributeNames={'#attributes': 'attributes'}):
+                for item in items:
+                    if 'attributes' in item:
+                        rows[item['country']] = item['attributes']
+            logger.info(f"Retrieved attributes for {len(rows)} countries")
+            return json.loads(json.dumps(rows, cls=DecimalEncoder))
+        except ClientError as e:
+            logger.error(f"Error getting country attributes: {e}")
+            raise
+
+    def save_country_attributes(self, rows, max_write_capacity_per_second=None):
+        # Backfills the query row of documents stored without one; documents written since
+        # carry it already. Rows of countries with no stored document are skipped.
+        saved = 0
+        try:
+            for country, row in rows.items():
+                started = time.monotonic()
+                try:
+                    response = self.client.update_item(TableName=COUNTRY_TABLE,
+                        Key={'country': country},
+                        UpdateExpression='SET #attributes = :row, attributes_hash = :hash',
+                        ConditionExpression='attribute_exists(country)',
+                        ExpressionAttributeNames={'#attributes': 'attributes'},
+                        ExpressionAttributeValues={':row': float_to_decimal(row), ':hash': content_hash(row)},
+                        ReturnConsumedCapacity='TOTAL'
+                    )
+                    saved += 1
+                except ClientError as e:
+                    if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                        raise
+                    logger.info(f"No document stored for country: {country}, skipping its attributes")
+                    continue
+
+                if max_write_capacity_per_second:
+                    consumed = response.get('ConsumedCapacity', {}).get('CapacityUnits', 0)
+                    remaining = consumed / max_write_capacity_per_second - (time.monotonic() - started)
+                    if remaining > 0:
+                        time.sleep(remaining)
+        except ClientError as e:
+            logger.error(f"Error saving country attributes: {e}")
+            raise
+
+        logger.info(f"Saved attributes for {saved} countries")
+        return saved
+
+    def delete_legacy_attributes_item(self):
+        # Rows used to live together in one aggregated item of the country table
+        try:
+            self.client.delete_item(TableName=COUNTRY_TABLE, Key={'country': LEGACY_ATTRIBUTES_ITEM_KEY})
+        except ClientError as e:
+            logger.error(f"Error deleting legacy attributes item: {e}")
+            raise
+
+    def history_item(self, country, status, timestamp, error=None):
+        item = {
+            'country': country,
+            'timestamp': timestamp,
+            'status': status,
+            'expires_at': timestamp // 1000 + STATUS_HISTORY_TTL_SECONDS
+        }
+        if error:
+            item['error'] = error
+        return item
+
+    def update_status_state(self, country, status, timestamp, error=None):
+        update_expression = 'SET #status = :status, status_timestamp = :timestamp'
+        expression_values = {':status': status, ':timestamp': timestamp}
+        removed = []
+        if error:
+            update_expression += ', #error = :error'
+            expression_values[':error'] = error
+        else:
+            removed.append('#error')
+        # The old values of the updated attributes include the callbacks this write removed
+        removed.append('callbacks')
+        update_expression += ' REMOVE ' + ', '.join(removed)
+
+        response = self.client.update_item(TableName=OPERATION_TABLE,
+            Key={'country': country, 'timestamp': LATEST_STATUS_TIMESTAMP},
+            UpdateExpression=update_expression,
+            ExpressionAttributeNames={'#status': 'status', '#error': 'error'},
+            ExpressionAttributeValues=expression_values,
+            ReturnValues='UPDATED_OLD'
+        )
+        return sorted(response.get('Attributes', {}).get('callbacks', ()))
+
+    def finish_fetch_operation(self, country, status, error=None):
+        # Records the final status of a claimed fetch and hands back the callback URLs registered
+        # while it was pending. They are removed by the same write, so each is notified once.
         try:
             timestamp = int(time.time() * 1000)
-            item = {
-                'country': country,
-                'timestamp': timestamp,
-                'status': status
-            }
-            if error:
-                item['error'] = error
-            self.operation_table.put_item(Item=item)
-            logger.info(f"Saved operation status for country: {country}, status: {status}, timestamp: {timestamp}")
-            return True
+            self.client.put_item(TableName=OPERATION_TABLE, Item=self.history_item(country, status, timestamp, error))
+            callbacks = self.update_status_state(country, status, timestamp, error)
+            logger.info(f"Finished fetch operation for country: {country}, status: {status}, callbacks: {len(callbacks)}")
+            return callbacks
         except ClientError as e:
-            logger.error(f"Error saving operation status: {e}")
+            logger.error(f"Error finishing fetch operation: {e}")
+            raise
+
+    def claim_fetch_operation(self, country, callback_url=None):
+        # Claims the fetch for a country with one conditional write on its state item.
+        # Returns (True, new state) for the winner, or (False, current state) for everyone else.
+        timestamp = int(time.time() * 1000)
+        update_expression = 'SET #status = :pending, status_timestamp = :timestamp REMOVE #error'
+        expression_values = {
+            ':pending': 'PENDING',
+            ':failed': 'FAILED',
+            ':timestamp': timestamp,
+            ':stale_before': timestamp - STALE_PENDING_MILLISECONDS
+        }
+        if callback_url:
+            update_expression += ' ADD callbacks :callback'
+            expression_values[':callback'] = {callback_url}
+        try:
+            self.client.update_item(TableName=OPERATION_TABLE,
+                Key={'country': country, 'timestamp': LATEST_STATUS_TIMESTAMP},
+                UpdateExpression=update_expression,
+                ConditionExpression='attribute_not_exists(country) OR #status = :failed '
+                                    'OR (#status = :pending AND status_timestamp < :stale_before)',
+                ExpressionAttributeNames={'#status': 'status', '#error': 'error'},
+                ExpressionAttributeValues=expression_values,
+                ReturnValuesOnConditionCheckFailure='ALL_OLD'
+            )
+            logger.info(f"Claimed fetch operation for country: {country}")
+            return True, {'country': country, 'timestamp': timestamp, 'status': 'PENDING'}
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                logger.error(f"Error claiming fetch operation: {e}")
+                raise
+            current = self.from_old_item(e)
+            logger.info(f"Fetch operation for country: {country} already claimed, status: {current.get('status')}")
+            return False, current
+
+    def add_operation_callback(self, country, callback_url):
+        # Registers a callback on a fetch that is still pending. Returns (True, None), or
+        # (False, current state) if the fetch finished first and there is nothing left to wait for.
+        try:
+            self.client.update_item(TableName=OPERATION_TABLE,
+                Key={'country': country, 'timestamp': LATEST_STATUS_TIMESTAMP},
+                UpdateExpression='ADD callbacks :callback',
+                ConditionExpression='#status = :pending',
+                ExpressionAttributeNames={'#status': 'status'},
+                ExpressionAttributeValues={':callback': {callback_url}, ':pending': 'PENDING'},
+                ReturnValuesOnConditionCheckFailure='ALL_OLD'
+            )
+            logger.info(f"Added callback to fetch operation for country: {country}")
+            return True, None
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                logger.error(f"Error adding operation callback: {e}")
+                raise
+            return False, self.from_old_item(e)
+
+    def from_old_item(self, error):
+        # Error responses are not deserialized by the resource layer
+        from boto3.dynamodb.types import TypeDeserializer
+        type_deserializer = TypeDeserializer()
+        old_item = error.response.get('Item') or {}
+        return self.from_state_item({key: type_deserializer.deserialize(value) for key, value in old_item.items()})
+
+    def from_state_item(self, item):
+        # Present the state item like a history row, with its real timestamp
+        # Callback URLs are only for the worker and are never returned to clients
+        if item and item.get('timestamp') == LATEST_STATUS_TIMESTAMP:
+            item = dict(item)
+            item['timestamp'] = item.pop('status_timestamp', None)
+            item.pop('callbacks', None)
+        return item
+
+    def batch_finish_fetch_operations(self, countries, status, max_write_capacity_per_second=None):
+        # History rows are written in batches. State items are updated in place, never put over,
+        # so callbacks registered on a pending fetch are released rather than lost. Returns the
+        # released callback URLs of each country that had any.
+        countries = list(countries)
+        try:
+            timestamp = int(time.time() * 1000)
+            history = [self.history_item(country, status, timestamp) for country in countries]
+            self.batch_put_items(OPERATION_TABLE, history, max_write_capacity_per_second)
+
+            released = {}
+            for country in countries:
+                callbacks = self.update_status_state(country, status, timestamp)
+                if callbacks:
+                    released[country] = callbacks
+                if max_write_capacity_per_second:
+                    time.sleep(1 / max_write_capacity_per_second)
+            logger.info(f"Finished fetch operations with status {status} for {len(countries)} countries")
+            return released
+        except ClientError as e:
+            logger.error(f"Error batch finishing fetch operations: {e}")
             raise
 
     def get_operation_status(self, country):
+        # Strongly consistent, so a status written by the worker is visible to the next poll
         try:
-            response = self.operation_table.query(
-                KeyConditionExpression=Key('country').eq(country),
-                ScanIndexForward=False,
-                Limit=1
+            response = self.client.get_item(TableName=OPERATION_TABLE,
+                Key={'country': country, 'timestamp': LATEST_STATUS_TIMESTAMP},
+                ConsistentRead=True
             )
-            items = response.get('Items', [])
-            if items:
+            item = response.get('Item')
+            if item:
                 logger.info(f"Retrieved latest operation status for country: {country}")
-                return items[0]
+                return self.from_state_item(item)
             else:
                 logger.info(f"No operation status found for country: {country}")
                 return None
@@ -96,6 +507,57 @@ class DynamoDBService:
             logger.error(f"Error getting operation status: {e}")
             raise
 
-    def is_operation_in_progress(self, country):
-        status = self.get_operation_status(country)
-        return status and status['status'] == 'PENDING'
\ No newline at end of file
+    def compact_operation_history(self, retention_seconds=STATUS_HISTORY_TTL_SECONDS, max_write_capacity_per_second=None,
+                                  dry_run=False):
+        # For rows written before history expired: creates the state item of any country that
+        # only has history rows, then deletes history older than the retention period and sets
+        # 'expires_at' on the rest. State items are written in a first pass, so an interrupted
+        # run never leaves a country without a status; re-running is safe.
+        result = {'state_items_created': 0, 'deleted': 0, 'expiring': 0, 'dry_run': dry_run}
+        try:
+            latest = {}
+            has_state = set()
+            for items in self.scan_pages(OPERATION_TABLE):
+                for item in items:
+                    country = item['country']
+                    if item['timestamp'] == LATEST_STATUS_TIMESTAMP:
+                        has_state.add(country)
+                    elif country not in latest or item['timestamp'] > latest[country]['timestamp']:
+                        latest[country] = item
+
+            state_items = []
+            for country, item in latest.items():
+                if country not in has_state:
+                    state_item = dict(item, timestamp=LATEST_STATUS_TIMESTAMP, status_timestamp=item['timestamp'])
+                    state_item.pop('expires_at', None)
+                    state_items.append(state_item)
+            if state_items and not dry_run:
+                self.batch_put_items(OPERATION_TABLE, state_items, max_write_capacity_per_second)
+            result['state_items_created'] = len(state_items)
+
+            cutoff = int(time.time() * 1000) - retention_seconds * 1000
+            for items in self.scan_pages(OPERATION_TABLE):
+                history = [item for item in items if item['timestamp'] != LATEST_STATUS_TIMESTAMP]
+                expired = [{'country': item['country'], 'timestamp': item['timestamp']}
+                           for item in history if item['timestamp'] < cutoff]
+                expiring = [dict(item, expires_at=int(item['timestamp']) // 1000 + retention_seconds)
+                            for item in history if item['timestamp'] >= cutoff and 'expires_at' not in item]
+                if not dry_run:
+                    self.batch_delete_items(OPERATION_TABLE, expired, max_write_capacity_per_second)
+                    self.batch_put_items(OPERATION_TABLE, expiring, max_write_capacity_per_second)
+                result['deleted'] += len(expired)
+                result['expiring'] += len(expiring)
+        except ClientError as e:
+            logger.error(f"Error compacting operation history: {e}")
+            raise
+
+        logger.info(f"Operation history compaction result: {result}")
+        return result
+
+    def scan_pages(self, table, **scan_kwargs):
+        while True:
+            response = self.client.scan(TableName=table, **scan_kwargs)
+            yield response.get('Items', [])
+            if 'LastEvaluatedKey' not in response:
+                return
+            scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
\ No newline at end of file
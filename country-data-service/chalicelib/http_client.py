@@ -0,0 +1,56 @@
+import os
+import logging
+import threading
+
+logger = logging.getLogger()
+
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', 3))
+HTTP_READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', 10))
+HTTP_MAX_RETRIES = int(os.environ.get('HTTP_MAX_RETRIES', 3))
+HTTP_BACKOFF_FACTOR = float(os.environ.get('HTTP_BACKOFF_FACTOR', 0.5))
+HTTP_BACKOFF_MAX = float(os.environ.get('HTTP_BACKOFF_MAX', 10))
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', 10))
+
+http_session = None
+http_session_lock = threading.Lock()
+
+
+def create_http_session():
+    # Exponential backoff with jitter on connection errors, 429 and 5xx.
+    # Retry-After is honoured for 429/503 responses.
+    # requests is imported here so that only containers that call upstream pay for it.
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retry = Retry(
+        total=HTTP_MAX_RETRIES,
+        connect=HTTP_MAX_RETRIES,
+        read=HTTP_MAX_RETRIES,
+        status=HTTP_MAX_RETRIES,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=frozenset({'GET'}),
+        backoff_factor=HTTP_BACKOFF_FACTOR,
+        backoff_max=HTTP_BACKOFF_MAX,
+        backoff_jitter=HTTP_BACKOFF_FACTOR,
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def initialize_http_session():
+    global http_session
+
+    # One pooled session per container, reused across warm invocations and worker threads
+    if http_session is None:
+        with http_session_lock:
+            if http_session is None:
+                http_session = create_http_session()
+
+    return http_session
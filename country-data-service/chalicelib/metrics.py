@@ -0,0 +1,141 @@
+import os
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'CountryDataService')
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+# Embedded Metric Format accepts at most 100 values per metric in one log line
+MAX_VALUES_PER_METRIC = 100
+THROTTLING_ERROR_CODES = frozenset({
+    'ProvisionedThroughputExceededException',
+    'ThrottlingException',
+    'RequestLimitExceeded',
+    'Throttling',
+    'TooManyRequestsException'
+})
+
+
+class InvocationMetrics:
+    # Collects per-stage latency, retry, throttle and error counts for the current invocation
+    # and writes them as a single Embedded Metric Format log line on flush. CloudWatch extracts
+    # the metrics from the log asynchronously, so nothing here makes a network call.
+    def __init__(self, namespace: str = METRICS_NAMESPACE, enabled: bool = METRICS_ENABLED,
+                 stream=None, clock=time.perf_counter):
+        self.namespace = namespace
+        self.enabled = enabled
+        self.stream = stream
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self, endpoint: str = 'unknown'):
+        with self._lock:
+            self.endpoint = endpoint
+            self.latencies = {}
+            self.counts = {}
+
+    def record(self, stage: str, milliseconds: float, retries: int = None, throttled: bool = None, error: bool = False):
+        # Retries and throttles are only emitted for stages that report them (None means not applicable)
+        if not self.enabled:
+            return
+        with self._lock:
+            values = self.latencies.setdefault(stage, [])
+            if len(values) < MAX_VALUES_PER_METRIC:
+                values.append(round(milliseconds, 2))
+            for name, value in (('Retries', retries), ('Throttles', throttled), ('Errors', error)):
+                if value is not None:
+                    key = f'{stage}{name}'
+                    self.counts[key] = self.counts.get(key, 0) + int(value)
+
+    def increment(self, name: str, value: int = 1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + value
+
+    def gauge(self, name: str, value: float):
+        # Last value written in the invocation wins
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counts[name] = value
+
+    @contextmanager
+    def timer(self, stage: str):
+        # The yielded dict lets the caller report retries/throttling it learns about during the call
+        outcome = {'retries': None, 'throttled': None}
+        started = self.clock()
+        error = False
+        try:
+            yield outcome
+        except Exception:
+            error = True
+            raise
+        finally:
+            self.record(stage, (self.clock() - started) * 1000, outcome['retries'], outcome['throttled'], error)
+
+    def flush(self):
+        with self._lock:
+            latencies, counts, endpoint = self.latencies, self.counts, self.endpoint
+            self.latencies, self.counts = {}, {}
+        if not self.enabled or not latencies:
+            return None
+
+        document = {'Endpoint': endpoint}
+        definitions = []
+        for stage, values in latencies.items():
+            document[f'{stage}Latency'] = values
+            definitions.append({'Name': f'{stage}Latency', 'Unit': 'Milliseconds'})
+        for name, value in counts.items():
+            document[name] = value
+            definitions.append({'Name': name, 'Unit': 'Count'})
+        document['_aws'] = {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{'Namespace': self.namespace, 'Dimensions': [['Endpoint']], 'Metrics': definitions}]
+        }
+
+        stream = self.stream or sys.stdout
+        stream.write(json.dumps(document) + '\n')
+        stream.flush()
+        return document
+
+
+# One collector per container; invocations are serialized by Lambda
+metrics = InvocationMetrics()
+
+
+def instrument_client(client, stage: str, recorder: InvocationMetrics = None):
+    # Times every API call of a botocore client through its event hooks, including SDK retries,
+    # so no call site needs wrapping
+    recorder = recorder or metrics
+
+    def before_call(context, **kwargs):
+        context['metrics_started'] = recorder.clock()
+
+    def after_call(parsed, context, **kwargs):
+        started = context.pop('metrics_started', None)
+        if started is None:
+            return
+        error_code = parsed.get('Error', {}).get('Code')
+        recorder.record(
+            stage,
+            (recorder.clock() - started) * 1000,
+            retries=parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0),
+            throttled=error_code in THROTTLING_ERROR_CODES,
+            error=error_code is not None
+        )
+
+    def after_call_error(context, **kwargs):
+        started = context.pop('metrics_started', None)
+        if started is not None:
+            recorder.record(stage, (recorder.clock() - started) * 1000, retries=0, throttled=False, error=True)
+
+    # Registered first on the most specific key, so it runs before any handler that
+    # short-circuits the call with a canned response (such as botocore's Stubber)
+    client.meta.events.register_first('before-call.*.*', before_call)
+    client.meta.events.register('after-call', after_call)
+    client.meta.events.register('after-call-error', after_call_error)
+    return client
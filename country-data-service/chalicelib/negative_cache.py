@@ -0,0 +1,79 @@
+import os
+import logging
+from redis.exceptions import RedisError
+from .cache import TTLCache
+
+logger = logging.getLogger()
+
+NEGATIVE_CACHE_TTL_SECONDS = int(os.environ.get('NEGATIVE_CACHE_TTL_SECONDS', 3600))
+NEGATIVE_CACHE_MAX_SIZE = int(os.environ.get('NEGATIVE_CACHE_MAX_SIZE', 1000))
+NEGATIVE_CACHE_LOCAL_TTL_SECONDS = 300
+
+
+class NegativeCache:
+    # Remembers names restcountries.com does not know, so a repeated typo is answered without
+    # claiming, enqueueing or calling upstream again. The worker writes the Redis record;
+    # API containers keep what they read from it for a few minutes in memory.
+    def __init__(self, redis_client=None, prefix: str = 'country-not-found', ttl_seconds: int = NEGATIVE_CACHE_TTL_SECONDS,
+                 max_size: int = NEGATIVE_CACHE_MAX_SIZE, circuit_breaker=None):
+        self.redis_client = redis_client
+        self.prefix = prefix
+        self.ttl_seconds = ttl_seconds
+        self.circuit_breaker = circuit_breaker
+        self.local = TTLCache(max_size, min(ttl_seconds, NEGATIVE_CACHE_LOCAL_TTL_SECONDS))
+
+    def cache_key(self, country: str) -> str:
+        return f"{self.prefix}-{country}"
+
+    def redis_available(self) -> bool:
+        if self.redis_client is None:
+            return False
+        return self.circuit_breaker is None or self.circuit_breaker.allow_request()
+
+    def record_outcome(self, error=None):
+        if self.circuit_breaker is None:
+            return
+        if error is None:
+            self.circuit_breaker.record_success()
+        else:
+            self.circuit_breaker.record_failure()
+
+    def contains(self, country: str) -> bool:
+        if self.local.get(country) is not None:
+            return True
+        if not self.redis_available():
+            return False
+        try:
+            found = self.redis_client.get(self.cache_key(country)) is not None
+        except RedisError as e:
+            logger.error(f"Error reading negative cache for country {country}: {e}")
+            self.record_outcome(e)
+            return False
+        self.record_outcome()
+        if found:
+            self.local.set(country, True)
+        return found
+
+    def add(self, country: str):
+        self.local.set(country, True)
+        if not self.redis_available():
+            return
+        try:
+            self.redis_client.set(self.cache_key(country), '1', ex=self.ttl_seconds)
+        except RedisError as e:
+            logger.error(f"Error writing negative cache for country {country}: {e}")
+            self.record_outcome(e)
+            return
+        self.record_outcome()
+
+    def invalidate(self, country: str):
+        self.local.invalidate(country)
+        if not self.redis_available():
+            return
+        try:
+            self.redis_client.delete(self.cache_key(country))
+        except RedisError as e:
+            logger.error(f"Error invalidating negative cache for country {country}: {e}")
+            self.record_outcome(e)
+            return
+        self.record_outcome()
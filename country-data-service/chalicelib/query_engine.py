@@ -0,0 +1,123 @@
+import bisect
+import math
+import threading
+from array import array
+
+NUMERIC_COLUMNS = ('population', 'area')
+CATEGORICAL_COLUMNS = ('region', 'subregion', 'continents', 'capital', 'landlocked', 'independent', 'unMember')
+SORT_COLUMNS = ('name',) + NUMERIC_COLUMNS
+
+
+def extract_attributes(country_data: dict) -> dict:
+    # The compact row kept per country; multi-valued attributes stay lists
+    name = country_data.get('name')
+    row = {
+        'name': name.get('common') if isinstance(name, dict) else name,
+        'cca2': country_data.get('cca2'),
+        'cca3': country_data.get('cca3'),
+        'region': country_data.get('region'),
+        'subregion': country_data.get('subregion'),
+        'continents': country_data.get('continents'),
+        'capital': country_data.get('capital'),
+        'landlocked': country_data.get('landlocked'),
+        'independent': country_data.get('independent'),
+        'unMember': country_data.get('unMember'),
+        'population': country_data.get('population'),
+        'area': country_data.get('area')
+    }
+    return {key: value for key, value in row.items() if value is not None}
+
+
+def category_values(value) -> list:
+    values = value if isinstance(value, list) else [value]
+    return [str(v).lower() for v in values if v is not None]
+
+
+class CountryQueryEngine:
+    def __init__(self, rows: dict):
+        self.rows = dict(rows)
+        self._lock = threading.Lock()
+        self._build()
+
+    def upsert(self, rows: dict):
+        with self._lock:
+            self.rows.update(rows)
+            self._build()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _build(self):
+        self.keys = sorted(self.rows)
+        rows = [self.rows[key] for key in self.keys]
+        self.all_mask = (1 << len(rows)) - 1
+
+        # Categorical columns are dictionary-encoded into one row bitmap per distinct value
+        self.bitmaps = {}
+        for column in CATEGORICAL_COLUMNS:
+            bitmaps = {}
+            for row_id, row in enumerate(rows):
+                for value in category_values(row.get(column)):
+                    bitmaps[value] = bitmaps.get(value, 0) | (1 << row_id)
+            self.bitmaps[column] = bitmaps
+
+        # Numeric columns are stored as arrays with a sort order, sorted values for bisecting,
+        # and prefix bitmaps so any value range becomes a single XOR of two masks
+        self.columns = {}
+        self.sorted_values = {}
+        self.orders = {}
+        self.prefix_masks = {}
+        for column in NUMERIC_COLUMNS:
+            values = array('d', (float(row.get(column, math.nan)) for row in rows))
+            order = sorted((i for i in range(len(rows)) if not math.isnan(values[i])), key=lambda i: values[i])
+            prefix = [0]
+            for row_id in order:
+                prefix.append(prefix[-1] | (1 << row_id))
+            self.columns[column] = values
+            self.orders[column] = order
+            self.sorted_values[column] = array('d', (values[i] for i in order))
+            self.prefix_masks[column] = prefix
+
+        self.orders['name'] = sorted(range(len(rows)), key=lambda i: str(rows[i].get('name', self.keys[i])).lower())
+
+    def range_mask(self, column: str, minimum=None, maximum=None) -> int:
+        sorted_values = self.sorted_values[column]
+        low = 0 if minimum is None else bisect.bisect_left(sorted_values, minimum)
+        high = len(sorted_values) if maximum is None else bisect.bisect_right(sorted_values, maximum)
+        if low >= high:
+            return 0
+        prefix = self.prefix_masks[column]
+        return prefix[high] ^ prefix[low]
+
+    def category_mask(self, column: str, values: list) -> int:
+        mask = 0
+        for value in values:
+            mask |= self.bitmaps[column].get(str(value).lower(), 0)
+        return mask
+
+    def query(self, filters: dict = None, ranges: dict = None, sort: str = 'name', descending: bool = False,
+              offset: int = 0, limit: int = 25) -> dict:
+        # filters: {column: [values]} (OR within a column); ranges: {column: (min, max)}; all AND-ed
+        with self._lock:
+            mask = self.all_mask
+            for column, values in (filters or {}).items():
+                mask &= self.category_mask(column, values)
+            for column, (minimum, maximum) in (ranges or {}).items():
+                mask &= self.range_mask(column, minimum, maximum)
+
+            order = self.orders[sort]
+            if descending:
+                order = order[::-1]
+            matched = [row_id for row_id in order if mask >> row_id & 1]
+            # Rows without a value for the sort column go last
+            if sort in NUMERIC_COLUMNS:
+                matched.extend(row_id for row_id in range(len(self.keys))
+                               if mask >> row_id & 1 and math.isnan(self.columns[sort][row_id]))
+
+            page = matched[offset:offset + limit]
+            return {
+                'total': len(matched),
+                'offset': offset,
+                'limit': limit,
+                'results': [dict(self.rows[self.keys[row_id]], country=self.keys[row_id]) for row_id in page]
+            }
@@ -1,28 +1,40 @@
-import boto3
 import json
 import logging
 import os
 from botocore.exceptions import ClientError
+from .utils import chunks, boto3_client_lock
+from .metrics import instrument_client
 
 logger = logging.getLogger()
 
+SEND_MESSAGE_BATCH_SIZE = 10
+
 sqs_client = None
 
 
-def initialize_sqs_client(sqs_queue_url):
+def initialize_sqs_client():
+    # One client for every queue: each request names its queue by QueueUrl, and the client
+    # uses the regional endpoint, so it does not depend on which queue was used first
     global sqs_client
     if sqs_client is None:
-        try:
-            sqs_client = boto3.client('sqs', endpoint_url=sqs_queue_url)
-        except ClientError as err:
-            raise
+        with boto3_client_lock:
+            if sqs_client is None:
+                import boto3
+                sqs_client = instrument_client(boto3.client('sqs'), 'SQS')
     return sqs_client
 
 
 class QueueService:
     def __init__(self, queue_url):
         self.queue_url = queue_url
-        self.sqs = initialize_sqs_client(queue_url)
+        self._sqs = None
+
+    @property
+    def sqs(self):
+        # Created on first send, so containers that never enqueue never build the client
+        if self._sqs is None:
+            self._sqs = initialize_sqs_client()
+        return self._sqs
 
     def send_message(self, message_body):
         try:
@@ -36,6 +48,29 @@ class QueueService:
             logger.error(f"Error sending message to SQS: {e}")
             raise
 
+    def send_message_batch(self, message_bodies):
+        # Returns the message bodies that SQS did not accept
+        failed = []
+        for batch in chunks(list(message_bodies), SEND_MESSAGE_BATCH_SIZE):
+            entries = [
+                {'Id': str(i), 'MessageBody': json.dumps(body)}
+                for i, body in enumerate(batch)
+            ]
+            try:
+                logger.info(f"Sending batch of {len(entries)} messages to queue")
+                response = self.sqs.send_message_batch(
+                    QueueUrl=self.queue_url,
+                    Entries=entries
+                )
+            except ClientError as e:
+                logger.error(f"Error sending message batch to SQS: {e}")
+                raise
+
+            for failure in response.get('Failed', []):
+                logger.error(f"Failed to send message {failure['Id']}: {failure.get('Message')}")
+                failed.append(batch[int(failure['Id'])])
+        return failed
+
     def receive_message(self):
         try:
             response = self.sqs.receive_message(
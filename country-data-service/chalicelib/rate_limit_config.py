@@ -1,7 +1,14 @@
 from datetime import timedelta
 
+# 'algorithm' is either 'fixed_window' (default) or 'gcra'.
+# 'lease_size' enables local quota leasing: each container reserves that many
+# fixed-window tokens from Redis at a time and spends them in memory.
 RATE_LIMITS = {
-    'fetch_country_data': {'limit': 200, 'period': timedelta(minutes=1)},
-    'get_country_data': {'limit': 200, 'period': timedelta(minutes=1)},
-    'check_operation_status': {'limit': 300, 'period': timedelta(minutes=1)}
+    'fetch_country_data': {'limit': 200, 'period': timedelta(minutes=1), 'algorithm': 'fixed_window'},
+    'bulk_fetch_country_data': {'limit': 20, 'period': timedelta(minutes=1), 'algorithm': 'fixed_window'},
+    'get_country_data': {'limit': 200, 'period': timedelta(minutes=1), 'algorithm': 'fixed_window', 'lease_size': 10},
+    'get_countries_data': {'limit': 60, 'period': timedelta(minutes=1), 'algorithm': 'fixed_window'},
+    'search_countries': {'limit': 300, 'period': timedelta(minutes=1), 'algorithm': 'gcra'},
+    'query_countries': {'limit': 300, 'period': timedelta(minutes=1), 'algorithm': 'gcra'},
+    'check_operation_status': {'limit': 300, 'period': timedelta(minutes=1), 'algorithm': 'fixed_window'}
 }
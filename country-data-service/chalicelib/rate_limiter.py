@@ -1,14 +1,73 @@
 import os
-from redis import Redis
+import time
+import threading
 from functools import wraps
 from chalice import ChaliceViewError
 from chalice import Chalice
-import boto3
-from botocore.exceptions import ClientError
 import logging
+from .redis_client import get_connection_pool, redis_circuit_breaker
+from .metrics import metrics
 
 logger = logging.getLogger()
 
+FIXED_WINDOW = 'fixed_window'
+GCRA = 'gcra'
+
+MAX_LOCAL_LEASES = 10000
+
+# Increment, expiry and compare in a single server-side call
+FIXED_WINDOW_SCRIPT = """
+local current = redis.call('INCR', KEYS[1])
+if current == 1 then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+if current > tonumber(ARGV[1]) then
+    return 1
+end
+return 0
+"""
+
+# Generic cell rate algorithm: stores the theoretical arrival time (TAT) of the
+# next request and allows bursts of up to `limit` requests per `period`.
+# Uses the Redis server clock so all Lambdas agree on "now".
+GCRA_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local emission_interval = period / limit
+local tat = tonumber(redis.call('GET', KEYS[1]))
+if tat == nil or tat < now then
+    tat = now
+end
+local new_tat = tat + emission_interval
+if new_tat - period > now then
+    return 1
+end
+redis.call('SET', KEYS[1], tostring(new_tat), 'PX', math.ceil((new_tat - now) * 1000))
+return 0
+"""
+
+# Reserves up to ARGV[3] tokens from the fixed-window counter in one call.
+# Returns the number of tokens granted and the remaining window in milliseconds.
+# Tokens are only granted while the window has room, so the global count can
+# never exceed the limit; leased but unspent tokens are simply lost at reset.
+LEASE_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local lease_size = tonumber(ARGV[3])
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+local granted = math.min(lease_size, limit - current)
+if granted > 0 then
+    if redis.call('INCRBY', KEYS[1], granted) == granted then
+        redis.call('EXPIRE', KEYS[1], ARGV[2])
+    end
+else
+    granted = 0
+end
+return {granted, redis.call('PTTL', KEYS[1])}
+"""
+
+
 class RateLimitExceededError(ChaliceViewError):
     default_message = 'Rate Limit Exceeded.'
 
@@ -20,21 +79,46 @@ class RateLimiter:
     def __init__(self, app: Chalice, rate_limits: dict):
         self.route = app
         self.rate_limits = rate_limits
-        redis_host = os.environ.get('REDIS_HOST', 'localhost')
-        redis_port = int(os.environ.get('REDIS_PORT', 6379))
-        try:
-            self.redis_client = Redis(host=redis_host, port=redis_port)
-            self.redis_client.ping()
+        self.leases = {}
+        self.leases_lock = threading.Lock()
+        self.circuit_breaker = redis_circuit_breaker
+        self.redis_client = None
+        self.connected = False
+        self.connect_lock = threading.Lock()
+
+    def connect(self, redis_client=None):
+        # Deferred to the first rate-limited request, so cold starts and the SQS worker
+        # (which never rate-limits) skip importing redis and registering scripts.
+        # A client can be passed in so a local stand-in can replace Redis.
+        with self.connect_lock:
+            if self.connected:
+                return
+            try:
+                if redis_client is None:
+                    redis_host = os.environ.get('REDIS_HOST', 'localhost')
+                    redis_port = int(os.environ.get('REDIS_PORT', 6379))
+                    from redis import Redis
+                    # Connections are opened lazily; the circuit breaker handles an unreachable Redis
+                    redis_client = Redis(connection_pool=get_connection_pool(redis_host, redis_port))
+                self.redis_client = redis_client
+                self.scripts = {
+                    FIXED_WINDOW: self.redis_client.register_script(FIXED_WINDOW_SCRIPT),
+                    GCRA: self.redis_client.register_script(GCRA_SCRIPT)
+                }
+                self.lease_script = self.redis_client.register_script(LEASE_SCRIPT)
 
-            logger.info("Redis client initialized successfully.")
-        except:
-            logger.warning("Redis not available. Rate limiting will be disabled.")
-            self.redis_client = None
+                logger.info("Redis client initialized successfully.")
+            except Exception as e:
+                logger.warning(f"Redis client could not be created ({e}). Rate limiting will be disabled.")
+                self.redis_client = None
+            self.connected = True
 
     def limit(self):
         def decorator(func):
             @wraps(func)
             def wrapper(*args, **kwargs):
+                if not self.connected:
+                    self.connect()
                 if self.redis_client is None:
                     return func(*args, **kwargs)
                 
@@ -48,32 +132,82 @@ class RateLimiter:
                 user_id = current_request.context.get('identity', {}).get('sourceIp', 'unknown')
                 redis_key = f"throttling-{user_id}-{endpoint}"
 
-                if self.request_is_limited(redis_key, limit_config['limit'], int(limit_config['period'].total_seconds())):
+                period_in_seconds = int(limit_config['period'].total_seconds())
+                lease_size = limit_config.get('lease_size')
+                if lease_size:
+                    is_limited = self.request_is_limited_leased(redis_key, limit_config['limit'], period_in_seconds, lease_size)
+                else:
+                    algorithm = limit_config.get('algorithm', FIXED_WINDOW)
+                    is_limited = self.request_is_limited(redis_key, limit_config['limit'], period_in_seconds, algorithm)
+
+                if is_limited:
                     raise RateLimitExceededError()
                 return func(*args, **kwargs)
             return wrapper
         return decorator
 
-    def request_is_limited(self, redis_key: str, limit: int, period_in_seconds: int) -> bool:
+    def request_is_limited(self, redis_key: str, limit: int, period_in_seconds: int, algorithm: str = FIXED_WINDOW) -> bool:
         if self.redis_client is None:
             return False
+        script = self.scripts.get(algorithm)
+        if script is None:
+            logger.error(f"Unknown rate limit algorithm: {algorithm}")
+            return False
+        if not self.circuit_breaker.allow_request():
+            return False
         try:
             logger.info(f"Checking rate limit for key: {redis_key}")
-            current = self.redis_client.get(redis_key)
+            with metrics.timer('Redis'):
+                is_limited = script(keys=[redis_key], args=[limit, period_in_seconds]) == 1
+            self.circuit_breaker.record_success()
+        except Exception as e:
+            logger.error(f"Error accessing Redis: {e}")
+            self.circuit_breaker.record_failure()
+            return False
 
-            if current is None:
-                logger.info(f"Setting rate limit for key: {redis_key}")
-                self.redis_client.set(redis_key, 1, ex=period_in_seconds)
-                return False
+        if is_limited:
+            logger.info(f"Rate limit exceeded for key: {redis_key}")
+        return is_limited
 
-            if int(current) >= limit:
-                logger.info(f"Rate limit exceeded for key: {redis_key}")
-                return True
+    def request_is_limited_leased(self, redis_key: str, limit: int, period_in_seconds: int, lease_size: int) -> bool:
+        if self.redis_client is None:
+            return False
 
-            self.redis_client.incr(redis_key)
-            logger.info(f"Incrementing key: {redis_key}")
+        with self.leases_lock:
+            lease = self.leases.get(redis_key)
+            if lease is not None and lease['expires_at'] > time.monotonic():
+                if lease['remaining'] > 0:
+                    lease['remaining'] -= 1
+                    return False
+                if lease['exhausted']:
+                    # The window has no tokens left; deny locally until it resets
+                    return True
 
+        if not self.circuit_breaker.allow_request():
             return False
+        try:
+            logger.info(f"Leasing {lease_size} tokens for key: {redis_key}")
+            with metrics.timer('Redis'):
+                granted, ttl_ms = self.lease_script(keys=[redis_key], args=[limit, period_in_seconds, lease_size])
+            self.circuit_breaker.record_success()
         except Exception as e:
             logger.error(f"Error accessing Redis: {e}")
+            self.circuit_breaker.record_failure()
             return False
+
+        granted = int(granted)
+        ttl_ms = int(ttl_ms) if int(ttl_ms) > 0 else period_in_seconds * 1000
+        with self.leases_lock:
+            if len(self.leases) >= MAX_LOCAL_LEASES:
+                now = time.monotonic()
+                self.leases = {key: value for key, value in self.leases.items() if value['expires_at'] > now}
+            self.leases[redis_key] = {
+                'remaining': max(granted - 1, 0),
+                'exhausted': granted == 0,
+                'expires_at': time.monotonic() + ttl_ms / 1000
+            }
+
+        if granted == 0:
+            logger.info(f"Rate limit exceeded for key: {redis_key}")
+            return True
+        return False
@@ -0,0 +1,107 @@
+import json
+import time
+import uuid
+import logging
+from redis.exceptions import RedisError
+
+logger = logging.getLogger()
+
+# Only delete the lock if it is still ours, so a slow loader cannot release
+# a lock that already expired and was taken by another caller.
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class RedisCache:
+    def __init__(self, redis_client, prefix: str, ttl_seconds: int = 3600, lock_ttl_seconds: float = 10,
+                 wait_timeout_seconds: float = 2, poll_interval_seconds: float = 0.05, circuit_breaker=None):
+        self.redis_client = redis_client
+        self.prefix = prefix
+        self.ttl_seconds = ttl_seconds
+        self.lock_ttl_seconds = lock_ttl_seconds
+        self.wait_timeout_seconds = wait_timeout_seconds
+        self.poll_interval_seconds = poll_interval_seconds
+        self.circuit_breaker = circuit_breaker
+        self.release_lock = redis_client.register_script(RELEASE_LOCK_SCRIPT)
+
+    def cache_key(self, key: str) -> str:
+        return f"{self.prefix}-{key}"
+
+    def lock_key(self, key: str) -> str:
+        return f"{self.prefix}-lock-{key}"
+
+    def get(self, key: str):
+        cached = self.redis_client.get(self.cache_key(key))
+        if cached is None:
+            return None
+        return json.loads(cached)
+
+    def set(self, key: str, value):
+        self.redis_client.set(self.cache_key(key), json.dumps(value), ex=self.ttl_seconds)
+
+    def invalidate(self, key: str):
+        try:
+            self.redis_client.delete(self.cache_key(key))
+        except RedisError as e:
+            logger.error(f"Error invalidating Redis cache key {key}: {e}")
+
+    def get_or_load(self, key: str, loader):
+        if self.circuit_breaker is not None and not self.circuit_breaker.allow_request():
+            return loader()
+
+        try:
+            value = self._read_through(key, loader)
+        except RedisError as e:
+            logger.error(f"Error accessing Redis cache: {e}")
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.record_failure()
+            return loader()
+        except Exception:
+            # The loader failed, not Redis
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.record_success()
+            raise
+
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.record_success()
+        return value
+
+    def _read_through(self, key: str, loader):
+        cached = self.get(key)
+        if cached is not None:
+            logger.info(f"Redis cache hit for key: {key}")
+            return cached
+
+        token = uuid.uuid4().hex
+        lock_key = self.lock_key(key)
+        if self.redis_client.set(lock_key, token, nx=True, px=int(self.lock_ttl_seconds * 1000)):
+            try:
+                return self._load_and_store(key, loader)
+            finally:
+                self.release_lock(keys=[lock_key], args=[token])
+
+        # Another caller is already loading this key; wait for it to publish
+        logger.info(f"Waiting for in-flight load of key: {key}")
+        deadline = time.monotonic() + self.wait_timeout_seconds
+        while time.monotonic() < deadline:
+            time.sleep(self.poll_interval_seconds)
+            cached = self.get(key)
+            if cached is not None:
+                return cached
+            if not self.redis_client.exists(lock_key):
+                break
+
+        return loader()
+
+    def _load_and_store(self, key: str, loader):
+        value = loader()
+        if value is not None:
+            try:
+                self.set(key, value)
+            except RedisError as e:
+                logger.error(f"Error writing Redis cache key {key}: {e}")
+        return value
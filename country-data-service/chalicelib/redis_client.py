@@ -0,0 +1,68 @@
+import os
+import logging
+import threading
+from .circuit_breaker import CircuitBreaker
+
+logger = logging.getLogger()
+
+REDIS_CONNECT_TIMEOUT = float(os.environ.get('REDIS_CONNECT_TIMEOUT', 0.1))
+REDIS_SOCKET_TIMEOUT = float(os.environ.get('REDIS_SOCKET_TIMEOUT', 0.1))
+REDIS_MAX_CONNECTIONS = int(os.environ.get('REDIS_MAX_CONNECTIONS', 10))
+
+redis_client = None
+connection_pools = {}
+# Reentrant, as the client initializer creates its pool while holding it
+redis_client_lock = threading.RLock()
+
+# Shared by every Redis user in the container, so a brownout trips once for all of them
+redis_circuit_breaker = CircuitBreaker(
+    'redis',
+    failure_threshold=int(os.environ.get('REDIS_BREAKER_FAILURE_THRESHOLD', 5)),
+    reset_timeout_seconds=float(os.environ.get('REDIS_BREAKER_RESET_SECONDS', 30))
+)
+
+
+def get_connection_pool(redis_host: str, redis_port: int):
+    key = (redis_host, redis_port)
+    with redis_client_lock:
+        if key not in connection_pools:
+            # redis is imported on first use so it stays off the cold-start import path
+            from redis import ConnectionPool
+            from redis.backoff import NoBackoff
+            from redis.retry import Retry
+
+            # No client-side retries: the circuit breaker decides when to try again
+            connection_pools[key] = ConnectionPool(
+                host=redis_host,
+                port=redis_port,
+                socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+                socket_timeout=REDIS_SOCKET_TIMEOUT,
+                max_connections=REDIS_MAX_CONNECTIONS,
+                retry=Retry(NoBackoff(), 0)
+            )
+        return connection_pools[key]
+
+
+def initialize_redis_client():
+    global redis_client
+
+    if redis_client is None:
+        with redis_client_lock:
+            if redis_client is not None:
+                return redis_client
+            redis_host = os.environ.get('REDIS_HOST')
+            if not redis_host:
+                logger.info("REDIS_HOST not configured. Shared Redis cache will be disabled.")
+                return None
+
+            try:
+                redis_port = int(os.environ.get('REDIS_PORT', 6379))
+            except ValueError:
+                logger.warning(f"Invalid REDIS_PORT {os.environ.get('REDIS_PORT')!r}. Shared Redis cache will be disabled.")
+                return None
+
+            from redis import Redis
+            # redis-py connects lazily, so no network I/O happens here
+            redis_client = Redis(connection_pool=get_connection_pool(redis_host, redis_port))
+
+    return redis_client
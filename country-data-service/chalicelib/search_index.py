@@ -0,0 +1,63 @@
+import bisect
+from collections import defaultdict
+
+PREFIX_MATCH_BONUS = 1.0
+MIN_FUZZY_SCORE = 0.3
+
+
+def trigrams(text: str) -> set:
+    # Padded so that short strings and word boundaries still produce grams
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class CountrySearchIndex:
+    def __init__(self, aliases: dict):
+        # aliases maps each normalized alias to the key its country is stored under
+        self.aliases = sorted(aliases)
+        self.countries = [aliases[alias] for alias in self.aliases]
+        self.alias_trigrams = [trigrams(alias) for alias in self.aliases]
+        self.postings = defaultdict(list)
+        for alias_id, grams in enumerate(self.alias_trigrams):
+            for gram in grams:
+                self.postings[gram].append(alias_id)
+
+    def __len__(self):
+        return len(self.aliases)
+
+    def prefix_matches(self, prefix: str):
+        start = bisect.bisect_left(self.aliases, prefix)
+        end = bisect.bisect_right(self.aliases, prefix + '\uffff')
+        return range(start, end)
+
+    def search(self, query: str, limit: int = 10) -> list:
+        scores = {}
+
+        # Dice coefficient over trigrams tolerates typos and transpositions
+        query_grams = trigrams(query)
+        overlaps = defaultdict(int)
+        for gram in query_grams:
+            for alias_id in self.postings.get(gram, ()):
+                overlaps[alias_id] += 1
+        for alias_id, overlap in overlaps.items():
+            score = 2 * overlap / (len(query_grams) + len(self.alias_trigrams[alias_id]))
+            if score >= MIN_FUZZY_SCORE:
+                scores[alias_id] = score
+
+        for alias_id in self.prefix_matches(query):
+            # Shorter completions of the prefix rank higher
+            scores[alias_id] = PREFIX_MATCH_BONUS + len(query) / len(self.aliases[alias_id])
+
+        # Keep the best-scoring alias per country
+        best = {}
+        for alias_id, score in scores.items():
+            country = self.countries[alias_id]
+            if country not in best or score > best[country][0]:
+                best[country] = (score, alias_id)
+
+        ranked = sorted(best.items(), key=lambda item: (-item[1][0], item[0]))[:limit]
+        # Prefix matches score above 1, fuzzy matches between MIN_FUZZY_SCORE and 1
+        return [
+            {'country': country, 'match': self.aliases[alias_id], 'score': round(score, 3)}
+            for country, (score, alias_id) in ranked
+        ]
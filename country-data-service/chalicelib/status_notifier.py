@@ -0,0 +1,72 @@
+import os
+import json
+import time
+import logging
+from redis.exceptions import RedisError
+
+logger = logging.getLogger()
+
+STATUS_SIGNAL_TTL_SECONDS = int(os.environ.get('STATUS_SIGNAL_TTL_SECONDS', 300))
+STATUS_WAIT_POLL_SECONDS = float(os.environ.get('STATUS_WAIT_POLL_SECONDS', 0.1))
+
+
+class StatusNotifier:
+    # The worker writes each finished operation to a short-lived Redis key, and /status?wait=
+    # watches that key instead of polling DynamoDB. A signal carries the time it was sent, so a
+    # key left over from an earlier fetch of the same country is ignored.
+    def __init__(self, redis_client, prefix: str = 'operation-status', ttl_seconds: int = STATUS_SIGNAL_TTL_SECONDS,
+                 poll_interval_seconds: float = STATUS_WAIT_POLL_SECONDS, circuit_breaker=None,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.redis_client = redis_client
+        self.prefix = prefix
+        self.ttl_seconds = ttl_seconds
+        self.poll_interval_seconds = poll_interval_seconds
+        self.circuit_breaker = circuit_breaker
+        self.clock = clock
+        self.sleep = sleep
+
+    def signal_key(self, country: str) -> str:
+        return f"{self.prefix}-{country}"
+
+    def publish(self, country: str, status: str):
+        # Best effort: a waiter that misses the signal still re-reads DynamoDB when its wait ends
+        if self.circuit_breaker is not None and not self.circuit_breaker.allow_request():
+            return
+        signal = {'status': status, 'timestamp': int(time.time() * 1000)}
+        try:
+            self.redis_client.set(self.signal_key(country), json.dumps(signal), ex=self.ttl_seconds)
+        except RedisError as e:
+            logger.error(f"Error publishing status signal for country {country}: {e}")
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.record_failure()
+            return
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.record_success()
+
+    def wait(self, country: str, since_timestamp: int, timeout_seconds: float):
+        # Returns the first signal sent at or after since_timestamp (epoch milliseconds) whose
+        # status is final, or None if none arrives in time or Redis is unavailable
+        if self.circuit_breaker is not None and not self.circuit_breaker.allow_request():
+            return None
+        deadline = self.clock() + timeout_seconds
+        try:
+            while True:
+                cached = self.redis_client.get(self.signal_key(country))
+                signal = json.loads(cached) if cached is not None else None
+                if signal and signal['status'] != 'PENDING' and signal['timestamp'] >= since_timestamp:
+                    logger.info(f"Received status signal for country {country}: {signal['status']}")
+                    break
+                remaining = deadline - self.clock()
+                if remaining <= 0:
+                    signal = None
+                    break
+                self.sleep(min(self.poll_interval_seconds, remaining))
+        except RedisError as e:
+            logger.error(f"Error waiting for status signal for country {country}: {e}")
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.record_failure()
+            return None
+
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.record_success()
+        return signal
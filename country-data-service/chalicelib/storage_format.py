@@ -0,0 +1,54 @@
+import os
+import json
+import zlib
+from .utils import float_to_decimal, canonical_json, content_hash, project_fields, DecimalEncoder
+from .query_engine import extract_attributes
+
+# Version 1 stores the document as a nested DynamoDB map under 'data' (items without
+# 'format_version' are version 1). Version 2 stores zlib-compressed canonical JSON under
+# 'data_blob', plus a few top-level scalars so the table can still be filtered and indexed.
+# Both formats carry the country's compact query row under 'attributes', and its hash under
+# 'attributes_hash', the key of the sparse index the query engine loads the rows from.
+FORMAT_MAP = 1
+FORMAT_COMPRESSED = 2
+STORAGE_FORMAT_VERSION = int(os.environ.get('COUNTRY_STORAGE_FORMAT_VERSION', FORMAT_COMPRESSED))
+COMPRESSION_LEVEL = 9
+
+
+def index_attributes(data: dict) -> dict:
+    name = data.get('name')
+    attributes = {
+        'name': name.get('common') if isinstance(name, dict) else None,
+        'cca2': data.get('cca2'),
+        'cca3': data.get('cca3'),
+        'region': data.get('region')
+    }
+    return {key: value for key, value in attributes.items() if isinstance(value, str) and value}
+
+
+def encode_country_item(country: str, data: dict, format_version: int = None) -> dict:
+    format_version = format_version or STORAGE_FORMAT_VERSION
+    row = extract_attributes(data)
+    item = {'country': country, 'data_hash': content_hash(data), 'attributes': float_to_decimal(row),
+            'attributes_hash': content_hash(row)}
+    if format_version == FORMAT_COMPRESSED:
+        item['format_version'] = FORMAT_COMPRESSED
+        item['data_blob'] = zlib.compress(canonical_json(data).encode('utf-8'), COMPRESSION_LEVEL)
+        item.update(index_attributes(data))
+    else:
+        item['data'] = float_to_decimal(data)
+    return item
+
+
+def decode_country_item(item: dict, fields=None):
+    # Returns the stored document (projected to fields if given), or None if the item holds none
+    blob = item.get('data_blob')
+    if blob is not None:
+        # Plain JSON decode; no Decimal conversion needed
+        data = json.loads(zlib.decompress(bytes(blob)))
+        return project_fields(data, fields) if fields else data
+
+    if 'data' in item:
+        return json.loads(json.dumps(item['data'], cls=DecimalEncoder))
+    # A projected version 1 item whose document has none of the requested fields
+    return {} if fields else None
@@ -1,14 +1,33 @@
 from functools import wraps
 from chalice import BadRequestError
 from decimal import Decimal
+import hashlib
 import json
+import re
+import threading
+
+FIELD_NAME_PATTERN = re.compile(r'^[A-Za-z0-9_]+$')
+MAX_FIELDS = 20
+
+# Clients created from boto3's default session must not be built concurrently (it can raise
+# KeyError), so every lazy boto3 initializer holds this lock, whichever service it creates
+boto3_client_lock = threading.Lock()
+
+INVALID_COUNTRY_MESSAGE = "It should be a known country name of more than 3 letters and hyphens, or a known ISO country code."
+
+def invalid_country_message(country_service, country, prefix="Invalid country name."):
+    message = f"{prefix} {INVALID_COUNTRY_MESSAGE}"
+    suggestion = country_service.suggest_country_name(country)
+    if suggestion:
+        message += f" Did you mean '{suggestion}'?"
+    return message
 
 def validate_country(country_service):
     def decorator(f):
         @wraps(f)
         def wrapper(country, *args, **kwargs):
             if not country_service.validate_country_name(country):
-                raise BadRequestError("Invalid country name. It should be more than 3 letters and only contain letters and hyphens.")
+                raise BadRequestError(invalid_country_message(country_service, country))
             return f(country, *args, **kwargs)
         return wrapper
     return decorator
@@ -22,6 +41,57 @@ def float_to_decimal(obj):
         return [float_to_decimal(v) for v in obj]
     return obj
 
+def canonical_json(data) -> str:
+    # Stable across key order and whitespace, so unchanged documents serialize the same
+    return json.dumps(data, sort_keys=True, separators=(',', ':'), ensure_ascii=False, cls=DecimalEncoder)
+
+def content_hash(data) -> str:
+    return hashlib.sha256(canonical_json(data).encode('utf-8')).hexdigest()
+
+def parse_fields(fields: str) -> list:
+    # 'name.common,capital' -> [('capital',), ('name', 'common')]
+    paths = set()
+    for field in fields.split(','):
+        field = field.strip()
+        if not field:
+            continue
+        path = tuple(field.split('.'))
+        if not all(FIELD_NAME_PATTERN.match(key) for key in path):
+            raise ValueError(f"Invalid field '{field}'. Fields are dot-separated letters, digits and underscores.")
+        paths.add(path)
+
+    if not paths:
+        raise ValueError("At least one field must be given.")
+    if len(paths) > MAX_FIELDS:
+        raise ValueError(f"A maximum of {MAX_FIELDS} fields can be requested.")
+
+    # A field already covers its sub-fields, and DynamoDB rejects overlapping projection paths
+    parsed = []
+    for path in sorted(paths):
+        if not any(path[:len(parent)] == parent for parent in parsed):
+            parsed.append(path)
+    return parsed
+
+def project_fields(data: dict, fields: list) -> dict:
+    # Applies parsed field paths to a document in memory; missing fields are left out
+    projected = {}
+    for path in fields:
+        value = data
+        for key in path:
+            if not isinstance(value, dict) or key not in value:
+                break
+            value = value[key]
+        else:
+            target = projected
+            for key in path[:-1]:
+                target = target.setdefault(key, {})
+            target[path[-1]] = value
+    return projected
+
+def chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
 class DecimalEncoder(json.JSONEncoder):
     def default(self, obj):
         if isinstance(obj, Decimal):
@@ -0,0 +1,22 @@
+import argparse
+import json
+import logging
+from chalicelib.db_service import DynamoDBService
+
+
+def compact_operation_status():
+    parser = argparse.ArgumentParser(
+        description='Backfill latest-status items and expire old history rows in the operation status table.')
+    parser.add_argument('--retention-days', type=int, default=30,
+                        help='History rows older than this are deleted; newer ones get an expiry this long after they were written')
+    parser.add_argument('--max-write-capacity', type=float, default=4,
+                        help='Write capacity units per second to spend on the operation status table')
+    parser.add_argument('--dry-run', action='store_true', help='Count the rows that would change without writing them')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    result = DynamoDBService().compact_operation_history(args.retention_days * 86400, args.max_write_capacity, args.dry_run)
+    print(json.dumps(result, indent=2))
+
+if __name__ == '__main__':
+    compact_operation_status()
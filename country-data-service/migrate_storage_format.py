@@ -0,0 +1,22 @@
+import argparse
+import json
+import logging
+from chalicelib.db_service import DynamoDBService
+from chalicelib.storage_format import FORMAT_MAP, FORMAT_COMPRESSED
+
+
+def migrate_storage_format():
+    parser = argparse.ArgumentParser(description='Rewrite stored country documents in the given storage format.')
+    parser.add_argument('--format-version', type=int, choices=[FORMAT_MAP, FORMAT_COMPRESSED], default=FORMAT_COMPRESSED,
+                        help='1 for nested DynamoDB maps, 2 for compressed JSON (use 1 to roll back)')
+    parser.add_argument('--max-write-capacity', type=float, default=4,
+                        help='Write capacity units per second to spend on the country table')
+    parser.add_argument('--dry-run', action='store_true', help='Count items that would be rewritten without writing them')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    result = DynamoDBService().migrate_country_items(args.format_version, args.max_write_capacity, args.dry_run)
+    print(json.dumps(result, indent=2))
+
+if __name__ == '__main__':
+    migrate_storage_format()
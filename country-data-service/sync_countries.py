@@ -0,0 +1,24 @@
+import argparse
+import json
+import logging
+import os
+from chalicelib.country_service import CountryService
+
+
+def sync_countries():
+    parser = argparse.ArgumentParser(description='Seed the country table from a single restcountries.com /all call.')
+    parser.add_argument('--max-write-capacity', type=float, default=float(os.environ.get('SYNC_MAX_WRITE_CAPACITY', 4)),
+                        help='Write capacity units per second to spend on the country table')
+    parser.add_argument('--dry-run', action='store_true', help='Report changed countries without writing them')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    callback_queue_url = os.environ.get('CALLBACK_QUEUE_URL')
+    if not callback_queue_url and not args.dry_run:
+        logging.warning("CALLBACK_QUEUE_URL is not set: callbacks registered on fetches this sync completes will be dropped")
+    country_service = CountryService(os.environ.get('SQS_QUEUE_URL'), callback_queue_url=callback_queue_url)
+    result = country_service.sync_all_countries(max_write_capacity_per_second=args.max_write_capacity, dry_run=args.dry_run)
+    print(json.dumps(result, indent=2))
+
+if __name__ == '__main__':
+    sync_countries()
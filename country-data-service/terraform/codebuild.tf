@@ -30,6 +30,10 @@ resource "aws_codebuild_project" "build" {
       name  = "SQS_QUEUE_URL"
       value = aws_sqs_queue.data_fetch_queue.url
     }
+    environment_variable {
+      name  = "CALLBACK_QUEUE_URL"
+      value = aws_sqs_queue.callback_queue.url
+    }
     environment_variable {
       name  = "SUBNET_IDS"
       value = join(",", aws_subnet.private[*].id)
@@ -11,6 +11,22 @@ resource "aws_dynamodb_table" "country_data" {
     name = "country"
     type = "S"
   }
+
+  attribute {
+    name = "attributes_hash"
+    type = "S"
+  }
+
+  # Sparse: only items carrying a query row have attributes_hash. The query engine scans
+  # this index instead of the document items.
+  global_secondary_index {
+    name               = "country-attributes"
+    hash_key           = "attributes_hash"
+    projection_type    = "INCLUDE"
+    non_key_attributes = ["attributes"]
+    read_capacity      = 5
+    write_capacity     = 5
+  }
 }
 
 resource "aws_dynamodb_table" "operation_status" {
@@ -32,4 +48,24 @@ resource "aws_dynamodb_table" "operation_status" {
     name = "timestamp"
     type = "N"
   }
-}
\ No newline at end of file
+
+  # History rows expire; the per-country latest-status item has no expires_at and is kept
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+}
+resource "aws_dynamodb_table" "country_aliases" {
+  name           = "${var.project_name}-country-aliases"
+
+  billing_mode   = "PROVISIONED"
+  read_capacity  = 5
+  write_capacity = 5
+
+  hash_key       = "alias"
+
+  attribute {
+    name = "alias"
+    type = "S"
+  }
+}
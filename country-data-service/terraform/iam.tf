@@ -68,13 +68,15 @@ resource "aws_iam_policy" "chalice_policy" {
           "sqs:DeleteMessage",
           "sqs:GetQueueAttributes"
         ]
-        Resource = aws_sqs_queue.data_fetch_queue.arn
+        Resource = [aws_sqs_queue.data_fetch_queue.arn, aws_sqs_queue.callback_queue.arn]
       },
       {
         Effect = "Allow"
         Action = [
           "dynamodb:GetItem",
+          "dynamodb:BatchGetItem",
           "dynamodb:PutItem",
+          "dynamodb:BatchWriteItem",
           "dynamodb:UpdateItem",
           "dynamodb:DeleteItem",
           "dynamodb:Query",
@@ -24,4 +24,34 @@ resource "aws_sqs_queue_redrive_policy" "data_fetch_queue" {
     deadLetterTargetArn = aws_sqs_queue.data_fetch_dlq.arn
     maxReceiveCount     = 5
   })
-}
\ No newline at end of file
+}
+
+# Webhook deliveries for finished fetches. A failed delivery becomes visible again after
+# the visibility timeout, so each receiver gets up to maxReceiveCount attempts.
+resource "aws_sqs_queue" "callback_queue" {
+  name                       = "${var.project_name}-callback-queue"
+  delay_seconds              = 0
+  max_message_size           = 4096
+  message_retention_seconds  = 86400
+  receive_wait_time_seconds  = 0
+  visibility_timeout_seconds = 60
+  sqs_managed_sse_enabled    = true
+}
+
+resource "aws_sqs_queue" "callback_dlq" {
+  name = "${var.project_name}-callback-dlq"
+
+  redrive_allow_policy = jsonencode({
+    redrivePermission = "byQueue",
+    sourceQueueArns   = [aws_sqs_queue.callback_queue.arn]
+  })
+}
+
+resource "aws_sqs_queue_redrive_policy" "callback_queue" {
+  queue_url = aws_sqs_queue.callback_queue.id
+
+  redrive_policy = jsonencode({
+    deadLetterTargetArn = aws_sqs_queue.callback_dlq.arn
+    maxReceiveCount     = 8
+  })
+}
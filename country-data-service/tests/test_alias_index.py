@@ -0,0 +1,79 @@
+import pytest
+from unittest.mock import Mock
+from chalicelib.alias_index import AliasIndex, extract_aliases
+
+
+FRANCE = {
+    "name": {
+        "common": "France",
+        "official": "French Republic",
+        "nativeName": {"fra": {"official": "République française", "common": "France"}}
+    },
+    "cca2": "FR",
+    "cca3": "FRA",
+    "ccn3": "250",
+    "altSpellings": ["FR", "French Republic", "République française"]
+}
+
+
+class TestAliasIndex:
+    @pytest.fixture
+    def db_service(self):
+        db_service = Mock()
+        db_service.get_country_alias.return_value = None
+        db_service.batch_get_country_aliases.return_value = {}
+        return db_service
+
+    @pytest.fixture
+    def alias_index(self, db_service):
+        return AliasIndex(db_service)
+
+    def test_extract_aliases(self):
+        assert extract_aliases(FRANCE) == {
+            "fr", "fra", "250", "france", "french-republic", "république-française"
+        }
+
+    def test_packaged_aliases_resolve_without_round_trip(self, db_service):
+        alias_index = AliasIndex(db_service, {"fr": "france", "usa": "united-states", "korea": None})
+
+        assert alias_index.resolve("FR") == "france"
+        assert alias_index.resolve_many(["usa", "fr"]) == {"usa": "united-states", "fr": "france"}
+        db_service.get_country_alias.assert_not_called()
+        db_service.batch_get_country_aliases.assert_not_called()
+
+        assert alias_index.resolve("korea") is None
+        db_service.get_country_alias.assert_called_once_with("korea")
+
+    def test_register_and_resolve_without_round_trip(self, alias_index, db_service):
+        alias_index.register("france", FRANCE)
+
+        assert alias_index.resolve("FR") == "france"
+        assert alias_index.resolve("fra") == "france"
+        assert alias_index.resolve("French Republic") == "france"
+        db_service.get_country_alias.assert_not_called()
+
+    def test_resolve_falls_back_to_dynamodb(self, alias_index, db_service):
+        db_service.get_country_alias.return_value = "france"
+
+        assert alias_index.resolve("fr") == "france"
+        assert alias_index.resolve("fr") == "france"
+        db_service.get_country_alias.assert_called_once_with("fr")
+
+    def test_unknown_alias_is_negatively_cached(self, alias_index, db_service):
+        assert alias_index.resolve("zz") is None
+        assert alias_index.resolve("zz") is None
+        db_service.get_country_alias.assert_called_once_with("zz")
+
+    def test_resolve_many_uses_batch_get(self, alias_index, db_service):
+        alias_index.register("france", FRANCE)
+        db_service.batch_get_country_aliases.return_value = {"deu": "germany"}
+
+        result = alias_index.resolve_many(["fr", "deu", "narnia"])
+
+        assert result == {"fr": "france", "deu": "germany"}
+        db_service.batch_get_country_aliases.assert_called_once_with(["deu", "narnia"])
+
+    def test_resolve_returns_none_on_dynamodb_error(self, alias_index, db_service):
+        db_service.get_country_alias.side_effect = Exception("Throttled")
+
+        assert alias_index.resolve("fr") is None
@@ -1,14 +1,25 @@
 import pytest
 from chalice.test import Client
+import app as app_module
 from app import app
 from unittest.mock import patch
 from chalice import NotFoundError, BadRequestError
 import json
+import os
+import subprocess
+import sys
 
 @pytest.fixture
 def test_client():
     return Client(app)
 
+@pytest.fixture(autouse=True)
+def mock_alias_lookup():
+    # Keep alias resolution in memory so short inputs never reach DynamoDB
+    with patch('app.country_service.db_service.get_country_alias', return_value=None), \
+         patch('app.country_service.db_service.batch_get_country_aliases', return_value={}):
+        yield
+
 def test_index_route(test_client):
     response = test_client.http.get("/")
     assert response.status_code == 200
@@ -17,9 +28,13 @@ def test_index_route(test_client):
         'version': '1.0.0',
         'description': 'Provides information about countries, including fetching and storing country data.',
         'endpoints': {
-            '/fetch/{country}': 'GET - Fetch country data from external API',
-            '/country/{country}': 'GET - Retrieve stored country data',
-            '/status/{country}': 'GET - Check operation status for a country'
+            '/fetch/{country}': 'GET - Fetch country data from external API. Optional ?callback=https://... is notified when a PENDING fetch finishes',
+            '/fetch': 'POST - Fetch data for multiple countries. Body: {"countries": ["france", "costa-rica"], "callback": "https://..."} (callback optional)',
+            '/country/{country}': 'GET - Retrieve stored country data. Optional ?fields=name,capital returns only those fields',
+            '/countries?names={country},{country}': 'GET - Retrieve stored data for multiple countries. Accepts ?fields= too',
+            '/search?q={query}': 'GET - Search countries by partial or misspelled name',
+            '/query?region={region}&population_min={n}&sort=-population': 'GET - Filter, sort and page countries by attributes',
+            '/status/{country}': 'GET - Check operation status for a country. Optional ?wait=10 waits up to that many seconds for a PENDING operation to finish'
         },
         'usage': 'Replace {country} with a country name. For multi-word country names, use dashes (e.g., "united-states").',
         'examples': [
@@ -37,22 +52,44 @@ def test_initiate_country_fetch(mock_fetch, test_client):
     assert response.status_code == 200
     assert response.json_body == {"country": "france", "status": "PENDING"}
 
+@patch('app.country_service.fetch_country_data')
+def test_initiate_country_fetch_with_callback(mock_fetch, test_client):
+    mock_fetch.return_value = {"country": "france", "status": "PENDING"}
+    response = test_client.http.get("/fetch/france?callback=https://example.com/hook")
+    assert response.status_code == 200
+    mock_fetch.assert_called_once_with("france", "https://example.com/hook")
+
+@patch('app.country_service.fetch_countries_data')
+def test_bulk_fetch_rejects_invalid_callback(mock_fetch, test_client):
+    response = test_client.http.post("/fetch", headers={"Content-Type": "application/json"},
+                                     body=json.dumps({"countries": ["france"], "callback": "http://example.com/hook"}))
+    assert response.status_code == 400
+    assert "https URL" in response.json_body["Message"]
+    mock_fetch.assert_not_called()
+
+@patch('app.country_service.suggest_country_name', return_value='france')
+@patch('app.country_service.validate_country_name', return_value=False)
+def test_initiate_fetch_unknown_country_suggests_match(mock_validate, mock_suggest, test_client):
+    response = test_client.http.get("/fetch/frnace")
+    assert response.status_code == 400
+    assert response.json_body["Message"].endswith("Did you mean 'france'?")
+
 def test_initiate_fetch_invalid_country(test_client):
     response = test_client.http.get("/fetch/123")
     assert response.status_code == 400
     assert "Invalid country name" in response.json_body["Message"]
 
-@patch('app.country_service.get_country_data')
+@patch('app.country_service.get_country_document')
 def test_retrieve_country_info(mock_get_data, test_client):
-    mock_get_data.return_value = {"name": "France", "capital": "Paris"}
+    mock_get_data.return_value = ({"name": "France", "capital": "Paris"}, "abc")
     response = test_client.http.get("/country/france")
     assert response.status_code == 200
     assert response.json_body == {"name": "France", "capital": "Paris"}
 
-@patch('app.country_service.get_country_data')
+@patch('app.country_service.get_country_document')
 def test_retrieve_nonexistent_country(mock_get_data, test_client):
     mock_get_data.side_effect = NotFoundError("Country not found")
-    response = test_client.http.get("/country/narnia")
+    response = test_client.http.get("/country/tuvalu")
     assert response.status_code == 404
     assert "Country not found" in response.json_body["Message"]
 
@@ -62,11 +99,26 @@ def test_check_fetch_status(mock_check_status, test_client):
     response = test_client.http.get("/status/france")
     assert response.status_code == 200
     assert response.json_body == {"status": "COMPLETED"}
+    mock_check_status.assert_called_once_with("france", 0)
+
+@patch('app.country_service.check_operation_status')
+def test_check_status_wait(mock_check_status, test_client):
+    mock_check_status.return_value = {"status": "COMPLETED"}
+    response = test_client.http.get("/status/france?wait=15")
+    assert response.status_code == 200
+    mock_check_status.assert_called_once_with("france", 15)
+
+@patch('app.country_service.check_operation_status')
+def test_check_status_wait_out_of_range(mock_check_status, test_client):
+    response = test_client.http.get("/status/france?wait=60")
+    assert response.status_code == 400
+    assert "between 0 and 20" in response.json_body["Message"]
+    mock_check_status.assert_not_called()
 
 @patch('app.country_service.check_operation_status')
 def test_check_status_no_operation(mock_check_status, test_client):
     mock_check_status.side_effect = NotFoundError("No operation found")
-    response = test_client.http.get("/status/narnia")
+    response = test_client.http.get("/status/tuvalu")
     assert response.status_code == 404
     assert "No operation found" in response.json_body["Message"]
 
@@ -75,15 +127,15 @@ def test_fetch_and_save_country_data(mock_fetch_and_save, test_client):
     mock_fetch_and_save.return_value = True
     event = test_client.events.generate_sqs_event([json.dumps({"country": "france"})])
     response = test_client.lambda_.invoke("handle_sqs_message", event)
-    assert response.payload is None
+    assert response.payload == {"batchItemFailures": []}
     mock_fetch_and_save.assert_called_once_with("france")
 
 @patch('app.country_service.fetch_and_save_country_data')
 def test_fetch_and_save_country_data_failure(mock_fetch_and_save, test_client):
     mock_fetch_and_save.return_value = False
     event = test_client.events.generate_sqs_event([json.dumps({"country": "france"})])
-    with pytest.raises(BadRequestError, match="Failed to process 1 messages"):
-        test_client.lambda_.invoke("handle_sqs_message", event)
+    response = test_client.lambda_.invoke("handle_sqs_message", event)
+    assert response.payload == {"batchItemFailures": [{"itemIdentifier": "message-id"}]}
 
 def test_fetch_invalid_country_name_too_short(test_client):
     response = test_client.http.get("/fetch/ab")
@@ -101,7 +153,7 @@ def test_fetch_invalid_country_name_with_special_characters(test_client):
     assert "Invalid country name" in response.json_body["Message"]
 
 def test_retrieve_country_info_invalid_name(test_client):
-    response = test_client.http.get("/country/fr")
+    response = test_client.http.get("/country/zz")
     assert response.status_code == 400
     assert "Invalid country name" in response.json_body["Message"]
 
@@ -110,9 +162,170 @@ def test_check_fetch_status_invalid_name(test_client):
     assert response.status_code == 400
     assert "Invalid country name" in response.json_body["Message"]
 
+def test_fetch_iso_code_resolves_to_catalog_name(test_client):
+    with patch('app.country_service.claim_fetch', return_value=(True, {"status": "PENDING"})) as mock_claim, \
+         patch('app.country_service.is_known_missing', return_value=False), \
+         patch('app.country_service.queue_service') as mock_queue:
+        response = test_client.http.get("/fetch/fr")
+
+    assert response.status_code == 200
+    assert response.json_body == {"country": "france", "status": "PENDING"}
+    mock_claim.assert_called_once_with("france", None)
+    mock_queue.send_message.assert_called_once_with({"country": "france"})
+
 def test_fetch_valid_country_name_with_hyphen(test_client):
     with patch('app.country_service.fetch_country_data') as mock_fetch:
         mock_fetch.return_value = {"country": "costa-rica", "status": "PENDING"}
         response = test_client.http.get("/fetch/costa-rica")
         assert response.status_code == 200
         assert response.json_body == {"country": "costa-rica", "status": "PENDING"}
+
+@patch('app.country_service.fetch_countries_data')
+def test_bulk_fetch_country_data(mock_fetch, test_client):
+    mock_fetch.return_value = {"france": {"country": "france", "status": "PENDING"}}
+    response = test_client.http.post("/fetch", headers={"Content-Type": "application/json"},
+                                     body=json.dumps({"countries": ["france"]}))
+    assert response.status_code == 200
+    assert response.json_body == {"results": {"france": {"country": "france", "status": "PENDING"}}}
+    mock_fetch.assert_called_once_with(["france"], None)
+
+def test_bulk_fetch_missing_countries(test_client):
+    response = test_client.http.post("/fetch", headers={"Content-Type": "application/json"},
+                                     body=json.dumps({"names": ["france"]}))
+    assert response.status_code == 400
+    assert "'countries' list" in response.json_body["Message"]
+
+def test_bulk_fetch_too_many_countries(test_client):
+    response = test_client.http.post("/fetch", headers={"Content-Type": "application/json"},
+                                     body=json.dumps({"countries": ["france"] * 301}))
+    assert response.status_code == 400
+    assert "maximum" in response.json_body["Message"]
+
+@patch('app.country_service.get_countries_document')
+def test_retrieve_multiple_countries(mock_get_countries, test_client):
+    mock_get_countries.return_value = ({"countries": {"france": {"name": "France"}}, "missing": ["tuvalu"]}, "abc")
+    response = test_client.http.get("/countries?names=france,tuvalu")
+    assert response.status_code == 200
+    assert response.json_body == {"countries": {"france": {"name": "France"}}, "missing": ["tuvalu"]}
+    mock_get_countries.assert_called_once_with(["france", "tuvalu"], None)
+
+def test_retrieve_multiple_countries_missing_names(test_client):
+    response = test_client.http.get("/countries")
+    assert response.status_code == 400
+    assert "'names'" in response.json_body["Message"]
+
+def test_retrieve_multiple_countries_invalid_name(test_client):
+    response = test_client.http.get("/countries?names=france,zz")
+    assert response.status_code == 400
+    assert "Invalid country name 'zz'" in response.json_body["Message"]
+
+@patch('app.country_service.sync_all_countries')
+def test_sync_country_catalog(mock_sync, test_client):
+    mock_sync.return_value = {'fetched': 250, 'changed': 0, 'unchanged': 250, 'skipped': 0, 'dry_run': False}
+    event = test_client.events.generate_cw_event(source="aws.events", detail_type="Scheduled Event", detail={}, resources=[])
+    response = test_client.lambda_.invoke("sync_country_catalog", event)
+    assert response.payload['unchanged'] == 250
+    mock_sync.assert_called_once_with(max_write_capacity_per_second=4.0)
+
+@patch('app.country_service.get_stored_document')
+def test_retrieve_country_info_by_iso_code(mock_get_stored, test_client):
+    mock_get_stored.return_value = ({"name": {"common": "France"}, "cca2": "FR"}, "abc")
+    with patch.dict(app_module.country_service.alias_index.aliases, {"fr": "france"}):
+        response = test_client.http.get("/country/FR")
+    assert response.status_code == 200
+    mock_get_stored.assert_called_once_with("france", None)
+
+@patch('app.country_service.search_countries')
+def test_search_countries(mock_search, test_client):
+    mock_search.return_value = {"query": "fran", "results": [{"country": "france", "match": "france", "score": 1.667}]}
+    response = test_client.http.get("/search?q=fran&limit=5")
+    assert response.status_code == 200
+    assert response.json_body["results"][0]["country"] == "france"
+    mock_search.assert_called_once_with("fran", 5)
+
+def test_search_countries_query_too_short(test_client):
+    response = test_client.http.get("/search?q=f")
+    assert response.status_code == 400
+
+def test_search_countries_invalid_limit(test_client):
+    response = test_client.http.get("/search?q=fran&limit=100")
+    assert response.status_code == 400
+
+@patch('app.country_service.query_countries')
+def test_query_countries(mock_query, test_client):
+    mock_query.return_value = {"total": 1, "offset": 0, "limit": 10, "results": [{"country": "france"}]}
+    response = test_client.http.get("/query?region=Europe,Asia&population_min=1000000&sort=-population&limit=10")
+    assert response.status_code == 200
+    assert response.json_body["results"] == [{"country": "france"}]
+    mock_query.assert_called_once_with(
+        {'region': ['Europe', 'Asia']}, {'population': (1000000, None)}, 'population', True, 0, 10
+    )
+
+def test_query_countries_invalid_sort(test_client):
+    response = test_client.http.get("/query?sort=capital")
+    assert response.status_code == 400
+
+def test_query_countries_invalid_range(test_client):
+    response = test_client.http.get("/query?area_min=big")
+    assert response.status_code == 400
+
+def test_query_countries_limit_too_large(test_client):
+    response = test_client.http.get("/query?limit=500")
+    assert response.status_code == 400
+
+@patch('app.country_service.get_country_document')
+def test_retrieve_country_info_with_fields(mock_get_data, test_client):
+    mock_get_data.return_value = ({"name": {"common": "France"}, "population": 68000000}, "abc")
+    response = test_client.http.get("/country/france?fields=population,name.common")
+    assert response.status_code == 200
+    mock_get_data.assert_called_once_with("france", [("name", "common"), ("population",)])
+
+def test_retrieve_country_info_invalid_fields(test_client):
+    response = test_client.http.get("/country/france?fields=name;drop")
+    assert response.status_code == 400
+    assert "'fields'" in response.json_body["Message"]
+
+@patch('app.country_service.get_countries_document')
+def test_retrieve_multiple_countries_with_fields(mock_get_countries, test_client):
+    mock_get_countries.return_value = ({"countries": {}, "missing": []}, "abc")
+    response = test_client.http.get("/countries?names=france&fields=capital")
+    assert response.status_code == 200
+    mock_get_countries.assert_called_once_with(["france"], [("capital",)])
+
+@patch('app.country_service.get_country_document')
+def test_retrieve_country_info_returns_etag(mock_get_data, test_client):
+    mock_get_data.return_value = ({"name": "France"}, "stored-hash")
+    response = test_client.http.get("/country/france")
+    assert response.status_code == 200
+    assert response.headers["ETag"] == '"stored-hash"'
+
+@patch('app.country_service.get_country_document')
+def test_retrieve_country_info_not_modified(mock_get_data, test_client):
+    mock_get_data.return_value = ({"name": "France"}, "stored-hash")
+    etag = '"stored-hash"'
+    response = test_client.http.get("/country/france", headers={"If-None-Match": f'"other", W/{etag}'})
+    assert response.status_code == 304
+    assert response.body == b''
+    assert response.headers["ETag"] == etag
+
+@patch('app.country_service.get_country_document')
+def test_retrieve_country_info_modified(mock_get_data, test_client):
+    mock_get_data.return_value = ({"name": "France"}, "stored-hash")
+    response = test_client.http.get("/country/france", headers={"If-None-Match": '"stale"'})
+    assert response.status_code == 200
+    assert response.json_body == {"name": "France"}
+
+@patch('app.country_service.get_countries_document')
+def test_retrieve_multiple_countries_not_modified(mock_get_countries, test_client):
+    mock_get_countries.return_value = ({"countries": {"france": {"name": "France"}}, "missing": []}, "combined-hash")
+    first = test_client.http.get("/countries?names=france")
+    second = test_client.http.get("/countries?names=france", headers={"If-None-Match": first.headers["ETag"]})
+    assert first.status_code == 200
+    assert second.status_code == 304
+
+def test_import_defers_heavy_clients():
+    # Run in a fresh interpreter; this test process has already imported everything
+    probe = "import sys, app; print(sorted(m for m in ('boto3', 'redis', 'requests') if m in sys.modules))"
+    output = subprocess.run([sys.executable, '-c', probe], cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            env=dict(os.environ, AWS_DEFAULT_REGION='us-east-1'), capture_output=True, text=True, check=True)
+    assert output.stdout.strip() == '[]'
@@ -0,0 +1,55 @@
+import pytest
+from chalicelib.cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTTLCache:
+    @pytest.fixture
+    def clock(self):
+        return FakeClock()
+
+    @pytest.fixture
+    def cache(self, clock):
+        return TTLCache(max_size=2, ttl_seconds=60, clock=clock)
+
+    def test_get_miss(self, cache):
+        assert cache.get("france") is None
+        assert cache.stats()['misses'] == 1
+
+    def test_set_and_get_hit(self, cache):
+        cache.set("france", {"name": "France"})
+
+        assert cache.get("france") == {"name": "France"}
+        assert cache.stats()['hits'] == 1
+
+    def test_entry_expires_after_ttl(self, cache, clock):
+        cache.set("france", {"name": "France"})
+        clock.now = 61
+
+        assert cache.get("france") is None
+        assert cache.stats()['evictions'] == 1
+        assert len(cache) == 0
+
+    def test_least_recently_used_is_evicted(self, cache):
+        cache.set("france", {"name": "France"})
+        cache.set("germany", {"name": "Germany"})
+        cache.get("france")
+        cache.set("spain", {"name": "Spain"})
+
+        assert cache.get("germany") is None
+        assert cache.get("france") == {"name": "France"}
+        assert cache.get("spain") == {"name": "Spain"}
+        assert cache.stats()['evictions'] == 1
+
+    def test_invalidate(self, cache):
+        cache.set("france", {"name": "France"})
+        cache.invalidate("france")
+
+        assert cache.get("france") is None
@@ -0,0 +1,95 @@
+import pytest
+from chalicelib.circuit_breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+from chalicelib.metrics import InvocationMetrics
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestCircuitBreaker:
+    @pytest.fixture
+    def clock(self):
+        return FakeClock()
+
+    @pytest.fixture
+    def recorder(self):
+        return InvocationMetrics()
+
+    @pytest.fixture
+    def breaker(self, clock, recorder):
+        return CircuitBreaker('redis', failure_threshold=3, reset_timeout_seconds=30, clock=clock, recorder=recorder)
+
+    def test_closed_allows_requests(self, breaker):
+        assert breaker.allow_request() == True
+        assert breaker.state == CLOSED
+
+    def test_trips_after_threshold_failures(self, breaker):
+        for _ in range(3):
+            breaker.record_failure()
+
+        assert breaker.state == OPEN
+        assert breaker.allow_request() == False
+        assert breaker.stats()['trips'] == 1
+        assert breaker.stats()['short_circuited'] == 1
+
+    def test_success_resets_failure_count(self, breaker):
+        breaker.record_failure()
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+
+        assert breaker.state == CLOSED
+
+    def test_half_open_allows_single_probe_after_cool_down(self, breaker, clock):
+        for _ in range(3):
+            breaker.record_failure()
+        clock.now = 31
+
+        assert breaker.allow_request() == True
+        assert breaker.state == HALF_OPEN
+        assert breaker.allow_request() == False
+
+    def test_successful_probe_closes_breaker(self, breaker, clock):
+        for _ in range(3):
+            breaker.record_failure()
+        clock.now = 31
+        breaker.allow_request()
+
+        breaker.record_success()
+
+        assert breaker.state == CLOSED
+        assert breaker.allow_request() == True
+
+    def test_failed_probe_reopens_breaker(self, breaker, clock):
+        for _ in range(3):
+            breaker.record_failure()
+        clock.now = 31
+        breaker.allow_request()
+
+        breaker.record_failure()
+
+        assert breaker.state == OPEN
+        assert breaker.allow_request() == False
+        assert breaker.stats()['trips'] == 2
+
+    def test_records_state_trips_and_short_circuits(self, breaker, clock, recorder):
+        breaker.allow_request()
+        assert recorder.counts == {'RedisCircuitState': 0}
+
+        for _ in range(3):
+            breaker.record_failure()
+        breaker.allow_request()
+        breaker.allow_request()
+
+        assert recorder.counts == {'RedisCircuitState': 2, 'RedisCircuitTrips': 1, 'RedisCircuitShortCircuits': 2}
+
+        clock.now = 31
+        breaker.allow_request()
+        assert recorder.counts['RedisCircuitState'] == 1
+        breaker.record_success()
+        assert recorder.counts['RedisCircuitState'] == 0
@@ -1,29 +1,115 @@
+import json
+import threading
 import pytest
-from unittest.mock import Mock, patch
-from chalicelib.country_service import CountryDataFetcher
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest.mock import Mock
+from chalicelib.country_service import CountryDataFetcher, CountryNotFoundError
+from chalicelib.http_client import create_http_session
+
+
+class StubRestCountriesHandler(BaseHTTPRequestHandler):
+    # Responses are popped in order; the last one is repeated
+    responses = []
+    requests_seen = []
+
+    def do_GET(self):
+        self.requests_seen.append(self.path)
+        status, headers, body = self.responses[0] if len(self.responses) == 1 else self.responses.pop(0)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(json.dumps(body).encode())
+
+    def log_message(self, format, *args):
+        pass
 
 
 class TestCountryDataFetcher:
     @pytest.fixture
-    def country_data_fetcher(self):
-        return CountryDataFetcher()
+    def mock_session(self):
+        return Mock()
+
+    @pytest.fixture
+    def country_data_fetcher(self, mock_session):
+        return CountryDataFetcher(session=mock_session)
 
-    @patch('chalicelib.country_service.requests.get')
-    def test_fetch_country_data_success(self, mock_get, country_data_fetcher):
+    @pytest.fixture
+    def stub_server(self):
+        StubRestCountriesHandler.responses = []
+        StubRestCountriesHandler.requests_seen = []
+        server = HTTPServer(('127.0.0.1', 0), StubRestCountriesHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield server
+        server.shutdown()
+        server.server_close()
+
+    def test_fetch_country_data_success(self, mock_session, country_data_fetcher):
         mock_response = Mock()
         mock_response.json.return_value = [{"name": "France"}]
-        mock_get.return_value = mock_response
+        mock_session.get.return_value = mock_response
         
         result = country_data_fetcher.fetch_country_data("France")
         
         assert result == {"name": "France"}
-        mock_get.assert_called_once_with("https://restcountries.com/v3.1/name/France?fullText=true")
+        mock_session.get.assert_called_once_with(
+            "https://restcountries.com/v3.1/name/France?fullText=true",
+            timeout=country_data_fetcher.timeout
+        )
 
-    @patch('chalicelib.country_service.requests.get')
-    def test_fetch_country_data_not_found(self, mock_get, country_data_fetcher):
+    def test_fetch_country_data_not_found(self, mock_session, country_data_fetcher):
         mock_response = Mock()
         mock_response.json.return_value = []
-        mock_get.return_value = mock_response
+        mock_session.get.return_value = mock_response
         
         with pytest.raises(ValueError):
             country_data_fetcher.fetch_country_data("Nonexistent")
+
+    def test_fetch_all_countries(self, mock_session, country_data_fetcher):
+        mock_response = Mock()
+        mock_response.json.return_value = [{"name": {"common": "France"}}, {"name": {"common": "Spain"}}]
+        mock_session.get.return_value = mock_response
+
+        result = country_data_fetcher.fetch_all_countries()
+
+        assert len(result) == 2
+        mock_session.get.assert_called_once_with(
+            "https://restcountries.com/v3.1/all",
+            timeout=country_data_fetcher.timeout
+        )
+
+    def test_fetch_all_countries_with_fields(self, mock_session, country_data_fetcher):
+        mock_response = Mock()
+        mock_response.json.return_value = [{"name": {"common": "France"}, "cca2": "FR"}]
+        mock_session.get.return_value = mock_response
+
+        country_data_fetcher.fetch_all_countries(('name', 'cca2'))
+
+        mock_session.get.assert_called_once_with(
+            "https://restcountries.com/v3.1/all?fields=name,cca2",
+            timeout=country_data_fetcher.timeout
+        )
+
+    def test_fetch_country_data_retries_server_errors(self, stub_server):
+        StubRestCountriesHandler.responses = [
+            (503, {'Retry-After': '0'}, {"message": "Service Unavailable"}),
+            (200, {'Content-Type': 'application/json'}, [{"name": "France"}])
+        ]
+        base_url = f"http://127.0.0.1:{stub_server.server_port}/v3.1"
+        fetcher = CountryDataFetcher(session=create_http_session(), base_url=base_url, timeout=(1, 1))
+
+        result = fetcher.fetch_country_data("france")
+
+        assert result == {"name": "France"}
+        assert len(StubRestCountriesHandler.requests_seen) == 2
+
+    def test_fetch_country_data_does_not_retry_not_found(self, stub_server):
+        StubRestCountriesHandler.responses = [(404, {}, {"message": "Not Found"})]
+        base_url = f"http://127.0.0.1:{stub_server.server_port}/v3.1"
+        fetcher = CountryDataFetcher(session=create_http_session(), base_url=base_url, timeout=(1, 1))
+
+        with pytest.raises(CountryNotFoundError):
+            fetcher.fetch_country_data("frnace")
+
+        assert len(StubRestCountriesHandler.requests_seen) == 1
@@ -1,14 +1,34 @@
+import json
 import pytest
 from unittest.mock import Mock, patch
 from chalice import NotFoundError
-from chalicelib.country_service import CountryService
+from chalicelib.country_service import CountryService, CountryNotFoundError, COUNTRY_CATALOG_PATH
+from chalicelib.utils import content_hash
 
 
 class TestCountryService:
+    @pytest.fixture(autouse=True)
+    def no_country_catalog(self):
+        # Tests opt in to the packaged catalog with packaged_catalog
+        with patch('chalicelib.country_service.COUNTRY_CATALOG_PATH', '/nonexistent/country_catalog.json'):
+            yield
+
+    @pytest.fixture
+    def packaged_catalog(self):
+        with patch('chalicelib.country_service.COUNTRY_CATALOG_PATH', COUNTRY_CATALOG_PATH):
+            yield
+
     @pytest.fixture
     def mock_db_service(self):
         with patch('chalicelib.country_service.DynamoDBService') as mock:
             mock_instance = Mock()
+            mock_instance.get_country_alias.return_value = None
+            mock_instance.batch_get_country_aliases.return_value = {}
+            mock_instance.get_country_attributes.return_value = {}
+            mock_instance.finish_fetch_operation.return_value = []
+            mock_instance.claim_fetch_operation.return_value = (True, {'status': 'PENDING'})
+            mock_instance.batch_finish_fetch_operations.return_value = {}
+            mock_instance.get_all_country_aliases.return_value = {}
             mock.return_value = mock_instance
             yield mock_instance
 
@@ -31,36 +51,86 @@ class TestCountryService:
         with patch('chalicelib.country_service.DynamoDBService', return_value=mock_db_service), \
              patch('chalicelib.country_service.QueueService', return_value=mock_queue_service), \
              patch('chalicelib.country_service.CountryDataFetcher', return_value=mock_country_data_fetcher):
-            return CountryService("http://fake-queue-url")
+            return CountryService("http://fake-queue-url", callback_queue_url="http://fake-callback-queue-url")
 
     def test_standardize_country_identifier(self, country_service):
         assert country_service.standardize_country_identifier("United States") == "united-states"
         assert country_service.standardize_country_identifier("North Korea") == "north-korea"
 
     def test_fetch_country_data_new_country(self, country_service, mock_db_service, mock_queue_service):
-        mock_db_service.get_country_data.return_value = None
-        mock_db_service.is_operation_in_progress.return_value = False
+        mock_db_service.claim_fetch_operation.return_value = (True, {"status": "PENDING"})
         
         result = country_service.fetch_country_data("France")
         
         assert result == {"country": "france", "status": "PENDING"}
-        mock_db_service.save_operation_status.assert_called_once_with("france", "PENDING")
-        mock_queue_service.send_message.assert_called_once()
+        mock_db_service.claim_fetch_operation.assert_called_once_with("france", None)
+        mock_db_service.get_country_document.assert_not_called()
+        mock_queue_service.send_message.assert_called_once_with({'country': 'france'})
 
-    def test_fetch_country_data_existing_country(self, country_service, mock_db_service):
-        mock_db_service.get_country_data.return_value = {"name": "France"}
+    def test_fetch_country_data_existing_country(self, country_service, mock_db_service, mock_queue_service):
+        mock_db_service.claim_fetch_operation.return_value = (False, {"status": "COMPLETED"})
         
         result = country_service.fetch_country_data("France")
         
         assert result == {"country": "france", "status": "COMPLETED"}
+        mock_queue_service.send_message.assert_not_called()
+
+    def test_fetch_country_data_cached_country(self, country_service, mock_db_service):
+        country_service.country_cache.set("france", ({"name": "France"}, "stored-hash"))
+
+        result = country_service.fetch_country_data("France")
+
+        assert result == {"country": "france", "status": "COMPLETED"}
+        mock_db_service.claim_fetch_operation.assert_not_called()
 
-    def test_fetch_country_data_operation_in_progress(self, country_service, mock_db_service):
-        mock_db_service.get_country_data.return_value = None
-        mock_db_service.is_operation_in_progress.return_value = True
+    def test_fetch_country_data_operation_in_progress(self, country_service, mock_db_service, mock_queue_service):
+        mock_db_service.claim_fetch_operation.return_value = (False, {"status": "PENDING"})
         
         result = country_service.fetch_country_data("France")
         
         assert result == {"country": "france", "status": "PENDING"}
+        mock_queue_service.send_message.assert_not_called()
+
+    def test_fetch_country_data_registers_callback_on_pending_fetch(self, country_service, mock_db_service):
+        mock_db_service.claim_fetch_operation.return_value = (False, {"status": "PENDING"})
+        mock_db_service.add_operation_callback.return_value = (True, None)
+
+        result = country_service.fetch_country_data("France", "https://example.com/hook")
+
+        assert result == {"country": "france", "status": "PENDING"}
+        mock_db_service.claim_fetch_operation.assert_called_once_with("france", "https://example.com/hook")
+        mock_db_service.add_operation_callback.assert_called_once_with("france", "https://example.com/hook")
+
+    def test_fetch_country_data_callback_after_fetch_finished(self, country_service, mock_db_service):
+        mock_db_service.claim_fetch_operation.return_value = (False, {"status": "PENDING"})
+        mock_db_service.add_operation_callback.return_value = (False, {"status": "COMPLETED"})
+
+        result = country_service.fetch_country_data("France", "https://example.com/hook")
+
+        # The fetch finished in between, so the final status is returned instead
+        assert result == {"country": "france", "status": "COMPLETED"}
+
+    def test_fetch_country_data_known_missing_country(self, country_service, mock_db_service, mock_queue_service):
+        country_service.negative_cache.add("frnace")
+
+        with patch('chalicelib.country_service.metrics') as mock_metrics:
+            result = country_service.fetch_country_data("frnace")
+
+        assert result == {"country": "frnace", "status": "NOT_FOUND"}
+        mock_metrics.increment.assert_called_once_with('NegativeCacheHits')
+        mock_db_service.claim_fetch_operation.assert_not_called()
+        mock_queue_service.send_message.assert_not_called()
+
+    def test_fetch_country_data_enqueue_failure_releases_claim(self, country_service, mock_db_service, mock_queue_service):
+        mock_db_service.claim_fetch_operation.return_value = (True, {"status": "PENDING"})
+        mock_queue_service.send_message.side_effect = Exception("SQS unavailable")
+
+        with pytest.raises(Exception):
+            country_service.fetch_country_data("France")
+
+        mock_db_service.finish_fetch_operation.assert_called_once_with(
+            "france", "FAILED", "Failed to enqueue fetch request: SQS unavailable"
+        )
 
     @patch('chalicelib.country_service.CountryDataFetcher')
     def test_fetch_and_save_country_data_success(self, mock_fetcher, country_service, mock_db_service):
@@ -70,7 +140,7 @@ class TestCountryService:
         result = country_service.fetch_and_save_country_data("France")
         
         assert result == True
-        mock_db_service.save_operation_status.assert_called_with("france", "COMPLETED")
+        mock_db_service.finish_fetch_operation.assert_called_with("france", "COMPLETED")
 
     @patch('chalicelib.country_service.CountryDataFetcher')
     def test_fetch_and_save_country_data_failure(self, MockCountryDataFetcher, country_service, mock_db_service):
@@ -79,17 +149,17 @@ class TestCountryService:
         result = country_service.fetch_and_save_country_data("France")
         
         assert result == False
-        mock_db_service.save_operation_status.assert_called_with("france", "FAILED", "API Error")
+        mock_db_service.finish_fetch_operation.assert_called_with("france", "FAILED", "API Error")
 
     def test_get_country_data_success(self, country_service, mock_db_service):
-        mock_db_service.get_country_data.return_value = {"name": "France"}
+        mock_db_service.get_country_document.return_value = ({"name": "France"}, "stored-hash")
         
         result = country_service.get_country_data("France")
         
         assert result == {"name": "France"}
 
     def test_get_country_data_not_found(self, country_service, mock_db_service):
-        mock_db_service.get_country_data.return_value = None
+        mock_db_service.get_country_document.return_value = None
         
         with pytest.raises(NotFoundError):
             country_service.get_country_data("Nonexistent")
@@ -105,4 +175,485 @@ class TestCountryService:
         mock_db_service.get_operation_status.return_value = None
         
         with pytest.raises(NotFoundError):
-            country_service.check_operation_status("Nonexistent")
\ No newline at end of file
+            country_service.check_operation_status("Nonexistent")
+
+    def test_check_operation_status_waits_for_signal(self, country_service, mock_db_service):
+        mock_db_service.get_operation_status.side_effect = [
+            {"status": "PENDING", "timestamp": 100},
+            {"status": "COMPLETED", "timestamp": 200}
+        ]
+        country_service.status_notifier = Mock()
+        country_service.status_notifier.wait.return_value = {"status": "COMPLETED", "timestamp": 200}
+
+        result = country_service.check_operation_status("France", wait_seconds=10)
+
+        assert result == {"status": "COMPLETED", "timestamp": 200}
+        country_service.status_notifier.wait.assert_called_once_with("france", 100, 10)
+
+    def test_check_operation_status_wait_times_out(self, country_service, mock_db_service):
+        mock_db_service.get_operation_status.return_value = {"status": "PENDING", "timestamp": 100}
+        country_service.status_notifier = Mock()
+        country_service.status_notifier.wait.return_value = None
+
+        result = country_service.check_operation_status("France", wait_seconds=10)
+
+        assert result == {"status": "PENDING", "timestamp": 100}
+        # No extra DynamoDB read when nothing was signalled
+        assert mock_db_service.get_operation_status.call_count == 1
+
+    def test_check_operation_status_does_not_wait_for_final_status(self, country_service, mock_db_service):
+        mock_db_service.get_operation_status.return_value = {"status": "COMPLETED", "timestamp": 100}
+        country_service.status_notifier = Mock()
+
+        country_service.check_operation_status("France", wait_seconds=10)
+
+        country_service.status_notifier.wait.assert_not_called()
+
+    def test_fetch_and_save_country_data_remembers_unknown_country(self, country_service, mock_db_service):
+        country_service.country_data_fetcher.fetch_country_data.side_effect = CountryNotFoundError("No data found for country: frnace")
+
+        assert country_service.fetch_and_save_country_data("frnace") is False
+
+        assert country_service.negative_cache.contains("frnace")
+        mock_db_service.finish_fetch_operation.assert_called_once_with("frnace", "FAILED", "No data found for country: frnace")
+
+    def test_fetch_and_save_country_data_does_not_remember_transient_failures(self, country_service):
+        country_service.country_data_fetcher.fetch_country_data.side_effect = Exception("API Error")
+
+        country_service.fetch_and_save_country_data("france")
+
+        assert not country_service.negative_cache.contains("france")
+
+    def test_fetch_and_save_country_data_enqueues_callbacks(self, country_service, mock_db_service, mock_queue_service):
+        country_service.country_data_fetcher.fetch_country_data.side_effect = Exception("API Error")
+        mock_db_service.finish_fetch_operation.return_value = ["https://a.example/hook", "https://b.example/hook"]
+        mock_queue_service.send_message_batch.return_value = []
+
+        with patch('chalicelib.country_service.time.time', return_value=1700000000):
+            country_service.fetch_and_save_country_data("france")
+
+        mock_queue_service.send_message_batch.assert_called_once_with([
+            {'url': "https://a.example/hook", 'country': "france", 'status': "FAILED", 'timestamp': 1700000000000, 'error': "API Error"},
+            {'url': "https://b.example/hook", 'country': "france", 'status': "FAILED", 'timestamp': 1700000000000, 'error': "API Error"}
+        ])
+
+    def test_fetch_and_save_country_data_survives_callback_enqueue_failure(self, country_service, mock_db_service, mock_queue_service):
+        country_service.country_data_fetcher.fetch_country_data.return_value = {"name": {"common": "France"}}
+        mock_db_service.finish_fetch_operation.return_value = ["https://a.example/hook"]
+        mock_queue_service.send_message_batch.side_effect = Exception("SQS unavailable")
+
+        assert country_service.fetch_and_save_country_data("france") is True
+
+    def test_fetch_and_save_country_data_publishes_status(self, country_service, mock_db_service):
+        country_service.status_notifier = Mock()
+        country_service.country_data_fetcher.fetch_country_data.return_value = {"name": {"common": "France"}}
+
+        country_service.fetch_and_save_country_data("france")
+        country_service.country_data_fetcher.fetch_country_data.side_effect = Exception("API Error")
+        country_service.fetch_and_save_country_data("france")
+
+        assert [call.args for call in country_service.status_notifier.publish.call_args_list] == [
+            ("france", "COMPLETED"), ("france", "FAILED")
+        ]
+
+    def test_get_country_data_uses_cache(self, country_service, mock_db_service):
+        mock_db_service.get_country_document.return_value = ({"name": "France"}, "stored-hash")
+
+        country_service.get_country_data("France")
+        result = country_service.get_country_data("france")
+
+        assert result == {"name": "France"}
+        mock_db_service.get_country_document.assert_called_once_with("france")
+        assert country_service.country_cache.stats()['hits'] == 1
+
+    def test_get_country_data_not_found_is_not_cached(self, country_service, mock_db_service):
+        mock_db_service.get_country_document.return_value = None
+
+        with pytest.raises(NotFoundError):
+            country_service.get_country_data("Nonexistent")
+
+        assert len(country_service.country_cache) == 0
+
+    def test_get_country_data_reads_through_shared_cache(self, country_service, mock_db_service):
+        country_service.shared_cache = Mock()
+        country_service.shared_cache.get_or_load.return_value = [{"name": "France"}, "stored-hash"]
+
+        result = country_service.get_country_data("France")
+
+        assert result == {"name": "France"}
+        country_service.shared_cache.get_or_load.assert_called_once()
+        mock_db_service.get_country_document.assert_not_called()
+
+    def test_fetch_countries_data(self, country_service, mock_db_service, mock_queue_service):
+        mock_db_service.batch_get_country_documents.return_value = {"france": ({"name": "France"}, "stored-hash")}
+        mock_db_service.claim_fetch_operation.side_effect = lambda country, callback_url: (
+            (False, {"status": "PENDING"}) if country == "germany" else (True, {"status": "PENDING"})
+        )
+        mock_queue_service.send_message_batch.return_value = []
+
+        result = country_service.fetch_countries_data(["France", "Germany", "Costa Rica", "x1"])
+
+        assert result == {
+            "france": {"country": "france", "status": "COMPLETED"},
+            "germany": {"country": "germany", "status": "PENDING"},
+            "costa-rica": {"country": "costa-rica", "status": "PENDING"},
+            "x1": {"country": "x1", "status": "INVALID"}
+        }
+        assert mock_db_service.claim_fetch_operation.call_count == 2
+        mock_queue_service.send_message_batch.assert_called_once_with([{"country": "costa-rica"}])
+
+    def test_fetch_countries_data_enqueues_only_claim_winners(self, country_service, mock_db_service, mock_queue_service):
+        # A stale PENDING claim is taken over by claim_fetch_operation, exactly as for a single fetch
+        mock_db_service.batch_get_country_documents.return_value = {}
+        mock_db_service.claim_fetch_operation.side_effect = lambda country, callback_url: (
+            (False, {"status": "COMPLETED"}) if country == "spain" else (True, {"status": "PENDING"})
+        )
+        mock_queue_service.send_message_batch.return_value = []
+
+        result = country_service.fetch_countries_data(["Spain", "Peru"])
+
+        assert result["spain"] == {"country": "spain", "status": "COMPLETED"}
+        mock_queue_service.send_message_batch.assert_called_once_with([{"country": "peru"}])
+
+    def test_fetch_countries_data_prepares_claims_before_fanning_out(self, country_service, mock_db_service,
+                                                                     mock_queue_service):
+        calls = []
+        country_service.prepare_claims = Mock(side_effect=lambda: calls.append('prepare'))
+        mock_db_service.batch_get_country_documents.return_value = {}
+        mock_db_service.claim_fetch_operation.side_effect = lambda country, callback_url: (
+            calls.append(country) or (True, {"status": "PENDING"})
+        )
+        mock_queue_service.send_message_batch.return_value = []
+
+        country_service.fetch_countries_data(["Spain", "Peru"])
+
+        assert calls[0] == 'prepare'
+        assert sorted(calls[1:]) == ["peru", "spain"]
+
+    def test_fetch_countries_data_skips_known_missing_countries(self, country_service, mock_db_service, mock_queue_service):
+        country_service.negative_cache.add("frnace")
+        mock_db_service.batch_get_country_documents.return_value = {}
+        mock_queue_service.send_message_batch.return_value = []
+
+        result = country_service.fetch_countries_data(["frnace", "spain"])
+
+        assert result["frnace"] == {"country": "frnace", "status": "NOT_FOUND"}
+        mock_db_service.batch_get_country_documents.assert_called_once_with(["spain"])
+        mock_queue_service.send_message_batch.assert_called_once_with([{"country": "spain"}])
+
+    def test_fetch_countries_data_with_callback(self, country_service, mock_db_service, mock_queue_service):
+        mock_db_service.batch_get_country_documents.return_value = {}
+        mock_db_service.claim_fetch_operation.side_effect = lambda country, callback_url: (
+            (False, {"status": "PENDING"}) if country == "germany" else (True, {"status": "PENDING"})
+        )
+        mock_db_service.add_operation_callback.return_value = (True, None)
+        mock_queue_service.send_message_batch.return_value = []
+
+        country_service.fetch_countries_data(["Germany", "Spain"], "https://example.com/hook")
+
+        mock_db_service.add_operation_callback.assert_called_once_with("germany", "https://example.com/hook")
+        mock_db_service.claim_fetch_operation.assert_any_call("spain", "https://example.com/hook")
+        mock_queue_service.send_message_batch.assert_called_once_with([{"country": "spain"}])
+
+    def test_fetch_countries_data_enqueue_failure(self, country_service, mock_db_service, mock_queue_service):
+        mock_db_service.batch_get_country_documents.return_value = {}
+        mock_queue_service.send_message_batch.return_value = [{"country": "spain"}]
+
+        result = country_service.fetch_countries_data(["france", "spain"])
+
+        assert result["france"]["status"] == "PENDING"
+        assert result["spain"]["status"] == "FAILED"
+        mock_db_service.finish_fetch_operation.assert_called_once_with("spain", "FAILED", "Failed to enqueue fetch request")
+
+    def test_get_countries_data(self, country_service, mock_db_service):
+        country_service.country_cache.set("germany", ({"name": "Germany"}, "stored-hash"))
+        mock_db_service.batch_get_country_documents.return_value = {"france": ({"name": "France"}, "stored-hash")}
+
+        result, _ = country_service.get_countries_document(["France", "germany", "Narnia"])
+
+        assert result == {
+            "countries": {"germany": {"name": "Germany"}, "france": {"name": "France"}},
+            "missing": ["narnia"]
+        }
+        mock_db_service.batch_get_country_documents.assert_called_once_with(["france", "narnia"], None)
+
+    def test_sync_all_countries_writes_only_changed_documents(self, country_service, mock_db_service, mock_country_data_fetcher):
+        france = {"name": {"common": "France"}, "population": 1}
+        costa_rica = {"name": {"common": "Costa Rica"}, "population": 2}
+        mock_country_data_fetcher.fetch_all_countries.return_value = [france, costa_rica, {"cca2": "XX"}]
+        mock_db_service.get_country_hashes.return_value = {"france": content_hash(france)}
+        country_service.country_cache.set("costa-rica", ({"stale": True}, "stored-hash"))
+        country_service.negative_cache.add("costa-rica")
+
+        result = country_service.sync_all_countries(max_write_capacity_per_second=4)
+
+        assert result == {'fetched': 2, 'changed': 1, 'unchanged': 1, 'skipped': 1, 'dry_run': False}
+        mock_db_service.batch_save_country_data.assert_called_once_with({"costa-rica": costa_rica}, 4)
+        mock_db_service.batch_finish_fetch_operations.assert_called_once_with(["costa-rica"], "COMPLETED", 4)
+        assert country_service.country_cache.get("costa-rica") is None
+        assert not country_service.negative_cache.contains("costa-rica")
+
+    def test_sync_all_countries_writes_aliases_missing_from_table(self, country_service, mock_db_service,
+                                                                   mock_country_data_fetcher):
+        # A previous run saved the document but was interrupted before its aliases
+        france = {"name": {"common": "France"}, "cca2": "FR"}
+        mock_country_data_fetcher.fetch_all_countries.return_value = [france]
+        mock_db_service.get_country_hashes.return_value = {"france": content_hash(france)}
+        mock_db_service.get_all_country_aliases.return_value = {"france": "france"}
+
+        result = country_service.sync_all_countries()
+
+        assert result['changed'] == 0
+        mock_db_service.save_country_aliases.assert_called_once_with({"fr": "france"}, None)
+        mock_db_service.batch_save_country_data.assert_not_called()
+
+    def test_sync_all_countries_skips_aliases_already_stored(self, country_service, mock_db_service,
+                                                             mock_country_data_fetcher):
+        france = {"name": {"common": "France"}, "cca2": "FR"}
+        mock_country_data_fetcher.fetch_all_countries.return_value = [france]
+        mock_db_service.get_country_hashes.return_value = {"france": content_hash(france)}
+        mock_db_service.get_all_country_aliases.return_value = {"france": "france", "fr": "france"}
+
+        country_service.sync_all_countries()
+
+        mock_db_service.save_country_aliases.assert_not_called()
+
+    def test_sync_all_countries_notifies_callbacks_of_pending_fetches(self, country_service, mock_db_service,
+                                                                       mock_country_data_fetcher):
+        mock_country_data_fetcher.fetch_all_countries.return_value = [{"name": {"common": "Peru"}}]
+        mock_db_service.get_country_hashes.return_value = {}
+        mock_db_service.batch_finish_fetch_operations.return_value = {"peru": ["https://example.com/hook"]}
+        country_service.enqueue_callbacks = Mock()
+
+        country_service.sync_all_countries()
+
+        country_service.enqueue_callbacks.assert_called_once_with("peru", "COMPLETED", ["https://example.com/hook"], None)
+
+    def test_enqueue_callbacks_drops_without_callback_queue(self, country_service, mock_queue_service):
+        country_service.callback_queue_url = None
+
+        with patch('chalicelib.country_service.metrics') as mock_metrics:
+            country_service.enqueue_callbacks("peru", "COMPLETED", ["https://example.com/hook"])
+
+        mock_queue_service.send_message_batch.assert_not_called()
+        mock_metrics.increment.assert_called_once_with('CallbacksDropped', 1)
+
+    def test_sync_all_countries_dry_run(self, country_service, mock_db_service, mock_country_data_fetcher):
+        mock_country_data_fetcher.fetch_all_countries.return_value = [{"name": {"common": "France"}}]
+        mock_db_service.get_country_hashes.return_value = {}
+
+        result = country_service.sync_all_countries(dry_run=True)
+
+        assert result['changed'] == 1
+        mock_db_service.batch_save_country_data.assert_not_called()
+
+    def test_get_country_data_resolves_iso_code(self, country_service, mock_db_service):
+        mock_db_service.get_country_document.return_value = ({"name": {"common": "France"}, "cca2": "FR", "cca3": "FRA"}, "stored-hash")
+        country_service.get_country_data("France")
+        mock_db_service.get_country_alias.reset_mock()
+
+        result = country_service.get_country_data("FRA")
+
+        assert result["cca3"] == "FRA"
+        mock_db_service.get_country_document.assert_called_once_with("france")
+        mock_db_service.get_country_alias.assert_not_called()
+
+    def test_fetch_and_save_country_data_saves_aliases(self, country_service, mock_db_service):
+        country_service.country_data_fetcher.fetch_country_data.return_value = {"name": {"common": "France"}, "cca2": "FR"}
+
+        country_service.fetch_and_save_country_data("france")
+
+        mock_db_service.save_country_aliases.assert_called_once_with({"fr": "france", "france": "france"})
+
+    def test_validate_country_name_accepts_known_iso_code(self, country_service, mock_db_service):
+        mock_db_service.get_country_alias.side_effect = lambda alias: "france" if alias == "fr" else None
+
+        assert country_service.validate_country_name("fr") == True
+        assert country_service.validate_country_name("zz") == False
+        assert country_service.validate_country_name("f") == False
+
+    @pytest.fixture
+    def alias_snapshot(self, tmp_path):
+        path = tmp_path / 'country_aliases.json'
+        path.write_text(json.dumps({'france': 'france', 'fr': 'france', 'fra': 'france', '250': 'france',
+                                    'french-republic': 'france', 'finland': 'finland', 'fi': 'finland'}))
+        with patch('chalicelib.country_service.ALIAS_SNAPSHOT_PATH', str(path)):
+            yield path
+
+    def test_validate_country_name_uses_known_countries(self, country_service, mock_db_service, alias_snapshot):
+        assert country_service.validate_country_name("France") == True
+        assert country_service.validate_country_name("french-republic") == True
+        assert country_service.validate_country_name("FR") == True
+        assert country_service.validate_country_name("250") == True
+        assert country_service.validate_country_name("frnace") == False
+        assert country_service.validate_country_name("zz") == False
+        assert country_service.validate_country_name("fr4nce") == False
+        mock_db_service.get_country_alias.assert_not_called()
+
+    def test_validate_country_name_accepts_countries_learned_after_snapshot(self, country_service, alias_snapshot):
+        country_service.alias_index.register("new-country", {"name": {"common": "New Country"}, "cca2": "NC"})
+
+        assert country_service.validate_country_name("new-country") == True
+        assert country_service.validate_country_name("nc") == True
+
+    def test_validate_country_name_accepts_never_fetched_countries_from_catalog(self, country_service, mock_db_service, packaged_catalog):
+        assert country_service.validate_country_name("germany") == True
+        assert country_service.validate_country_name("japan") == True
+        assert country_service.validate_country_name("de") == True
+        assert country_service.validate_country_name("jpn") == True
+        assert country_service.validate_country_name("ivory-coast") == True
+        assert country_service.validate_country_name("uk") == True
+        assert country_service.validate_country_name("great-britain") == True
+        assert country_service.validate_country_name("holy-see") == True
+        assert country_service.validate_country_name("curacao") == True
+        assert country_service.validate_country_name("aland-islands") == True
+        assert country_service.validate_country_name("korea") == True
+        assert country_service.resolve_country_identifiers(["usa", "deu", "250", "united-states-of-america"]) == {
+            "usa": "united-states", "deu": "germany", "250": "france", "united-states-of-america": "united-states"}
+        assert country_service.validate_country_name("narnia") == False
+        assert country_service.validate_country_name("zz") == False
+        assert country_service.suggest_country_name("germny") == "germany"
+        mock_db_service.get_country_alias.assert_not_called()
+        mock_db_service.get_all_country_aliases.assert_not_called()
+
+    def test_validate_country_name_without_snapshot_checks_shape_only(self, country_service):
+        with patch('chalicelib.country_service.ALIAS_SNAPSHOT_PATH', '/nonexistent/country_aliases.json'):
+            assert country_service.validate_country_name("frnace") == True
+            assert country_service.suggest_country_name("frnace") is None
+
+    def test_suggest_country_name(self, country_service, alias_snapshot):
+        assert country_service.suggest_country_name("frnace") == "france"
+        assert country_service.suggest_country_name("qqqqqq") is None
+
+    def test_fetch_countries_data_suggests_for_unknown_names(self, country_service, mock_db_service, alias_snapshot):
+        mock_db_service.batch_get_country_documents.return_value = {}
+
+        result = country_service.fetch_countries_data(["finlnd"])
+
+        assert result == {"finlnd": {"country": "finlnd", "status": "INVALID", "suggestion": "finland"}}
+        mock_db_service.batch_get_country_documents.assert_not_called()
+
+    def test_search_countries_builds_index_once(self, country_service, mock_db_service):
+        mock_db_service.get_all_country_aliases.return_value = {'france': 'france', 'fr': 'france', 'finland': 'finland'}
+
+        with patch('chalicelib.country_service.os.path.exists', return_value=False):
+            first = country_service.search_countries('Fran')
+            second = country_service.search_countries('finlnd')
+
+        assert first['results'][0]['country'] == 'france'
+        assert second['results'][0]['country'] == 'finland'
+        mock_db_service.get_all_country_aliases.assert_called_once()
+
+    def test_search_countries_uses_packaged_catalog(self, country_service, mock_db_service, packaged_catalog):
+        result = country_service.search_countries('germ')
+
+        assert result['results'][0]['country'] == 'germany'
+        assert all(match['country'] is not None for match in country_service.search_countries('korea')['results'])
+        mock_db_service.get_all_country_aliases.assert_not_called()
+
+    def test_query_countries_loads_engine_once(self, country_service, mock_db_service):
+        mock_db_service.get_country_attributes.return_value = {
+            'france': {'name': 'France', 'region': 'Europe', 'population': 68000000},
+            'brazil': {'name': 'Brazil', 'region': 'Americas', 'population': 203000000}
+        }
+
+        first = country_service.query_countries({'region': ['europe']})
+        second = country_service.query_countries(sort='population', descending=True)
+
+        assert [row['country'] for row in first['results']] == ['france']
+        assert [row['country'] for row in second['results']] == ['brazil', 'france']
+        mock_db_service.get_country_attributes.assert_called_once()
+
+    def test_fetch_and_save_country_data_updates_query_engine(self, country_service, mock_db_service):
+        country_service.query_countries()
+        country_service.country_data_fetcher.fetch_country_data.return_value = {"name": {"common": "France"}, "region": "Europe"}
+
+        country_service.fetch_and_save_country_data("france")
+
+        # The saved document carries its row, so nothing else is written
+        mock_db_service.save_country_attributes.assert_not_called()
+        assert country_service.query_countries({'region': ['Europe']})['total'] == 1
+
+    def test_sync_all_countries_backfills_missing_attribute_rows(self, country_service, mock_db_service, mock_country_data_fetcher):
+        france = {"name": {"common": "France"}, "population": 1}
+        costa_rica = {"name": {"common": "Costa Rica"}, "population": 2}
+        mock_country_data_fetcher.fetch_all_countries.return_value = [france, costa_rica]
+        mock_db_service.get_country_hashes.return_value = {"france": content_hash(france), "costa-rica": content_hash(costa_rica)}
+        mock_db_service.get_country_attributes.return_value = {"france": {"name": "France", "population": 1}}
+
+        result = country_service.sync_all_countries()
+
+        assert result['changed'] == 0
+        mock_db_service.batch_save_country_data.assert_not_called()
+        mock_db_service.save_country_attributes.assert_called_once_with(
+            {"costa-rica": {"name": "Costa Rica", "population": 2}}, None
+        )
+        mock_db_service.delete_legacy_attributes_item.assert_called_once()
+
+    def test_sync_all_countries_does_not_backfill_rewritten_documents(self, country_service, mock_db_service,
+                                                                       mock_country_data_fetcher):
+        mock_country_data_fetcher.fetch_all_countries.return_value = [{"name": {"common": "Peru"}}]
+        mock_db_service.get_country_hashes.return_value = {}
+
+        country_service.sync_all_countries()
+
+        mock_db_service.batch_save_country_data.assert_called_once()
+        mock_db_service.save_country_attributes.assert_not_called()
+
+    def test_get_country_data_projects_cached_document(self, country_service, mock_db_service):
+        country_service.country_cache.set("france", ({"name": {"common": "France", "official": "French Republic"}, "capital": ["Paris"]}, "stored-hash"))
+
+        result = country_service.get_country_data("france", [("capital",), ("name", "common")])
+
+        assert result == {"capital": ["Paris"], "name": {"common": "France"}}
+        mock_db_service.get_country_document.assert_not_called()
+
+    def test_get_country_data_reads_only_requested_fields(self, country_service, mock_db_service):
+        mock_db_service.get_country_document.return_value = ({"capital": ["Paris"]}, "stored-hash")
+
+        result = country_service.get_country_data("france", [("capital",)])
+
+        assert result == {"capital": ["Paris"]}
+        mock_db_service.get_country_document.assert_called_once_with("france", [("capital",)])
+        assert country_service.country_cache.get("france") is None
+
+    def test_get_countries_data_with_fields(self, country_service, mock_db_service):
+        country_service.country_cache.set("germany", ({"name": "Germany", "capital": ["Berlin"]}, "stored-hash"))
+        mock_db_service.batch_get_country_documents.return_value = {"france": ({"capital": ["Paris"]}, "stored-hash")}
+
+        result, _ = country_service.get_countries_document(["France", "germany"], [("capital",)])
+
+        assert result == {"countries": {"germany": {"capital": ["Berlin"]}, "france": {"capital": ["Paris"]}}, "missing": []}
+        mock_db_service.batch_get_country_documents.assert_called_once_with(["france"], [("capital",)])
+
+    def test_get_country_document_uses_stored_hash_as_etag(self, country_service, mock_db_service):
+        mock_db_service.get_country_document.return_value = ({"name": "France", "capital": ["Paris"]}, "stored-hash")
+
+        with patch('chalicelib.country_service.content_hash', wraps=content_hash) as mock_hash:
+            _, first = country_service.get_country_document("france")
+            _, second = country_service.get_country_document("france")
+
+        assert first == second == "stored-hash"
+        mock_hash.assert_not_called()
+
+    def test_get_country_document_etag_of_projection(self, country_service, mock_db_service):
+        country_service.country_cache.set("france", ({"name": "France", "capital": ["Paris"]}, "stored-hash"))
+
+        _, capital = country_service.get_country_document("france", [("capital",)])
+        _, name = country_service.get_country_document("france", [("name",)])
+
+        assert capital != name
+        assert capital == country_service.document_etag("stored-hash", [("capital",)])
+        assert capital != country_service.document_etag("changed-hash", [("capital",)])
+
+    def test_get_countries_document_etag_changes_with_content(self, country_service, mock_db_service):
+        country_service.country_cache.set("france", ({"name": "France"}, "france-hash"))
+        mock_db_service.batch_get_country_documents.return_value = {}
+
+        _, etag = country_service.get_countries_document(["france", "narnia"])
+        country_service.country_cache.set("france", ({"name": "France", "capital": ["Paris"]}, "france-hash-2"))
+        _, changed = country_service.get_countries_document(["france", "narnia"])
+        mock_db_service.batch_get_country_documents.return_value = {"narnia": ({"name": "Narnia"}, "narnia-hash")}
+        _, found = country_service.get_countries_document(["france", "narnia"])
+
+        assert len({etag, changed, found}) == 3
@@ -1,31 +1,31 @@
 import pytest
+from decimal import Decimal
 from unittest.mock import Mock, patch
-from chalicelib.db_service import DynamoDBService
+from chalicelib.db_service import (
+    DynamoDBService, LATEST_STATUS_TIMESTAMP, LEGACY_ATTRIBUTES_ITEM_KEY, STATUS_HISTORY_TTL_SECONDS,
+    COUNTRY_TABLE, OPERATION_TABLE, ALIAS_TABLE, COUNTRY_ATTRIBUTES_INDEX
+)
+from chalicelib.utils import content_hash
+from chalicelib.storage_format import encode_country_item, decode_country_item, FORMAT_COMPRESSED
 from botocore.exceptions import ClientError
 
 
 class TestDynamoDBService:
     @pytest.fixture
     def dynamodb_service(self):
-        with patch('chalicelib.db_service.boto3.resource') as mock_resource:
-            mock_table = Mock()
-            mock_resource.return_value.Table.return_value = mock_table
-            service = DynamoDBService()
-            service.country_table = mock_table
-            service.operation_table = mock_table
-            yield service
-            mock_table.reset_mock()
+        service = DynamoDBService(dynamodb=Mock())
+        yield service
 
     def test_save_country_data_success(self, dynamodb_service):
-        dynamodb_service.country_table.put_item.return_value = {}
+        dynamodb_service.client.put_item.return_value = {}
         
         result = dynamodb_service.save_country_data("france", {"name": "France"})
         
         assert result == True
-        dynamodb_service.country_table.put_item.assert_called_once()
+        dynamodb_service.client.put_item.assert_called_once()
 
     def test_save_country_data_already_exists(self, dynamodb_service):
-        dynamodb_service.country_table.put_item.side_effect = ClientError(
+        dynamodb_service.client.put_item.side_effect = ClientError(
             {'Error': {'Code': 'ConditionalCheckFailedException'}},
             'PutItem'
         )
@@ -35,51 +35,400 @@ class TestDynamoDBService:
         assert result == False
 
     def test_get_country_data_success(self, dynamodb_service):
-        dynamodb_service.country_table.get_item.return_value = {'Item': {'data': {'name': 'France'}}}
+        dynamodb_service.client.get_item.return_value = {'Item': {'data': {'name': 'France'}}}
         
         result = dynamodb_service.get_country_data("france")
         
         assert result == {'name': 'France'}
 
     def test_get_country_data_not_found(self, dynamodb_service):
-        dynamodb_service.country_table.get_item.return_value = {}
+        dynamodb_service.client.get_item.return_value = {}
         
         result = dynamodb_service.get_country_data("nonexistent")
         
         assert result == None
 
-    def test_save_operation_status(self, dynamodb_service):
-        dynamodb_service.operation_table.put_item.return_value = {}
-        
-        dynamodb_service.save_operation_status("france", "PENDING")
-        
-        dynamodb_service.operation_table.put_item.assert_called_once()
-
     def test_get_operation_status_success(self, dynamodb_service):
-        dynamodb_service.operation_table.query.return_value = {'Items': [{'status': 'COMPLETED'}]}
+        dynamodb_service.client.get_item.return_value = {'Item': {'status': 'COMPLETED'}}
         
         result = dynamodb_service.get_operation_status("france")
         
         assert result == {'status': 'COMPLETED'}
+        dynamodb_service.client.get_item.assert_called_once_with(
+            TableName=OPERATION_TABLE,
+            Key={'country': 'france', 'timestamp': LATEST_STATUS_TIMESTAMP}, ConsistentRead=True
+        )
+        dynamodb_service.client.query.assert_not_called()
 
     def test_get_operation_status_not_found(self, dynamodb_service):
-        dynamodb_service.operation_table.query.return_value = {'Items': []}
+        dynamodb_service.client.get_item.return_value = {}
         
         result = dynamodb_service.get_operation_status("nonexistent")
         
         assert result == None
 
-    def test_is_operation_in_progress_true(self, dynamodb_service):
-        dynamodb_service.get_operation_status = Mock(return_value={'status': 'PENDING'})
-        
-        result = dynamodb_service.is_operation_in_progress("france")
-        
-        assert result == True
+    def test_batch_get_country_documents_success(self, dynamodb_service):
+        table_name = COUNTRY_TABLE
+        dynamodb_service.client.batch_get_item.return_value = {
+            'Responses': {table_name: [{'country': 'france', 'data': {'name': 'France'}, 'data_hash': 'abc'}]}
+        }
 
-    def test_is_operation_in_progress_false(self, dynamodb_service):
-        dynamodb_service.get_operation_status = Mock(return_value={'status': 'COMPLETED'})
-        
-        result = dynamodb_service.is_operation_in_progress("france")
-        
-        assert result == False
+        result = dynamodb_service.batch_get_country_documents(["france", "germany"])
+
+        assert result == {'france': ({'name': 'France'}, 'abc')}
+        dynamodb_service.client.batch_get_item.assert_called_once()
+
+    def test_batch_get_country_documents_retries_unprocessed_keys(self, dynamodb_service):
+        table_name = COUNTRY_TABLE
+        dynamodb_service.client.batch_get_item.side_effect = [
+            {
+                'Responses': {table_name: [{'country': 'france', 'data': {'name': 'France'}}]},
+                'UnprocessedKeys': {table_name: {'Keys': [{'country': 'germany'}]}}
+            },
+            {'Responses': {table_name: [{'country': 'germany', 'data': {'name': 'Germany'}}]}}
+        ]
+
+        with patch('chalicelib.db_service.time.sleep'):
+            result = dynamodb_service.batch_get_country_documents(["france", "germany"])
+
+        assert {country: document[0] for country, document in result.items()} == {
+            'france': {'name': 'France'}, 'germany': {'name': 'Germany'}
+        }
+        assert dynamodb_service.client.batch_get_item.call_count == 2
+
+    def test_batch_finish_fetch_operations_updates_state_items(self, dynamodb_service):
+        dynamodb_service.client.batch_write_item.return_value = {}
+        dynamodb_service.client.update_item.side_effect = [
+            {'Attributes': {'callbacks': {'https://example.com/hook'}}},
+            {'Attributes': {}}
+        ]
+
+        result = dynamodb_service.batch_finish_fetch_operations(["france", "germany"], "COMPLETED")
+
+        assert result == {'france': ['https://example.com/hook']}
+        # History rows are batched; state items are updated, never put over
+        request_items = dynamodb_service.client.batch_write_item.call_args.kwargs['RequestItems']
+        assert [request['PutRequest']['Item']['timestamp'] != LATEST_STATUS_TIMESTAMP
+                for request in request_items[OPERATION_TABLE]] == [True, True]
+        update = dynamodb_service.client.update_item.call_args.kwargs
+        assert update['Key'] == {'country': 'germany', 'timestamp': LATEST_STATUS_TIMESTAMP}
+        assert 'REMOVE #error, callbacks' in update['UpdateExpression']
+
+    def test_history_rows_expire_but_state_items_do_not(self, dynamodb_service):
+        dynamodb_service.client.batch_write_item.return_value = {}
+        dynamodb_service.client.update_item.return_value = {}
+
+        with patch('chalicelib.db_service.time.time', return_value=1700000000):
+            dynamodb_service.finish_fetch_operation("france", "FAILED", "API Error")
+            dynamodb_service.batch_finish_fetch_operations(["germany"], "COMPLETED")
+
+        history = dynamodb_service.client.put_item.call_args.kwargs['Item']
+        assert history['expires_at'] == 1700000000 + STATUS_HISTORY_TTL_SECONDS
+        request_items = dynamodb_service.client.batch_write_item.call_args.kwargs['RequestItems']
+        [history] = [request['PutRequest']['Item'] for request in request_items[OPERATION_TABLE]]
+        assert history['expires_at'] == 1700000000 + STATUS_HISTORY_TTL_SECONDS
+        # The state item is only ever updated, so it never gains an expiry
+        for call in dynamodb_service.client.update_item.call_args_list:
+            assert 'expires_at' not in call.kwargs['UpdateExpression']
+
+    def test_compact_operation_history(self, dynamodb_service):
+        day = 86400 * 1000
+        now = 1700000000 * 1000
+        items = [
+            {'country': 'france', 'timestamp': LATEST_STATUS_TIMESTAMP, 'status': 'COMPLETED', 'status_timestamp': now},
+            {'country': 'france', 'timestamp': now - 40 * day, 'status': 'PENDING'},
+            {'country': 'france', 'timestamp': now - day, 'status': 'COMPLETED', 'expires_at': 1},
+            {'country': 'germany', 'timestamp': now - 50 * day, 'status': 'PENDING'},
+            {'country': 'germany', 'timestamp': now - 45 * day, 'status': 'FAILED', 'error': 'boom'},
+            {'country': 'spain', 'timestamp': now - 2 * day, 'status': 'COMPLETED'}
+        ]
+        dynamodb_service.client.scan.return_value = {'Items': items}
+        dynamodb_service.client.batch_write_item.return_value = {}
+
+        with patch('chalicelib.db_service.time.time', return_value=now / 1000):
+            result = dynamodb_service.compact_operation_history(retention_seconds=30 * 86400)
+
+        assert result == {'state_items_created': 2, 'deleted': 3, 'expiring': 1, 'dry_run': False}
+        table_name = OPERATION_TABLE
+        requests = [request for call in dynamodb_service.client.batch_write_item.call_args_list
+                    for request in call.kwargs['RequestItems'][table_name]]
+        assert requests[:2] == [
+            {'PutRequest': {'Item': {'country': 'germany', 'timestamp': LATEST_STATUS_TIMESTAMP, 'status': 'FAILED',
+                                     'error': 'boom', 'status_timestamp': now - 45 * day}}},
+            {'PutRequest': {'Item': {'country': 'spain', 'timestamp': LATEST_STATUS_TIMESTAMP, 'status': 'COMPLETED',
+                                     'status_timestamp': now - 2 * day}}}
+        ]
+        assert {'DeleteRequest': {'Key': {'country': 'germany', 'timestamp': now - 45 * day}}} in requests
+        assert requests[-1] == {'PutRequest': {'Item': dict(items[-1], expires_at=now // 1000 - 2 * 86400 + 30 * 86400)}}
+
+    def test_compact_operation_history_dry_run_writes_nothing(self, dynamodb_service):
+        dynamodb_service.client.scan.return_value = {'Items': [
+            {'country': 'spain', 'timestamp': 1, 'status': 'COMPLETED'}
+        ]}
+
+        result = dynamodb_service.compact_operation_history(dry_run=True)
+
+        assert result == {'state_items_created': 1, 'deleted': 1, 'expiring': 0, 'dry_run': True}
+        dynamodb_service.client.batch_write_item.assert_not_called()
+
+    def test_save_country_data_stores_content_hash(self, dynamodb_service):
+        dynamodb_service.save_country_data("france", {"name": "France"})
+
+        item = dynamodb_service.client.put_item.call_args.kwargs['Item']
+        assert item['data_hash'] == content_hash({"name": "France"})
+
+    def test_batch_save_country_data_retries_and_paces_writes(self, dynamodb_service):
+        table_name = COUNTRY_TABLE
+        dynamodb_service.client.batch_write_item.side_effect = [
+            {
+                'ConsumedCapacity': [{'CapacityUnits': 2}],
+                'UnprocessedItems': {table_name: [{'PutRequest': {'Item': {'country': 'germany'}}}]}
+            },
+            {'ConsumedCapacity': [{'CapacityUnits': 1}]}
+        ]
+
+        with patch('chalicelib.db_service.time.sleep') as mock_sleep:
+            result = dynamodb_service.batch_save_country_data(
+                {"france": {"name": "France"}, "germany": {"name": "Germany"}},
+                max_write_capacity_per_second=1
+            )
+
+        assert result == 2
+        assert dynamodb_service.client.batch_write_item.call_count == 2
+        # Consumed capacity of 2 WCU at 1 WCU/s needs close to two seconds of pacing
+        assert mock_sleep.call_args_list[0].args[0] > 1.9
+
+    def test_get_country_hashes_paginates(self, dynamodb_service):
+        dynamodb_service.client.scan.side_effect = [
+            {'Items': [{'country': 'france', 'data_hash': 'abc'}], 'LastEvaluatedKey': {'country': 'france'}},
+            {'Items': [{'country': 'germany'}]}
+        ]
+
+        result = dynamodb_service.get_country_hashes()
+
+        assert result == {'france': 'abc', 'germany': None}
+        assert dynamodb_service.client.scan.call_args.kwargs['ExclusiveStartKey'] == {'country': 'france'}
+
+    def test_claim_fetch_operation_success(self, dynamodb_service):
+        claimed, state = dynamodb_service.claim_fetch_operation("france")
+
+        assert claimed == True
+        assert state['status'] == 'PENDING'
+        kwargs = dynamodb_service.client.update_item.call_args.kwargs
+        assert kwargs['ReturnValuesOnConditionCheckFailure'] == 'ALL_OLD'
+
+    def test_claim_fetch_operation_already_claimed(self, dynamodb_service):
+        dynamodb_service.client.update_item.side_effect = ClientError(
+            {
+                'Error': {'Code': 'ConditionalCheckFailedException'},
+                'Item': {
+                    'country': {'S': 'france'},
+                    'timestamp': {'N': str(LATEST_STATUS_TIMESTAMP)},
+                    'status': {'S': 'COMPLETED'},
+                    'status_timestamp': {'N': '1700000000000'}
+                }
+            },
+            'UpdateItem'
+        )
+
+        claimed, state = dynamodb_service.claim_fetch_operation("france")
+
+        assert claimed == False
+        assert state == {'country': 'france', 'timestamp': 1700000000000, 'status': 'COMPLETED'}
+
+    def test_claim_fetch_operation_registers_callback(self, dynamodb_service):
+        dynamodb_service.claim_fetch_operation("france", "https://example.com/hook")
+
+        kwargs = dynamodb_service.client.update_item.call_args.kwargs
+        assert kwargs['UpdateExpression'].endswith(' ADD callbacks :callback')
+        assert kwargs['ExpressionAttributeValues'][':callback'] == {"https://example.com/hook"}
+
+    def test_add_operation_callback_after_fetch_finished(self, dynamodb_service):
+        dynamodb_service.client.update_item.side_effect = ClientError(
+            {
+                'Error': {'Code': 'ConditionalCheckFailedException'},
+                'Item': {
+                    'country': {'S': 'france'},
+                    'timestamp': {'N': str(LATEST_STATUS_TIMESTAMP)},
+                    'status': {'S': 'COMPLETED'},
+                    'status_timestamp': {'N': '1700000000000'}
+                }
+            },
+            'UpdateItem'
+        )
+
+        added, state = dynamodb_service.add_operation_callback("france", "https://example.com/hook")
+
+        assert added == False
+        assert state == {'country': 'france', 'timestamp': 1700000000000, 'status': 'COMPLETED'}
+
+    def test_finish_fetch_operation_releases_callbacks(self, dynamodb_service):
+        dynamodb_service.client.update_item.return_value = {
+            'Attributes': {'status': 'PENDING', 'callbacks': {'https://b.example/hook', 'https://a.example/hook'}}
+        }
+
+        callbacks = dynamodb_service.finish_fetch_operation("france", "COMPLETED")
+
+        assert callbacks == ['https://a.example/hook', 'https://b.example/hook']
+        kwargs = dynamodb_service.client.update_item.call_args.kwargs
+        assert kwargs['UpdateExpression'].endswith(' REMOVE #error, callbacks')
+        assert kwargs['ReturnValues'] == 'UPDATED_OLD'
+        assert dynamodb_service.client.put_item.call_args.kwargs['Item']['status'] == 'COMPLETED'
+
+    def test_finish_fetch_operation_without_callbacks(self, dynamodb_service):
+        dynamodb_service.client.update_item.return_value = {'Attributes': {'status': 'PENDING'}}
+
+        assert dynamodb_service.finish_fetch_operation("france", "FAILED", "API Error") == []
+
+    def test_get_operation_status_hides_callbacks(self, dynamodb_service):
+        dynamodb_service.client.get_item.return_value = {
+            'Item': {'country': 'france', 'timestamp': LATEST_STATUS_TIMESTAMP, 'status': 'PENDING',
+                     'status_timestamp': 123, 'callbacks': {'https://example.com/hook'}}
+        }
+
+        assert 'callbacks' not in dynamodb_service.get_operation_status("france")
+
+    def test_get_operation_status_from_state_item(self, dynamodb_service):
+        dynamodb_service.client.get_item.return_value = {
+            'Item': {'country': 'france', 'timestamp': LATEST_STATUS_TIMESTAMP, 'status': 'PENDING', 'status_timestamp': 123}
+        }
+
+        result = dynamodb_service.get_operation_status("france")
+
+        assert result == {'country': 'france', 'timestamp': 123, 'status': 'PENDING'}
+
+    def test_get_country_alias(self, dynamodb_service):
+        dynamodb_service.client.get_item.return_value = {'Item': {'alias': 'fr', 'country': 'france'}}
+
+        result = dynamodb_service.get_country_alias("fr")
+
+        assert result == "france"
+
+    def test_get_country_alias_not_found(self, dynamodb_service):
+        dynamodb_service.client.get_item.return_value = {}
+
+        assert dynamodb_service.get_country_alias("zz") is None
+
+    def test_save_country_aliases(self, dynamodb_service):
+        dynamodb_service.client.batch_write_item.return_value = {}
+
+        result = dynamodb_service.save_country_aliases({"fr": "france", "fra": "france"})
+
+        assert result == 2
+        request_items = dynamodb_service.client.batch_write_item.call_args.kwargs['RequestItems']
+        assert len(request_items[ALIAS_TABLE]) == 2
+
+    def test_get_country_attributes_scans_the_attributes_index(self, dynamodb_service):
+        dynamodb_service.client.scan.side_effect = [
+            {'Items': [{'country': 'france', 'attributes': {'name': 'France', 'area': Decimal('551695')}}],
+             'LastEvaluatedKey': {'country': 'france'}},
+            {'Items': [{'country': 'peru'}]}
+        ]
+
+        result = dynamodb_service.get_country_attributes()
+
+        assert result == {'france': {'name': 'France', 'area': 551695}}
+        kwargs = dynamodb_service.client.scan.call_args.kwargs
+        assert kwargs['IndexName'] == COUNTRY_ATTRIBUTES_INDEX
+        assert kwargs['ProjectionExpression'] == 'country, #attributes'
+        assert kwargs['ExclusiveStartKey'] == {'country': 'france'}
+
+    def test_save_country_attributes_updates_each_document_item(self, dynamodb_service):
+        dynamodb_service.client.update_item.side_effect = [
+            {}, ClientError({'Error': {'Code': 'ConditionalCheckFailedException'}}, 'UpdateItem')
+        ]
+
+        result = dynamodb_service.save_country_attributes({'france': {'area': 551695.0}, 'atlantis': {'area': 1.0}})
+
+        assert result == 1
+        first = dynamodb_service.client.update_item.call_args_list[0].kwargs
+        assert first['Key'] == {'country': 'france'}
+        assert first['UpdateExpression'] == 'SET #attributes = :row, attributes_hash = :hash'
+        assert first['ConditionExpression'] == 'attribute_exists(country)'
+        assert first['ExpressionAttributeValues'] == {':row': {'area': Decimal('551695.0')},
+                                                      ':hash': content_hash({'area': 551695.0})}
+
+    def test_save_country_attributes_paces_writes(self, dynamodb_service):
+        dynamodb_service.client.update_item.return_value = {'ConsumedCapacity': {'CapacityUnits': 3}}
+
+        with patch('chalicelib.db_service.time.sleep') as mock_sleep:
+            dynamodb_service.save_country_attributes({'france': {'name': 'France'}}, max_write_capacity_per_second=5)
+
+        assert mock_sleep.call_args.args[0] == pytest.approx(0.6, abs=0.05)
+
+    def test_save_country_data_stores_attribute_row(self, dynamodb_service):
+        dynamodb_service.save_country_data("france", {"name": {"common": "France"}, "area": 551695.0})
+
+        item = dynamodb_service.client.put_item.call_args.kwargs['Item']
+        assert item['attributes'] == {'name': 'France', 'area': Decimal('551695.0')}
+        assert item['attributes_hash'] == content_hash({'name': 'France', 'area': 551695.0})
+
+    def test_delete_legacy_attributes_item(self, dynamodb_service):
+        dynamodb_service.delete_legacy_attributes_item()
+
+        dynamodb_service.client.delete_item.assert_called_once_with(
+            TableName=COUNTRY_TABLE, Key={'country': LEGACY_ATTRIBUTES_ITEM_KEY}
+        )
+
+    def test_get_country_data_with_fields_uses_projection(self, dynamodb_service):
+        dynamodb_service.client.get_item.return_value = {'Item': {'country': 'france', 'data': {'name': {'common': 'France'}}}}
+
+        result = dynamodb_service.get_country_data("france", [('capital',), ('name', 'common')])
+
+        assert result == {'name': {'common': 'France'}}
+        kwargs = dynamodb_service.client.get_item.call_args.kwargs
+        assert kwargs['ProjectionExpression'] == 'country, data_hash, data_blob, #data.#f0, #data.#f1.#f2'
+        assert kwargs['ExpressionAttributeNames'] == {'#data': 'data', '#f0': 'capital', '#f1': 'name', '#f2': 'common'}
+
+    def test_get_country_data_with_fields_none_present(self, dynamodb_service):
+        dynamodb_service.client.get_item.return_value = {'Item': {'country': 'france'}}
+
+        assert dynamodb_service.get_country_data("france", [('capital',)]) == {}
+
+    def test_batch_get_country_documents_with_fields(self, dynamodb_service):
+        dynamodb_service.client.batch_get_item.return_value = {'Responses': {
+            COUNTRY_TABLE: [{'country': 'france', 'data': {'capital': ['Paris']}}]
+        }}
+
+        result = dynamodb_service.batch_get_country_documents(["france"], [('capital',)])
+
+        assert result['france'][0] == {'capital': ['Paris']}
+        request = dynamodb_service.client.batch_get_item.call_args.kwargs['RequestItems'][COUNTRY_TABLE]
+        assert request['ProjectionExpression'] == 'country, data_hash, data_blob, #data.#f0'
+
+    def test_save_country_data_stores_compressed_document(self, dynamodb_service):
+        dynamodb_service.save_country_data("france", {"name": {"common": "France"}, "area": 551695.0})
+
+        item = dynamodb_service.client.put_item.call_args.kwargs['Item']
+        assert item['format_version'] == FORMAT_COMPRESSED
+        assert item['name'] == 'France'
+        assert decode_country_item(item) == {"name": {"common": "France"}, "area": 551695.0}
+
+    def test_get_country_data_reads_compressed_item(self, dynamodb_service):
+        item = encode_country_item('france', {'name': {'common': 'France'}, 'capital': ['Paris']}, FORMAT_COMPRESSED)
+        dynamodb_service.client.get_item.return_value = {'Item': item}
+
+        assert dynamodb_service.get_country_data("france") == {'name': {'common': 'France'}, 'capital': ['Paris']}
+        assert dynamodb_service.get_country_data("france", [('capital',)]) == {'capital': ['Paris']}
+
+    def test_migrate_country_items(self, dynamodb_service):
+        dynamodb_service.client.scan.side_effect = [
+            {'Items': [{'country': 'france', 'data': {'name': 'France'}}], 'LastEvaluatedKey': {'country': 'france'}},
+            {'Items': [{'country': 'peru', 'data': {'name': 'Peru', 'area': Decimal('1285216')}}]}
+        ]
+        dynamodb_service.client.batch_write_item.return_value = {}
+
+        result = dynamodb_service.migrate_country_items(FORMAT_COMPRESSED)
+
+        assert result == {'migrated': 2, 'format_version': FORMAT_COMPRESSED, 'dry_run': False}
+        assert dynamodb_service.client.batch_write_item.call_count == 2
+        written = dynamodb_service.client.batch_write_item.call_args.kwargs['RequestItems'][COUNTRY_TABLE]
+        assert decode_country_item(written[0]['PutRequest']['Item']) == {'name': 'Peru', 'area': 1285216}
+
+    def test_migrate_country_items_dry_run(self, dynamodb_service):
+        dynamodb_service.client.scan.return_value = {'Items': [{'country': 'france', 'data': {'name': 'France'}}]}
+
+        result = dynamodb_service.migrate_country_items(FORMAT_COMPRESSED, dry_run=True)
 
+        assert result['migrated'] == 1
+        dynamodb_service.client.batch_write_item.assert_not_called()
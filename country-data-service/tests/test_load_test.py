@@ -0,0 +1,236 @@
+import pytest
+from unittest.mock import Mock, patch
+from redis.exceptions import TimeoutError as RedisTimeoutError
+from benchmarks.load_test import LoadTest, best_of, compare, parse_args, percentile
+from benchmarks.stand_ins import Backend, LocalDynamoDB, LocalRedis, generate_catalog
+from chalicelib.db_service import DynamoDBService, COUNTRY_TABLE
+from chalicelib.rate_limiter import FIXED_WINDOW_SCRIPT, LEASE_SCRIPT
+from chalicelib.redis_cache import RELEASE_LOCK_SCRIPT
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestLocalRedis:
+    @pytest.fixture
+    def clock(self):
+        return FakeClock()
+
+    @pytest.fixture
+    def redis(self, clock):
+        return LocalRedis(Backend('redis'), clock=clock)
+
+    def test_set_nx_and_expiry(self, redis, clock):
+        assert redis.set('lock', 'a', nx=True, px=500)
+        assert redis.set('lock', 'b', nx=True) is None
+        assert redis.get('lock') == b'a'
+
+        clock.now += 1
+        assert redis.get('lock') is None
+        assert redis.exists('lock') == 0
+
+    def test_fixed_window_script_limits_and_resets(self, redis, clock):
+        script = redis.register_script(FIXED_WINDOW_SCRIPT)
+
+        assert [script(keys=['k'], args=[2, 60]) for _ in range(3)] == [0, 0, 1]
+        clock.now += 61
+        assert script(keys=['k'], args=[2, 60]) == 0
+
+    def test_lease_script_never_grants_past_limit(self, redis):
+        script = redis.register_script(LEASE_SCRIPT)
+
+        assert script(keys=['k'], args=[15, 60, 10]) == [10, 60000]
+        assert script(keys=['k'], args=[15, 60, 10]) == [5, 60000]
+        assert script(keys=['k'], args=[15, 60, 10])[0] == 0
+
+    def test_release_lock_script_only_releases_own_token(self, redis):
+        release = redis.register_script(RELEASE_LOCK_SCRIPT)
+        redis.set('lock', 'mine')
+
+        assert release(keys=['lock'], args=['theirs']) == 0
+        assert release(keys=['lock'], args=['mine']) == 1
+        assert redis.get('lock') is None
+
+    def test_unknown_script_is_rejected(self, redis):
+        with pytest.raises(NotImplementedError):
+            redis.register_script("return 1")
+
+    def test_injected_errors_raise_timeouts(self, clock):
+        redis = LocalRedis(Backend('redis', throttle_rate=1), clock=clock)
+
+        with pytest.raises(RedisTimeoutError):
+            redis.get('key')
+
+
+class TestLocalDynamoDB:
+    # The real DynamoDBService, serialized and parsed by boto3, over the in-process stand-in
+    @pytest.fixture
+    def backend(self):
+        return Backend('dynamodb')
+
+    @pytest.fixture
+    def dynamodb(self, backend):
+        return LocalDynamoDB(backend)
+
+    @pytest.fixture
+    def db_service(self, dynamodb):
+        return DynamoDBService(dynamodb.resource())
+
+    def test_claim_fetch_operation_has_one_winner(self, db_service):
+        assert db_service.claim_fetch_operation('france', 'https://example.com/a')[0]
+        claimed, state = db_service.claim_fetch_operation('france')
+
+        assert not claimed
+        assert state['status'] == 'PENDING'
+        assert 'callbacks' not in state
+        assert db_service.add_operation_callback('france', 'https://example.com/b') == (True, None)
+        assert db_service.finish_fetch_operation('france', 'COMPLETED') == ['https://example.com/a', 'https://example.com/b']
+        assert db_service.add_operation_callback('france', 'https://example.com/c')[1]['status'] == 'COMPLETED'
+        assert db_service.claim_fetch_operation('france')[0] == False
+
+    def test_seeded_documents_round_trip(self, dynamodb, db_service):
+        catalog = generate_catalog(3)
+        dynamodb.seed(catalog)
+        country, document = next(iter(catalog.items()))
+
+        assert db_service.get_country_data(country) == document
+        assert db_service.get_country_data(country, [('name', 'common')]) == {'name': {'common': document['name']['common']}}
+        assert db_service.get_country_alias(document['cca3'].lower()) == country
+        assert db_service.get_operation_status(country)['status'] == 'COMPLETED'
+        assert set(db_service.get_country_attributes()) == set(catalog)
+
+    def test_save_country_data_only_creates(self, db_service):
+        assert db_service.save_country_data('france', {'name': {'common': 'France'}})
+        assert not db_service.save_country_data('france', {'name': {'common': 'Changed'}})
+        assert db_service.get_country_data('france') == {'name': {'common': 'France'}}
+
+    def test_throttled_request_is_retried_by_the_sdk(self, backend, dynamodb, db_service):
+        dynamodb.seed(generate_catalog(1))
+        backend.is_throttled = Mock(side_effect=[True, True, False])
+
+        assert db_service.get_operation_status(next(iter(generate_catalog(1))))['status'] == 'COMPLETED'
+        assert backend.calls == 3
+
+    def test_throttled_batch_leaves_keys_unprocessed(self, backend, dynamodb, db_service):
+        catalog = generate_catalog(4)
+        dynamodb.seed(catalog)
+        backend.is_throttled = Mock(side_effect=[True, False])
+
+        with patch('chalicelib.db_service.time.sleep'):
+            found = db_service.batch_get_country_documents(list(catalog))
+
+        assert set(found) == set(catalog)
+        assert backend.calls == 2
+
+    def test_scan_is_paged(self, dynamodb, db_service):
+        dynamodb.seed(generate_catalog(5))
+        dynamodb.scan_page_bytes = 1
+
+        assert len(db_service.get_country_hashes()) == 5
+        assert dynamodb.backend.calls == 5
+
+    def test_attributes_index_holds_only_items_with_a_row_hash(self, dynamodb, db_service):
+        catalog = generate_catalog(3)
+        dynamodb.seed(catalog)
+        dynamodb.put(COUNTRY_TABLE, {'country': 'atlantis', 'attributes': {'name': 'Atlantis'}})
+        dynamodb.scan_page_bytes = 1
+
+        assert set(db_service.get_country_attributes()) == set(catalog)
+        assert dynamodb.backend.calls == 3
+
+
+def test_percentile_uses_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([7], 95) == 7
+
+
+def test_best_of_keeps_fastest_run_per_endpoint():
+    runs = [
+        {'config': {}, 'endpoints': {'a': {'p50_ms': 1, 'p95_ms': 9}, 'b': {'p50_ms': 2, 'p95_ms': 3}},
+         'worker': {'messages_per_second': 50}},
+        {'config': {}, 'endpoints': {'a': {'p50_ms': 2, 'p95_ms': 4}, 'b': {'p50_ms': 2, 'p95_ms': 5}},
+         'worker': {'messages_per_second': 80}}
+    ]
+
+    best = best_of(runs)
+
+    assert best['endpoints'] == {'a': {'p50_ms': 2, 'p95_ms': 4}, 'b': {'p50_ms': 2, 'p95_ms': 3}}
+    assert best['worker'] == {'messages_per_second': 80}
+
+
+class TestCompare:
+    @pytest.fixture
+    def baseline(self):
+        return {
+            'config': {'requests': 100},
+            'endpoints': {'country': {'p50_ms': 10.0, 'p95_ms': 20.0, 'errors': 0}},
+            'worker': {'messages': 50, 'p50_ms': 100.0, 'messages_per_second': 80.0, 'failed': 0}
+        }
+
+    def results(self, baseline, **changes):
+        endpoint = dict(baseline['endpoints']['country'], **changes.pop('endpoint', {}))
+        worker = dict(baseline['worker'], **changes.pop('worker', {}))
+        return {'config': baseline['config'], 'endpoints': {'country': endpoint}, 'worker': worker}
+
+    def test_unchanged_results_pass(self, baseline):
+        assert compare(self.results(baseline), baseline, 0.25, 1.0) == []
+
+    def test_slower_p95_is_a_regression(self, baseline):
+        regressions = compare(self.results(baseline, endpoint={'p95_ms': 30.0}), baseline, 0.25, 1.0)
+
+        assert regressions == ['country: p95 20.0 -> 30.0 ms']
+
+    def test_small_absolute_slowdown_is_ignored(self, baseline):
+        baseline['endpoints']['country'].update(p50_ms=0.2, p95_ms=0.4)
+        results = self.results(baseline, endpoint={'p50_ms': 0.4, 'p95_ms': 0.9})
+
+        assert compare(results, baseline, 0.25, 1.0) == []
+
+    def test_new_errors_and_lower_worker_throughput_are_regressions(self, baseline):
+        results = self.results(baseline, endpoint={'errors': 2}, worker={'messages_per_second': 40.0, 'failed': 1})
+
+        assert compare(results, baseline, 0.25, 1.0) == [
+            'country: errors 0 -> 2',
+            'worker: messages/sec 80.0 -> 40.0',
+            'worker: failed messages 0 -> 1'
+        ]
+
+    def test_different_config_is_not_compared(self, baseline):
+        results = self.results(baseline)
+        results['config'] = {'requests': 10}
+
+        assert len(compare(results, baseline, 0.25, 1.0)) == 1
+
+
+@pytest.fixture
+def restore_app():
+    # The load test rewires the app's singletons; put them back for the other tests
+    import app
+    saved = [(obj, dict(vars(obj))) for obj in (app.country_service, app.rate_limiter)]
+    yield
+    for obj, state in saved:
+        vars(obj).clear()
+        vars(obj).update(state)
+
+
+def test_load_test_runs_every_scenario_offline(restore_app):
+    args = parse_args(['--runs', '1', '--requests', '5', '--warmup', '1', '--countries', '20', '--worker-messages', '5',
+                       '--dynamodb-ms', '0', '--sqs-ms', '0', '--redis-ms', '0', '--upstream-ms', '0'])
+
+    results = LoadTest(args).run()
+
+    for name, endpoint in results['endpoints'].items():
+        assert endpoint['requests'] == 5, name
+        assert endpoint['errors'] == 0, name
+        assert endpoint['p50_ms'] <= endpoint['p95_ms'] <= endpoint['p99_ms']
+    assert results['endpoints']['country_not_modified']['statuses'] == {'304': 5}
+    assert results['worker']['messages'] == 5
+    assert results['worker']['failed'] == 0
+    assert results['backends']['upstream']['calls'] == 5
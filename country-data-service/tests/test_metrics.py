@@ -0,0 +1,89 @@
+import io
+import json
+import boto3
+import pytest
+from botocore.stub import Stubber
+from chalicelib.metrics import InvocationMetrics, instrument_client
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestInvocationMetrics:
+    @pytest.fixture
+    def clock(self):
+        return FakeClock()
+
+    @pytest.fixture
+    def recorder(self, clock):
+        return InvocationMetrics(namespace='Test', stream=io.StringIO(), clock=clock)
+
+    def test_flush_writes_one_emf_line(self, recorder):
+        recorder.reset('GET /country/{country}')
+        recorder.record('DynamoDB', 12.345, retries=1, throttled=True)
+        recorder.record('DynamoDB', 3.0, retries=0, throttled=False)
+        recorder.record('Redis', 1.5)
+
+        document = recorder.flush()
+
+        lines = recorder.stream.getvalue().splitlines()
+        assert len(lines) == 1
+        assert json.loads(lines[0]) == document
+        assert document['Endpoint'] == 'GET /country/{country}'
+        assert document['DynamoDBLatency'] == [12.35, 3.0]
+        assert document['DynamoDBRetries'] == 1
+        assert document['DynamoDBThrottles'] == 1
+        assert document['RedisErrors'] == 0
+        assert 'RedisRetries' not in document
+        directive = document['_aws']['CloudWatchMetrics'][0]
+        assert directive['Namespace'] == 'Test'
+        assert directive['Dimensions'] == [['Endpoint']]
+        assert {'Name': 'DynamoDBLatency', 'Unit': 'Milliseconds'} in directive['Metrics']
+
+    def test_flush_resets_and_skips_empty_invocations(self, recorder):
+        recorder.record('Redis', 1.0)
+        recorder.flush()
+
+        assert recorder.flush() is None
+        assert len(recorder.stream.getvalue().splitlines()) == 1
+
+    def test_timer_records_errors(self, recorder, clock):
+        with pytest.raises(ValueError):
+            with recorder.timer('Upstream'):
+                clock.now = 0.25
+                raise ValueError("boom")
+
+        assert recorder.latencies['Upstream'] == [250.0]
+        assert recorder.counts['UpstreamErrors'] == 1
+
+    def test_timer_outcome_reports_retries(self, recorder):
+        with recorder.timer('Upstream') as outcome:
+            outcome['retries'] = 2
+            outcome['throttled'] = True
+
+        assert recorder.counts == {'UpstreamRetries': 2, 'UpstreamThrottles': 1, 'UpstreamErrors': 0}
+
+    def test_disabled_metrics_write_nothing(self):
+        recorder = InvocationMetrics(enabled=False, stream=io.StringIO())
+        recorder.record('Redis', 1.0)
+
+        assert recorder.flush() is None
+        assert recorder.stream.getvalue() == ''
+
+    def test_instrument_client_times_api_calls(self, recorder):
+        client = boto3.client('sqs', region_name='us-east-1', aws_access_key_id='x', aws_secret_access_key='x')
+        instrument_client(client, 'SQS', recorder)
+        with Stubber(client) as stubber:
+            stubber.add_response('send_message', {'MessageId': '1', 'ResponseMetadata': {'RetryAttempts': 2}})
+            stubber.add_client_error('send_message', service_error_code='ThrottlingException')
+            client.send_message(QueueUrl='https://sqs.us-east-1.amazonaws.com/1/q', MessageBody='{}')
+            with pytest.raises(client.exceptions.ClientError):
+                client.send_message(QueueUrl='https://sqs.us-east-1.amazonaws.com/1/q', MessageBody='{}')
+
+        assert len(recorder.latencies['SQS']) == 2
+        assert recorder.counts == {'SQSRetries': 2, 'SQSThrottles': 1, 'SQSErrors': 1}
@@ -0,0 +1,77 @@
+import pytest
+from unittest.mock import Mock
+from redis.exceptions import RedisError
+from chalicelib.negative_cache import NegativeCache
+from chalicelib.circuit_breaker import CircuitBreaker, OPEN, CLOSED
+
+
+class TestNegativeCache:
+    @pytest.fixture
+    def redis_client(self):
+        client = Mock()
+        client.get.return_value = None
+        return client
+
+    @pytest.fixture
+    def negative_cache(self, redis_client):
+        return NegativeCache(redis_client, ttl_seconds=3600)
+
+    def test_add_writes_redis_record_with_expiry(self, negative_cache, redis_client):
+        negative_cache.add("frnace")
+
+        redis_client.set.assert_called_once_with("country-not-found-frnace", '1', ex=3600)
+        assert negative_cache.contains("frnace")
+        redis_client.get.assert_not_called()
+
+    def test_contains_reads_redis_once_per_container(self, negative_cache, redis_client):
+        redis_client.get.return_value = b'1'
+
+        assert negative_cache.contains("frnace")
+        assert negative_cache.contains("frnace")
+        assert redis_client.get.call_count == 1
+
+    def test_contains_misses(self, negative_cache, redis_client):
+        assert not negative_cache.contains("france")
+        redis_client.get.assert_called_once_with("country-not-found-france")
+
+    def test_invalidate_clears_both_tiers(self, negative_cache, redis_client):
+        negative_cache.add("frnace")
+
+        negative_cache.invalidate("frnace")
+
+        assert not negative_cache.contains("frnace")
+        redis_client.delete.assert_called_once_with("country-not-found-frnace")
+
+    def test_without_redis_is_local_only(self):
+        negative_cache = NegativeCache()
+
+        assert not negative_cache.contains("frnace")
+        negative_cache.add("frnace")
+        assert negative_cache.contains("frnace")
+
+    def test_redis_errors_degrade_to_a_miss(self, redis_client):
+        breaker = CircuitBreaker('redis', failure_threshold=1)
+        negative_cache = NegativeCache(redis_client, circuit_breaker=breaker)
+        redis_client.get.side_effect = RedisError("down")
+
+        assert not negative_cache.contains("frnace")
+        assert breaker.state == OPEN
+
+        # The open breaker skips Redis entirely
+        negative_cache.add("frnace")
+        redis_client.set.assert_not_called()
+
+    @pytest.mark.parametrize("error, expected_state", [(None, CLOSED), (RedisError("down"), OPEN)])
+    def test_invalidate_reports_the_half_open_probe(self, redis_client, error, expected_state):
+        now = [0]
+        breaker = CircuitBreaker('redis', failure_threshold=1, reset_timeout_seconds=30, clock=lambda: now[0])
+        breaker.record_failure()
+        now[0] = 31
+        negative_cache = NegativeCache(redis_client, circuit_breaker=breaker)
+        redis_client.delete.side_effect = error
+
+        # invalidate takes the probe, and its outcome must close or reopen the breaker
+        negative_cache.invalidate("frnace")
+
+        assert breaker.state == expected_state
+        assert not breaker.probe_in_flight
@@ -0,0 +1,70 @@
+import pytest
+from chalicelib.query_engine import CountryQueryEngine, extract_attributes
+
+
+class TestCountryQueryEngine:
+    @pytest.fixture
+    def engine(self):
+        return CountryQueryEngine({
+            'france': {'name': 'France', 'region': 'Europe', 'continents': ['Europe'], 'population': 68000000, 'area': 551695.0, 'landlocked': False},
+            'austria': {'name': 'Austria', 'region': 'Europe', 'continents': ['Europe'], 'population': 9000000, 'area': 83871.0, 'landlocked': True},
+            'brazil': {'name': 'Brazil', 'region': 'Americas', 'continents': ['South America'], 'population': 203000000, 'area': 8515767.0, 'landlocked': False},
+            'russia': {'name': 'Russia', 'region': 'Europe', 'continents': ['Europe', 'Asia'], 'population': 144000000, 'area': 17098242.0, 'landlocked': False},
+            'antarctica': {'name': 'Antarctica', 'region': 'Antarctic', 'continents': ['Antarctica'], 'area': 14000000.0}
+        })
+
+    def test_extract_attributes(self):
+        row = extract_attributes({'name': {'common': 'France', 'official': 'French Republic'}, 'cca2': 'FR',
+                                  'region': 'Europe', 'population': 68000000, 'flags': {'png': 'x'}})
+
+        assert row == {'name': 'France', 'cca2': 'FR', 'region': 'Europe', 'population': 68000000}
+
+    def test_query_defaults_to_name_order(self, engine):
+        result = engine.query()
+
+        assert result['total'] == 5
+        assert [row['country'] for row in result['results']] == ['antarctica', 'austria', 'brazil', 'france', 'russia']
+
+    def test_category_filter_is_case_insensitive(self, engine):
+        result = engine.query({'region': ['europe']})
+
+        assert [row['country'] for row in result['results']] == ['austria', 'france', 'russia']
+
+    def test_multi_valued_column_matches_any_value(self, engine):
+        result = engine.query({'continents': ['Asia', 'South America']})
+
+        assert [row['country'] for row in result['results']] == ['brazil', 'russia']
+
+    def test_boolean_filter(self, engine):
+        assert [row['country'] for row in engine.query({'landlocked': ['true']})['results']] == ['austria']
+
+    def test_range_filter_bounds_are_inclusive(self, engine):
+        result = engine.query(ranges={'population': (9000000, 68000000)})
+
+        assert [row['country'] for row in result['results']] == ['austria', 'france']
+
+    def test_filters_are_combined(self, engine):
+        result = engine.query({'region': ['Europe']}, {'area': (100000, None)})
+
+        assert [row['country'] for row in result['results']] == ['france', 'russia']
+
+    def test_sort_descending_puts_missing_values_last(self, engine):
+        result = engine.query(sort='population', descending=True)
+
+        assert [row['country'] for row in result['results']] == ['brazil', 'russia', 'france', 'austria', 'antarctica']
+
+    def test_pagination(self, engine):
+        result = engine.query(sort='area', offset=1, limit=2)
+
+        assert result['total'] == 5
+        assert [row['country'] for row in result['results']] == ['france', 'brazil']
+
+    def test_no_match(self, engine):
+        assert engine.query({'region': ['Oceania']}) == {'total': 0, 'offset': 0, 'limit': 25, 'results': []}
+
+    def test_upsert_refreshes_columns(self, engine):
+        engine.upsert({'peru': {'name': 'Peru', 'region': 'Americas', 'population': 34000000}})
+
+        result = engine.query({'region': ['Americas']}, sort='population')
+
+        assert [row['country'] for row in result['results']] == ['peru', 'brazil']
@@ -1,8 +1,11 @@
+import time
 import pytest
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import Mock, patch
 from chalice import NotFoundError
 from chalicelib.country_service import CountryService, CountryDataFetcher
 from chalicelib.db_service import DynamoDBService
+from chalicelib import queue_service as queue_service_module
 from chalicelib.queue_service import QueueService
 from chalicelib.rate_limiter import RateLimiter
 from botocore.exceptions import ClientError
@@ -12,10 +15,10 @@ from botocore.exceptions import ClientError
 class TestQueueService:
     @pytest.fixture
     def queue_service(self):
-        with patch('chalicelib.queue_service.boto3.client') as mock_client:
+        with patch('boto3.client') as mock_client:
             mock_client.return_value = Mock()
             service = QueueService("http://fake-queue-url")
-            service.sqs = mock_client.return_value
+            service._sqs = mock_client.return_value
             yield service
             
 
@@ -66,3 +69,44 @@ class TestQueueService:
         
         with pytest.raises(ClientError):
             queue_service.delete_message("receipt123")
+
+    def test_send_message_batch_groups_of_ten(self, queue_service):
+        queue_service.sqs.send_message_batch.return_value = {'Successful': [], 'Failed': []}
+
+        failed = queue_service.send_message_batch([{"country": f"country{i}"} for i in range(25)])
+
+        assert failed == []
+        assert queue_service.sqs.send_message_batch.call_count == 3
+        assert len(queue_service.sqs.send_message_batch.call_args_list[0].kwargs['Entries']) == 10
+
+    def test_send_message_batch_returns_failed_messages(self, queue_service):
+        queue_service.sqs.send_message_batch.return_value = {
+            'Successful': [{'Id': '0'}],
+            'Failed': [{'Id': '1', 'Message': 'Throttled'}]
+        }
+
+        failed = queue_service.send_message_batch([{"country": "france"}, {"country": "germany"}])
+
+        assert failed == [{"country": "germany"}]
+
+    def test_concurrent_first_use_creates_one_client(self):
+        def slow_client(*args, **kwargs):
+            time.sleep(0.05)
+            return Mock()
+
+        with patch.object(queue_service_module, 'sqs_client', None), \
+                patch('boto3.client', side_effect=slow_client) as mock_client:
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                clients = list(executor.map(lambda _: QueueService("http://fake-queue-url").sqs, range(4)))
+
+        assert mock_client.call_count == 1
+        assert all(client is clients[0] for client in clients)
+
+    def test_client_is_shared_across_queues(self):
+        with patch.object(queue_service_module, 'sqs_client', None), \
+                patch('boto3.client', return_value=Mock()) as mock_client:
+            fetch_queue = QueueService("https://sqs.us-east-1.amazonaws.com/123/fetch").sqs
+            callback_queue = QueueService("https://sqs.us-east-1.amazonaws.com/123/callbacks").sqs
+
+        mock_client.assert_called_once_with('sqs')
+        assert fetch_queue is callback_queue
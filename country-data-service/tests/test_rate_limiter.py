@@ -1,6 +1,8 @@
 import pytest
+from datetime import timedelta
 from unittest.mock import Mock, patch
 from chalicelib.rate_limiter import RateLimiter
+from chalicelib.circuit_breaker import CircuitBreaker, OPEN
 from botocore.exceptions import ClientError
 
 
@@ -9,28 +11,100 @@ class TestRateLimiter:
     def rate_limiter(self):
         mock_redis = Mock()
         mock_rate_limites = {'default': {'limit': 5, 'period': 60}}
-        with patch('chalicelib.rate_limiter.Redis'), patch('chalicelib.rate_limiter.boto3.client'):
-            return RateLimiter(mock_redis, mock_rate_limites)
-
-    def test_request_is_limited_first_request(self, rate_limiter):
-        rate_limiter.redis_client.get.return_value = None
-        
-        result = rate_limiter.request_is_limited("test_key", 5, 60)
-        
-        assert result == False
-        rate_limiter.redis_client.set.assert_called_once_with("test_key", 1, ex=60)
+        with patch('redis.Redis') as mock_redis_class:
+            mock_redis_class.return_value.register_script.side_effect = lambda script: Mock()
+            rate_limiter = RateLimiter(mock_redis, mock_rate_limites)
+            rate_limiter.connect()
+            rate_limiter.circuit_breaker = CircuitBreaker('redis', failure_threshold=2)
+            return rate_limiter
 
     def test_request_is_limited_under_limit(self, rate_limiter):
-        rate_limiter.redis_client.get.return_value = "3"
+        script = rate_limiter.scripts['fixed_window']
+        script.return_value = 0
         
         result = rate_limiter.request_is_limited("test_key", 5, 60)
         
         assert result == False
-        rate_limiter.redis_client.incr.assert_called_once_with("test_key")
+        script.assert_called_once_with(keys=["test_key"], args=[5, 60])
 
     def test_request_is_limited_over_limit(self, rate_limiter):
-        rate_limiter.redis_client.get.return_value = "5"
+        rate_limiter.scripts['fixed_window'].return_value = 1
         
         result = rate_limiter.request_is_limited("test_key", 5, 60)
         
         assert result == True
+
+    def test_request_is_limited_single_round_trip(self, rate_limiter):
+        rate_limiter.scripts['fixed_window'].return_value = 0
+
+        rate_limiter.request_is_limited("test_key", 5, 60)
+
+        rate_limiter.redis_client.get.assert_not_called()
+        rate_limiter.redis_client.set.assert_not_called()
+        rate_limiter.redis_client.incr.assert_not_called()
+
+    def test_request_is_limited_gcra(self, rate_limiter):
+        rate_limiter.scripts['gcra'].return_value = 1
+
+        result = rate_limiter.request_is_limited("test_key", 5, 60, algorithm='gcra')
+
+        assert result == True
+        rate_limiter.scripts['gcra'].assert_called_once_with(keys=["test_key"], args=[5, 60])
+        rate_limiter.scripts['fixed_window'].assert_not_called()
+
+    def test_request_is_limited_redis_error_fails_open(self, rate_limiter):
+        rate_limiter.scripts['fixed_window'].side_effect = Exception("Connection refused")
+
+        result = rate_limiter.request_is_limited("test_key", 5, 60)
+
+        assert result == False
+
+    def test_request_is_limited_leased_spends_tokens_locally(self, rate_limiter):
+        rate_limiter.lease_script = Mock(return_value=[3, 60000])
+
+        results = [rate_limiter.request_is_limited_leased("test_key", 5, 60, 3) for _ in range(3)]
+
+        assert results == [False, False, False]
+        rate_limiter.lease_script.assert_called_once_with(keys=["test_key"], args=[5, 60, 3])
+
+    def test_request_is_limited_leased_renews_exhausted_lease(self, rate_limiter):
+        rate_limiter.lease_script = Mock(side_effect=[[2, 60000], [0, 50000]])
+
+        results = [rate_limiter.request_is_limited_leased("test_key", 2, 60, 2) for _ in range(4)]
+
+        assert results == [False, False, True, True]
+        assert rate_limiter.lease_script.call_count == 2
+
+    def test_request_is_limited_leased_redis_error_fails_open(self, rate_limiter):
+        rate_limiter.lease_script = Mock(side_effect=Exception("Connection refused"))
+
+        result = rate_limiter.request_is_limited_leased("test_key", 5, 60, 3)
+
+        assert result == False
+
+    def test_request_is_limited_trips_circuit_breaker(self, rate_limiter):
+        script = rate_limiter.scripts['fixed_window']
+        script.side_effect = Exception("Timeout reading from socket")
+
+        results = [rate_limiter.request_is_limited("test_key", 5, 60) for _ in range(3)]
+
+        assert results == [False, False, False]
+        assert rate_limiter.circuit_breaker.state == OPEN
+        assert script.call_count == 2
+
+    def test_request_is_limited_unknown_algorithm_fails_open(self, rate_limiter):
+        result = rate_limiter.request_is_limited("test_key", 5, 60, algorithm='unknown')
+
+        assert result == False
+        assert rate_limiter.circuit_breaker.failures == 0
+
+    def test_redis_is_not_set_up_until_first_limited_request(self):
+        app = Mock()
+        app.current_request.context = {'identity': {'sourceIp': '1.2.3.4'}}
+        with patch('redis.Redis') as mock_redis_class:
+            rate_limiter = RateLimiter(app, {'handler': {'limit': 5, 'period': timedelta(minutes=1)}})
+            handler = rate_limiter.limit()(Mock(__name__='handler', return_value='ok'))
+            mock_redis_class.assert_not_called()
+
+            assert handler() == 'ok'
+            mock_redis_class.assert_called_once()
@@ -0,0 +1,73 @@
+import json
+import pytest
+from unittest.mock import Mock
+from redis.exceptions import RedisError
+from chalicelib.redis_cache import RedisCache
+from chalicelib.circuit_breaker import CircuitBreaker, OPEN
+
+
+class TestRedisCache:
+    @pytest.fixture
+    def redis_client(self):
+        return Mock()
+
+    @pytest.fixture
+    def redis_cache(self, redis_client):
+        return RedisCache(redis_client, 'country-data', ttl_seconds=60,
+                          wait_timeout_seconds=0.05, poll_interval_seconds=0.01)
+
+    def test_get_or_load_hit(self, redis_cache, redis_client):
+        redis_client.get.return_value = json.dumps({"name": "France"})
+        loader = Mock()
+
+        result = redis_cache.get_or_load("france", loader)
+
+        assert result == {"name": "France"}
+        loader.assert_not_called()
+        redis_client.get.assert_called_once_with("country-data-france")
+
+    def test_get_or_load_miss_acquires_lock_and_stores(self, redis_cache, redis_client):
+        redis_client.get.return_value = None
+        redis_client.set.return_value = True
+        loader = Mock(return_value={"name": "France"})
+
+        result = redis_cache.get_or_load("france", loader)
+
+        assert result == {"name": "France"}
+        loader.assert_called_once()
+        redis_client.set.assert_called_with("country-data-france", json.dumps({"name": "France"}), ex=60)
+        redis_cache.release_lock.assert_called_once()
+
+    def test_get_or_load_waits_for_in_flight_load(self, redis_cache, redis_client):
+        redis_client.get.side_effect = [None, None, json.dumps({"name": "France"})]
+        redis_client.set.return_value = None
+        redis_client.exists.return_value = 1
+        loader = Mock()
+
+        result = redis_cache.get_or_load("france", loader)
+
+        assert result == {"name": "France"}
+        loader.assert_not_called()
+
+    def test_get_or_load_falls_back_to_loader_on_redis_error(self, redis_cache, redis_client):
+        redis_client.get.side_effect = RedisError("Connection refused")
+        loader = Mock(return_value={"name": "France"})
+
+        result = redis_cache.get_or_load("france", loader)
+
+        assert result == {"name": "France"}
+        loader.assert_called_once()
+
+    def test_get_or_load_skips_redis_when_breaker_open(self, redis_client):
+        breaker = CircuitBreaker('redis', failure_threshold=1)
+        redis_cache = RedisCache(redis_client, 'country-data', circuit_breaker=breaker)
+        redis_client.get.side_effect = RedisError("Timeout reading from socket")
+        loader = Mock(return_value={"name": "France"})
+
+        redis_cache.get_or_load("france", loader)
+        result = redis_cache.get_or_load("france", loader)
+
+        assert result == {"name": "France"}
+        assert breaker.state == OPEN
+        assert redis_client.get.call_count == 1
+        assert loader.call_count == 2
@@ -0,0 +1,46 @@
+import pytest
+from chalicelib.search_index import CountrySearchIndex
+
+
+class TestCountrySearchIndex:
+    @pytest.fixture
+    def search_index(self):
+        return CountrySearchIndex({
+            'france': 'france',
+            'fr': 'france',
+            'french-republic': 'france',
+            'finland': 'finland',
+            'germany': 'germany',
+            'deutschland': 'germany',
+            'united-states': 'united-states',
+            'usa': 'united-states',
+            'united-kingdom': 'united-kingdom'
+        })
+
+    def test_prefix_search(self, search_index):
+        results = search_index.search('united')
+
+        assert [result['country'] for result in results] == ['united-states', 'united-kingdom']
+        assert all(result['score'] > 1 for result in results)
+
+    def test_fuzzy_search_tolerates_typos(self, search_index):
+        results = search_index.search('germny')
+
+        assert results[0]['country'] == 'germany'
+        assert results[0]['score'] < 1
+
+    def test_results_are_one_per_country(self, search_index):
+        results = search_index.search('fr')
+
+        assert [result['country'] for result in results].count('france') == 1
+
+    def test_search_matches_aliases(self, search_index):
+        results = search_index.search('deutsch')
+
+        assert results[0] == {'country': 'germany', 'match': 'deutschland', 'score': results[0]['score']}
+
+    def test_search_respects_limit(self, search_index):
+        assert len(search_index.search('f', limit=1)) == 1
+
+    def test_search_no_match(self, search_index):
+        assert search_index.search('zzzz') == []
@@ -1,8 +1,8 @@
 import json
+import threading
 import pytest
 from unittest.mock import Mock, patch
-from chalice import BadRequestError
-from app import handle_sqs_message
+from app import handle_sqs_message, deliver_callbacks
 
 @pytest.fixture
 def mock_country_service():
@@ -22,6 +22,7 @@ def create_sqs_event(messages):
     return {
         'Records': [
             {
+                'messageId': f'message{i}',
                 'body': message,
                 'receiptHandle': f'receipt{i}'
             }
@@ -33,8 +34,9 @@ def test_handle_sqs_message_success(mock_country_service, mock_logger, mock_cont
     event = create_sqs_event([{"country": "france"}, {"country": "germany"}])
     mock_country_service.fetch_and_save_country_data.return_value = True
 
-    handle_sqs_message(event, mock_context)
+    result = handle_sqs_message(event, mock_context)
 
+    assert result == {'batchItemFailures': []}
     assert mock_country_service.fetch_and_save_country_data.call_count == 2
     mock_logger.info.assert_any_call("Processing SQS message for country: france")
     mock_logger.info.assert_any_call("Successfully processed data for france")
@@ -43,42 +45,82 @@ def test_handle_sqs_message_success(mock_country_service, mock_logger, mock_cont
 
 def test_handle_sqs_message_partial_failure(mock_country_service, mock_logger, mock_context):
     event = create_sqs_event([{"country": "france"}, {"country": "germany"}])
-    mock_country_service.fetch_and_save_country_data.side_effect = [True, False]
+    mock_country_service.fetch_and_save_country_data.side_effect = lambda country: country == "france"
 
-    with pytest.raises(BadRequestError) as excinfo:
-        handle_sqs_message(event, mock_context)
+    result = handle_sqs_message(event, mock_context)
 
-    assert "Failed to process 1 messages" in str(excinfo.value)
-    mock_country_service.queue_service.delete_message.assert_called_once_with("receipt1")
-    mock_logger.error.assert_called_with("Failed to process data for germany")
+    assert result == {'batchItemFailures': [{'itemIdentifier': 'message2'}]}
+    mock_country_service.queue_service.delete_message.assert_not_called()
+    mock_logger.error.assert_any_call("Failed to process data for germany")
 
 def test_handle_sqs_message_json_decode_error(mock_country_service, mock_logger, mock_context):
     event = create_sqs_event(["invalid json"])
 
-    with pytest.raises(BadRequestError) as excinfo:
-        handle_sqs_message(event, mock_context)
+    result = handle_sqs_message(event, mock_context)
 
-    assert "Failed to process 1 messages" in str(excinfo.value)
-    assert "Invalid JSON" in str(excinfo.value)
-    mock_logger.error.assert_called_with("Invalid JSON in message: Expecting value: line 1 column 1 (char 0)")
+    assert result == {'batchItemFailures': [{'itemIdentifier': 'message1'}]}
+    mock_logger.error.assert_any_call("Invalid JSON in message: Expecting value: line 1 column 1 (char 0)")
 
 def test_handle_sqs_message_missing_key(mock_country_service, mock_logger, mock_context):
     event = create_sqs_event([{"not_country": "france"}])
 
-    with pytest.raises(BadRequestError) as excinfo:
-        handle_sqs_message(event, mock_context)
+    result = handle_sqs_message(event, mock_context)
 
-    assert "Failed to process 1 messages" in str(excinfo.value)
-    assert "Missing 'country' key in message" in str(excinfo.value)
-    mock_logger.error.assert_called_with("Missing 'country' key in message")
+    assert result == {'batchItemFailures': [{'itemIdentifier': 'message1'}]}
+    mock_logger.error.assert_any_call("Missing 'country' key in message")
 
 def test_handle_sqs_message_unexpected_error(mock_country_service, mock_logger, mock_context):
     event = create_sqs_event([{"country": "france"}])
     mock_country_service.fetch_and_save_country_data.side_effect = Exception("Unexpected error")
 
-    with pytest.raises(BadRequestError) as excinfo:
-        handle_sqs_message(event, mock_context)
+    result = handle_sqs_message(event, mock_context)
 
-    assert "Failed to process 1 messages" in str(excinfo.value)
-    assert "Unexpected error" in str(excinfo.value)
-    mock_logger.error.assert_called_with("Unexpected error processing message: Unexpected error")
\ No newline at end of file
+    assert result == {'batchItemFailures': [{'itemIdentifier': 'message1'}]}
+    mock_logger.error.assert_any_call("Unexpected error processing message: Unexpected error")
+
+def test_handle_sqs_message_prepares_dependencies_before_fan_out(mock_country_service, mock_logger, mock_context):
+    calls = []
+    mock_country_service.prepare_worker.side_effect = lambda: calls.append('prepare')
+    mock_country_service.fetch_and_save_country_data.side_effect = lambda country: calls.append(country) or True
+
+    handle_sqs_message(create_sqs_event([{"country": "france"}]), mock_context)
+
+    assert calls == ['prepare', 'france']
+
+def test_handle_sqs_message_processes_records_concurrently(mock_country_service, mock_logger, mock_context):
+    barrier = threading.Barrier(3, timeout=5)
+
+    def fetch_and_save(country):
+        # Only succeeds if all three records are being processed at the same time
+        barrier.wait()
+        return True
+
+    mock_country_service.fetch_and_save_country_data.side_effect = fetch_and_save
+    event = create_sqs_event([{"country": "france"}, {"country": "germany"}, {"country": "spain"}])
+
+    result = handle_sqs_message(event, mock_context)
+
+    assert result == {'batchItemFailures': []}
+
+def test_deliver_callbacks_reports_failed_deliveries(mock_logger, mock_context):
+    messages = [
+        {"url": "https://a.example/hook", "country": "france", "status": "COMPLETED", "timestamp": 1},
+        {"url": "https://b.example/hook", "country": "germany", "status": "FAILED", "timestamp": 1}
+    ]
+    event = create_sqs_event([json.dumps(message) for message in messages])
+
+    with patch('app.callback_delivery') as mock_delivery:
+        mock_delivery.deliver.side_effect = lambda message: message['country'] == "france"
+        result = deliver_callbacks(event, mock_context)
+
+    assert result == {'batchItemFailures': [{'itemIdentifier': 'message2'}]}
+
+def test_deliver_callbacks_drops_invalid_messages(mock_logger, mock_context):
+    event = create_sqs_event(["invalid json", json.dumps({"country": "france"})])
+
+    with patch('app.callback_delivery') as mock_delivery:
+        mock_delivery.deliver.side_effect = KeyError('url')
+        result = deliver_callbacks(event, mock_context)
+
+    # Redelivery cannot fix a malformed message
+    assert result == {'batchItemFailures': []}
@@ -0,0 +1,83 @@
+import json
+import pytest
+from unittest.mock import Mock, patch
+from redis.exceptions import RedisError
+from chalicelib.status_notifier import StatusNotifier
+from chalicelib.circuit_breaker import CircuitBreaker, OPEN
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TestStatusNotifier:
+    @pytest.fixture
+    def redis_client(self):
+        return Mock()
+
+    @pytest.fixture
+    def clock(self):
+        return FakeClock()
+
+    @pytest.fixture
+    def notifier(self, redis_client, clock):
+        return StatusNotifier(redis_client, ttl_seconds=60, poll_interval_seconds=0.5, clock=clock, sleep=clock.sleep)
+
+    def signal(self, status, timestamp):
+        return json.dumps({'status': status, 'timestamp': timestamp})
+
+    def test_publish_sets_signal_with_expiry(self, notifier, redis_client):
+        with patch('chalicelib.status_notifier.time.time', return_value=1700000000):
+            notifier.publish("france", "COMPLETED")
+
+        redis_client.set.assert_called_once_with(
+            "operation-status-france", self.signal("COMPLETED", 1700000000000), ex=60
+        )
+
+    def test_publish_swallows_redis_errors(self, notifier, redis_client):
+        redis_client.set.side_effect = RedisError("down")
+
+        notifier.publish("france", "COMPLETED")
+
+    def test_wait_returns_when_signal_arrives(self, notifier, redis_client, clock):
+        redis_client.get.side_effect = [None, None, self.signal("COMPLETED", 200)]
+
+        result = notifier.wait("france", 100, timeout_seconds=10)
+
+        assert result == {'status': 'COMPLETED', 'timestamp': 200}
+        assert clock.now == 1.0
+        redis_client.get.assert_called_with("operation-status-france")
+
+    def test_wait_ignores_signals_older_than_the_claim(self, notifier, redis_client, clock):
+        redis_client.get.return_value = self.signal("FAILED", 50)
+
+        result = notifier.wait("france", 100, timeout_seconds=2)
+
+        assert result is None
+        assert clock.now == 2.0
+        assert redis_client.get.call_count == 5
+
+    def test_wait_ignores_pending_signals(self, notifier, redis_client):
+        redis_client.get.return_value = self.signal("PENDING", 200)
+
+        assert notifier.wait("france", 100, timeout_seconds=1) is None
+
+    def test_wait_gives_up_on_redis_errors(self, redis_client, clock):
+        breaker = CircuitBreaker('redis', failure_threshold=1)
+        notifier = StatusNotifier(redis_client, circuit_breaker=breaker, clock=clock, sleep=clock.sleep)
+        redis_client.get.side_effect = RedisError("down")
+
+        assert notifier.wait("france", 100, timeout_seconds=10) is None
+        assert breaker.state == OPEN
+        assert clock.now == 0
+
+        # The open breaker skips Redis entirely
+        assert notifier.wait("france", 100, timeout_seconds=10) is None
+        assert redis_client.get.call_count == 1
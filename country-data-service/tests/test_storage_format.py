@@ -0,0 +1,57 @@
+from decimal import Decimal
+from boto3.dynamodb.types import Binary
+from chalicelib.storage_format import encode_country_item, decode_country_item, FORMAT_MAP, FORMAT_COMPRESSED
+from chalicelib.utils import content_hash, canonical_json
+
+
+class TestStorageFormat:
+    document = {
+        'name': {'common': 'France', 'official': 'French Republic'},
+        'cca2': 'FR',
+        'cca3': 'FRA',
+        'region': 'Europe',
+        'latlng': [46.0, 2.0],
+        'population': 67391582
+    }
+
+    def test_encode_compressed_item(self):
+        item = encode_country_item('france', self.document, FORMAT_COMPRESSED)
+
+        assert item['format_version'] == FORMAT_COMPRESSED
+        assert item['data_hash'] == content_hash(self.document)
+        assert {key: item[key] for key in ('name', 'cca2', 'cca3', 'region')} == {
+            'name': 'France', 'cca2': 'FR', 'cca3': 'FRA', 'region': 'Europe'
+        }
+        assert 'data' not in item
+        assert isinstance(item['data_blob'], bytes)
+
+    def test_compressed_round_trip_as_returned_by_dynamodb(self):
+        item = encode_country_item('france', self.document, FORMAT_COMPRESSED)
+        item['data_blob'] = Binary(item['data_blob'])
+
+        assert decode_country_item(item) == self.document
+
+    def test_compressed_item_is_projected_after_decoding(self):
+        item = encode_country_item('france', self.document, FORMAT_COMPRESSED)
+
+        assert decode_country_item(item, [('name', 'common'), ('population',)]) == {
+            'name': {'common': 'France'}, 'population': 67391582
+        }
+
+    def test_map_round_trip(self):
+        item = encode_country_item('france', self.document, FORMAT_MAP)
+
+        assert item['data']['latlng'] == [Decimal('46.0'), Decimal('2.0')]
+        assert 'format_version' not in item
+        assert decode_country_item(item) == self.document
+
+    def test_compressed_item_is_smaller(self):
+        document = dict(self.document, translations={f'l{i}': {'common': 'France', 'official': 'République française'} for i in range(30)})
+
+        item = encode_country_item('france', document, FORMAT_COMPRESSED)
+
+        assert len(item['data_blob']) * 3 < len(canonical_json(document))
+
+    def test_decode_item_without_document(self):
+        assert decode_country_item({'country': 'france'}) is None
+        assert decode_country_item({'country': 'france'}, [('capital',)]) == {}
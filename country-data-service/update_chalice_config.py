@@ -8,6 +8,7 @@ def update_chalice_config():
 
     config['stages']['dev']['iam_role_arn'] = os.environ['IAM_ROLE_ARN']
     config['stages']['dev']['environment_variables']['SQS_QUEUE_URL'] = os.environ['SQS_QUEUE_URL']
+    config['stages']['dev']['environment_variables']['CALLBACK_QUEUE_URL'] = os.environ['CALLBACK_QUEUE_URL']
     config['stages']['dev']['environment_variables']['REDIS_HOST'] = os.environ['REDIS_HOST']
     config['stages']['dev']['environment_variables']['REDIS_PORT'] = os.environ['REDIS_PORT']
     config['stages']['dev']['subnet_ids'] = os.environ['SUBNET_IDS'].split(',')